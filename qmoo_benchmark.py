@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Performance benchmarks of the generators, the single-vector and batched evaluation and the full enumeration.
+# Results are written as JSON together with the environment, and two result files can be compared for slowdowns:
+#
+#   python qmoo_benchmark.py run --output bench_new.json
+#   python qmoo_benchmark.py compare bench_old.json bench_new.json --tolerance 0.2
+
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+import qmoo_benchmark_functions as prob
+import qmoo_pipeline as pipeline
+
+
+## qudit configurations of example_generate_problem_instances.py and larger ones
+QUDITS_CONFIGS = pipeline.QUDITS_CONFIGS
+LARGE_QUDITS_CONFIGS = [
+    [2]*18,
+    [3]*11,
+    [4]*9,
+]
+## generator-only sizes, beyond enumeration
+GENERATOR_QUDITS_CONFIGS = [
+    [2]*200,
+    [2]*2000,
+]
+
+
+def environment_metadata():
+    """
+    python, numpy and machine information and the git commit of the package (if available)
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'git_commit': commit,
+    }
+
+
+def time_call(func, repeats=5, number=1):
+    """
+    runs func number times per repeat and returns min and median of the time per call in seconds
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {'min': min(times), 'median': float(np.median(times)), 'repeats': repeats, 'number': number}
+
+
+def _config_name(qudits: list):
+    if len(set(qudits)) == 1:
+        return f'{qudits[0]}x{len(qudits)}'
+    return ','.join(str(q) for q in qudits)
+
+
+def run_benchmarks(qudits_configs=QUDITS_CONFIGS, large_qudits_configs=LARGE_QUDITS_CONFIGS, generator_qudits_configs=GENERATOR_QUDITS_CONFIGS,
+                   problem_names=None, repeats=5, num_samples=10000, seed=0, log=print):
+    """
+    times every registered problem on every qudit configuration, returns the list of result records
+    generate: problem generation, evaluate_single: one objective partial per call, evaluate_batched: (num_samples,n) batch,
+    enumerate: enumerate_all_states; the times are per call, records with evaluations also hold the throughput in evaluations per second
+    generator_qudits_configs are only used for the generation
+    """
+    problem_names = list(prob.PROBLEM_REGISTRY) if problem_names is None else problem_names
+    rng = np.random.RandomState(seed)
+    results = []
+
+    def _record(group, problem_name, qudits, timing, **extra):
+        record = {'name': f'{group}/{problem_name}/{_config_name(qudits)}', 'group': group, 'problem_name': problem_name,
+                  'qudits': [int(q) for q in qudits], **timing, **extra}
+        if 'evaluations' in record:
+            record['throughput'] = record['evaluations'] / record['median']
+        results.append(record)
+        log(f'{record["name"]:70s} {record["median"]:.3e} s')
+
+    for problem_name in problem_names:
+        generator = prob.PROBLEM_REGISTRY[problem_name]['generator']
+        for qudits in list(qudits_configs) + list(large_qudits_configs) + list(generator_qudits_configs):
+            q = np.asarray(qudits)
+            _record('generate', problem_name, qudits, time_call(lambda: generator(q, seed, rng=np.random.RandomState(seed)), repeats))
+            if qudits in generator_qudits_configs:
+                continue
+            cost_coefficients = generator(q, seed, rng=np.random.RandomState(seed))
+            instance = prob.ProblemInstance(problem_name, q, seed)
+            X = rng.randint(0, q, size=(num_samples, len(q)))
+            objective = instance.objective_functions[0]
+            single_number = min(num_samples, 1000)
+            _record('evaluate_single', problem_name, qudits,
+                    time_call(lambda: [objective(x) for x in X[:single_number]], repeats), evaluations=single_number)
+            _record('evaluate_batched', problem_name, qudits,
+                    time_call(lambda: prob.calculate_cost_functions_batched(X, cost_coefficients), repeats), evaluations=num_samples)
+            num_states = int(np.prod(q))
+            _record('enumerate', problem_name, qudits,
+                    time_call(lambda: prob.enumerate_all_states(cost_coefficients, q, include_configs=False), max(1, repeats // 2)),
+                    evaluations=num_states)
+    return results
+
+
+def write_results(filename: str, results: list, metadata=None):
+    with open(filename, 'w') as f:
+        json.dump({'metadata': environment_metadata() if metadata is None else metadata, 'results': results}, f, indent=1)
+
+
+def read_results(filename: str):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def compare_results(old: dict, new: dict, tolerance=0.2, statistic='median'):
+    """
+    compares two result files (as read by read_results) benchmark by benchmark
+    returns a list of (name, old time, new time, ratio new/old, slowdown flag) for all benchmarks in both files;
+    a benchmark is flagged if its time grew by more than the relative tolerance
+    """
+    old_times = {r['name']: r[statistic] for r in old['results']}
+    comparison = []
+    for r in new['results']:
+        if r['name'] in old_times:
+            ratio = r[statistic] / old_times[r['name']] if old_times[r['name']] > 0. else np.inf
+            comparison.append((r['name'], old_times[r['name']], r[statistic], ratio, ratio > 1. + tolerance))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='performance benchmarks of the QMOO benchmark functions')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='run the benchmarks and write the results as JSON')
+    run_parser.add_argument('--output', default='benchmark_results.json')
+    run_parser.add_argument('--problems', nargs='+', default=None, help='problem names (default: all registered problems)')
+    run_parser.add_argument('--repeats', type=int, default=5)
+    run_parser.add_argument('--samples', type=int, default=10000, help='batch size of the batched evaluation')
+    run_parser.add_argument('--no-large', action='store_true', help='only the qudit configurations of the example')
+    compare_parser = subparsers.add_parser('compare', help='compare two result files and flag slowdowns')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--tolerance', type=float, default=0.2, help='relative slowdown which is flagged (default: 0.2)')
+    compare_parser.add_argument('--statistic', choices=['min', 'median'], default='median')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        large = [] if args.no_large else LARGE_QUDITS_CONFIGS
+        generator_only = [] if args.no_large else GENERATOR_QUDITS_CONFIGS
+        results = run_benchmarks(QUDITS_CONFIGS, large, generator_only, args.problems, args.repeats, args.samples)
+        write_results(args.output, results)
+        return 0
+
+    comparison = compare_results(read_results(args.old), read_results(args.new), args.tolerance, args.statistic)
+    slowdowns = 0
+    for name, old_time, new_time, ratio, slower in comparison:
+        slowdowns += int(slower)
+        print(f'{name:70s} {old_time:.3e} {new_time:.3e} {ratio:6.2f}{"  SLOWER" if slower else ""}')
+    print(f'{slowdowns} of {len(comparison)} benchmarks slower by more than {100 * args.tolerance:.0f}%')
+    return 1 if slowdowns > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
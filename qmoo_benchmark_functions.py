@@ -12,13 +12,41 @@
 # Sebastian Schmitt, 2024
 
 
+import collections
+import functools
+import threading
+import time
 import numpy as np
 import sys
 
+# active qmoo_instrumentation.Instrumentation (None: instrumentation off), see set_instrumentation
+_instrumentation = None
 
-def getCorrelatedRand( x , corr : float, scale: float =1.0):
+
+def set_instrumentation(instrumentation):
+    """
+    makes instrumentation the active one (None switches it off) and returns the previous one, see qmoo_instrumentation.instrumented
+    """
+    global _instrumentation
+    previous, _instrumentation = _instrumentation, instrumentation
+    return previous
+
+
+def get_instrumentation():
+    return _instrumentation
+
+
+def instrumentation_key(problem_name: str, qudits_list: np.array, seed: int):
+    """
+    key of an instance in the evaluation counts, e.g. problem_FM_AFM_two_objs/2_2_2_2/7
+    """
+    return f'{problem_name}/{"_".join(str(int(q)) for q in qudits_list)}/{int(seed)}'
+
+
+def getCorrelatedRand( x , corr : float, scale: float =1.0, rng=None):
     """
     Helper function which adds a random vector with entries drawn from a uniform distribution in the interval [-1,1] to a given vector with specified relative contribution.
+    The random vector is drawn from rng (np.random.RandomState or np.random.Generator) if given, otherwise from the global legacy RNG.
     """
     if type(x) == float :
         sz = 1
@@ -30,7 +58,8 @@ def getCorrelatedRand( x , corr : float, scale: float =1.0):
     if np.fabs(corr)>1 :
         print (f"WARNING parameter corr has larger absolute value than 1: corr={corr}!")
         sys.exit(8)
-    return np.array(corr * x + (1.-np.fabs(corr)) * scale* np.random.uniform(-1.,1. ,sz))
+    rand = np.random if rng is None else rng
+    return np.array(corr * x + (1.-np.fabs(corr)) * scale* rand.uniform(-1.,1. ,sz))
      
 
 
@@ -48,10 +77,592 @@ def calculate_cost_function_quadratic(x: np.array, J, c, m):
     calculates one quadratic cost function from give interaction matrix J_ij, lienar cost coefficient c_i, and constant offset m
     These problem specs a generated by functuions below (e.g., generate_problem_ferromagnetic_antiferromagnetic_two_objectives)
     """
-    f = np.dot(x, c + np.dot(J, x)) + m
+    f = np.dot(x, c + _coupling_dot(J, x)) + m
     return f
 
 
+def _float_array(a):
+    """
+    a as array, float64 unless it already has a floating point dtype (e.g. float32 coefficients)
+    """
+    a = np.asarray(a)
+    if not np.issubdtype(a.dtype, np.floating):
+        a = a.astype(np.float64)
+    return a
+
+
+class RingCouplingMatrix:
+    """
+    symmetric nearest-neighbour coupling matrix on a ring of n qudits stored by its n ring weights:
+    J = 0.5*(R + R^T) with R[d,(d+1)%n] = weights[d] and all other entries of R zero
+    products with J and the quadratic form cost O(n) instead of O(n^2)
+    """
+    def __init__(self, weights: np.array):
+        self.weights = _float_array(weights)
+
+    @property
+    def shape(self):
+        return (len(self.weights), len(self.weights))
+
+    def __truediv__(self, scale):
+        return RingCouplingMatrix(self.weights / scale)
+
+    def astype(self, dtype):
+        return RingCouplingMatrix(self.weights.astype(dtype))
+
+    def dot(self, x):
+        """
+        matrix-vector product J x, further axes of x after the first are treated as a batch
+        """
+        x = np.asarray(x, dtype=self.weights.dtype)
+        w = self.weights.reshape((-1,) + (1,) * (x.ndim - 1))
+        return 0.5 * (w * np.roll(x, -1, axis=0) + np.roll(w * x, 1, axis=0))
+
+    def quadratic_form(self, X):
+        """
+        x.(J x) for each row x of the (B,n) array X
+        """
+        X = np.asarray(X, dtype=self.weights.dtype)
+        return np.dot(X * np.roll(X, -1, axis=-1), self.weights)
+
+    def diagonal(self):
+        d = np.zeros(len(self.weights), dtype=self.weights.dtype)
+        if len(self.weights) == 1:
+            d[0] = self.weights[0]
+        return d
+
+    def toarray(self):
+        dimq = len(self.weights)
+        rows = np.arange(dimq)
+        cols = (rows + 1) % dimq
+        # 0.5*(R + R^T) built in a single dense array
+        J = np.zeros((dimq, dimq), dtype=self.weights.dtype)
+        J[rows, cols] = self.weights
+        J[cols, rows] += self.weights
+        J *= 0.5
+        return J
+
+
+class DiagonalCouplingMatrix:
+    """
+    diagonal coupling matrix J = diag(diagonal) stored by its n diagonal entries
+    """
+    def __init__(self, diagonal: np.array):
+        self._diagonal = _float_array(diagonal)
+
+    @property
+    def shape(self):
+        return (len(self._diagonal), len(self._diagonal))
+
+    def __truediv__(self, scale):
+        return DiagonalCouplingMatrix(self._diagonal / scale)
+
+    def astype(self, dtype):
+        return DiagonalCouplingMatrix(self._diagonal.astype(dtype))
+
+    def dot(self, x):
+        """
+        matrix-vector product J x, further axes of x after the first are treated as a batch
+        """
+        x = np.asarray(x, dtype=self._diagonal.dtype)
+        return self._diagonal.reshape((-1,) + (1,) * (x.ndim - 1)) * x
+
+    def quadratic_form(self, X):
+        """
+        x.(J x) for each row x of the (B,n) array X
+        """
+        X = np.asarray(X, dtype=self._diagonal.dtype)
+        return np.dot(X * X, self._diagonal)
+
+    def diagonal(self):
+        return self._diagonal.copy()
+
+    def toarray(self):
+        return np.diag(self._diagonal)
+
+
+def _is_structured(J):
+    return isinstance(J, (RingCouplingMatrix, DiagonalCouplingMatrix))
+
+
+def _coupling_dot(J, x):
+    """
+    J x for dense as well as structured coupling matrices
+    """
+    if _is_structured(J):
+        return J.dot(x)
+    return np.dot(J, x)
+
+
+def dense_cost_coefficients(cost_coefficients: list):
+    """
+    returns a copy of the coefficient list in which all structured coupling matrices (RingCouplingMatrix, DiagonalCouplingMatrix) are replaced by dense arrays
+    """
+    return [ [cc[0].toarray()] + list(cc[1:]) if len(cc) == 3 and _is_structured(cc[0]) else list(cc) for cc in cost_coefficients ]
+
+
+def coefficient_dtype(cost_coefficients: list):
+    """
+    floating point type of the coefficients: float32 if all linear coefficient vectors are float32 (see cast_cost_coefficients), float64 otherwise
+    """
+    return np.result_type(*[_float_array(cc[-2]).dtype for cc in cost_coefficients])
+
+
+def cast_cost_coefficients(cost_coefficients: list, dtype):
+    """
+    returns a copy of the coefficient list with all arrays, structured couplings and offsets converted to dtype, e.g. np.float32
+    the evaluation and enumeration routines then compute in that precision (see reduced_precision_error_bound)
+    """
+    dtype = np.dtype(dtype)
+    return [ [a.astype(dtype) if (isinstance(a, np.ndarray) or _is_structured(a)) else dtype.type(a) for a in cc] for cc in cost_coefficients ]
+
+
+def _abs_coupling(J):
+    if isinstance(J, RingCouplingMatrix):
+        return RingCouplingMatrix(np.abs(J.weights))
+    if isinstance(J, DiagonalCouplingMatrix):
+        return DiagonalCouplingMatrix(np.abs(J.diagonal()))
+    return np.abs(np.asarray(J, dtype=np.float64))
+
+
+def reduced_precision_error_bound(cost_coefficients: list, qudits_list: np.array, dtype=np.float32):
+    """
+    a priori bound on the absolute difference between the objectives evaluated with coefficients cast to dtype (cast_cost_coefficients)
+    and the float64 evaluation, valid for every configuration; returns one bound per objective
+    with unit roundoff u and gamma_k = k u / (1 - k u), rounding the coefficients and the dot products of length n give
+        |f_dtype(x) - f(x)| <= (gamma_{2n+3}(dtype) + gamma_{2n+3}(float64)) * (|m| + sum_i |c_i| (d_i-1) + sum_ij |J_ij| (d_i-1)(d_j-1))
+    """
+    x_max = np.asarray(qudits_list, dtype=np.float64) - 1.
+    k = 2 * len(x_max) + 3
+    gamma = 0.
+    for t in (dtype, np.float64):
+        u = 0.5 * np.finfo(t).eps
+        gamma += k * u / (1. - k * u)
+    bounds = np.empty(len(cost_coefficients))
+    for i, cc in enumerate(cost_coefficients):
+        scale = abs(float(cc[-1])) + np.dot(np.abs(np.asarray(cc[-2], dtype=np.float64)), x_max)
+        if len(cc) == 3:
+            J = _abs_coupling(cc[0])
+            scale += float(J.quadratic_form(x_max[np.newaxis, :])[0]) if _is_structured(J) else float(x_max @ J @ x_max)
+        bounds[i] = gamma * scale
+    return bounds
+
+
+def _symmetrize_inplace(J: np.array, block_size=256):
+    """
+    J <- 0.5*(J + J^T) in place, block row by block row, so only O(block_size*n) temporaries are needed
+    """
+    dimq = len(J)
+    for start in range(0, dimq, block_size):
+        stop = min(start + block_size, dimq)
+        diagonal_block = J[start:stop, start:stop]
+        diagonal_block[...] = 0.5 * (diagonal_block + diagonal_block.T)
+        upper = 0.5 * (J[start:stop, stop:] + J[stop:, start:stop].T)
+        J[start:stop, stop:] = upper
+        J[stop:, start:stop] = upper.T
+    return J
+
+
+def _default_chunk_size(num_objs: int, num_params: int, max_elements: int = 2**22):
+    """
+    number of configurations per chunk such that the (K, chunk, n) temporaries of the batched kernels hold at most max_elements floats
+    """
+    return max(1, max_elements // max(1, num_objs * num_params))
+
+
+def _stacked_base(arrays: list):
+    """
+    the (K,...) array whose sub-arrays 0..K-1 are exactly the given arrays (e.g. views into one memory-mapped or shared-memory block),
+    None if there is no such array, so the coefficients can be used in stacked form without a copy
+    """
+    base = getattr(arrays[0], 'base', None)
+    if not isinstance(base, np.ndarray) or base.shape != (len(arrays),) + arrays[0].shape:
+        return None
+    start = base.__array_interface__['data'][0]
+    for k, a in enumerate(arrays):
+        if not isinstance(a, np.ndarray) or a.base is not base or a.dtype != base.dtype or a.strides != base.strides[1:] \
+                or a.__array_interface__['data'][0] != start + k * base.strides[0]:
+            return None
+    return base
+
+
+def stack_cost_coefficients(cost_coefficients: list):
+    """
+    stacks the coefficient sets of all K objectives as returned by one of the generate_problem_* functions
+    linear objectives are given as [c, m], quadratic objectives as [J, c, m]
+    returns (J, c, m) with J of shape (K,n,n) (None if all objectives are linear), c of shape (K,n) and m of shape (K,)
+    structured coupling matrices are expanded to dense ones
+    coefficients which are already views into one stacked array (see qmoo_instance_cache) are returned without a copy
+    """
+    num_objs = len(cost_coefficients)
+    dtype = coefficient_dtype(cost_coefficients)
+    c = _stacked_base([cc[-2] for cc in cost_coefficients])
+    if c is None or c.dtype != dtype:
+        c = np.asarray([np.asarray(cc[-2], dtype=dtype) for cc in cost_coefficients])
+    m = np.asarray([cc[-1] for cc in cost_coefficients], dtype=dtype)
+    if all(len(cc) == 2 for cc in cost_coefficients):
+        return None, c, m
+    if all(len(cc) == 3 for cc in cost_coefficients):
+        J = _stacked_base([cc[0] for cc in cost_coefficients])
+        if J is not None and J.dtype == dtype:
+            return J, c, m
+    num_params = c.shape[1]
+    J = np.zeros((num_objs, num_params, num_params), dtype=dtype)
+    for k, cc in enumerate(dense_cost_coefficients(cost_coefficients)):
+        if len(cc) == 3:
+            J[k] = cc[0]
+    return J, c, m
+
+
+def _prepare_cost_coefficients(cost_coefficients: list):
+    """
+    brings the coefficients into the form used by the batched kernel: (J, c, m, couplings)
+    dense problems are stacked into J of shape (K,n,n) and couplings is None,
+    problems with structured couplings keep them per objective (J is None, couplings[k] is None for linear objectives)
+    """
+    if any(len(cc) == 3 and _is_structured(cc[0]) for cc in cost_coefficients):
+        dtype = coefficient_dtype(cost_coefficients)
+        c = np.asarray([np.asarray(cc[-2], dtype=dtype) for cc in cost_coefficients])
+        m = np.asarray([cc[-1] for cc in cost_coefficients], dtype=dtype)
+        return None, c, m, [cc[0] if len(cc) == 3 else None for cc in cost_coefficients]
+    J, c, m = stack_cost_coefficients(cost_coefficients)
+    return J, c, m, None
+
+
+def _evaluate_prepared(X: np.array, prepared: tuple, chunk_size=None, out=None, instance_key=None, instrumented=True):
+    """
+    batched kernel on coefficients from _prepare_cost_coefficients
+    an active instrumentation counts the evaluations under instance_key and adds the time to the evaluate stage
+    (not with instrumented=False, for partial evaluations which the caller counts itself)
+    """
+    instrumentation = _instrumentation if instrumented else None
+    if instrumentation is not None:
+        start_time = time.perf_counter()
+    X = np.asarray(X)
+    if X.ndim == 1:
+        X = X[np.newaxis, :]
+    J, c, m, couplings = prepared
+    num_configs, num_params = X.shape
+    num_objs = len(m)
+    if chunk_size is None:
+        chunk_size = _default_chunk_size(num_objs, num_params)
+    if out is None:
+        out = np.empty((num_configs, num_objs), dtype=c.dtype)
+
+    for start in range(0, num_configs, chunk_size):
+        stop = min(start + chunk_size, num_configs)
+        # the configurations are converted to the coefficient dtype, so float32 coefficients are evaluated in float32 throughout
+        Xc = np.asarray(X[start:stop], dtype=c.dtype)
+        f = np.dot(Xc, c.T) + m
+        if J is not None:
+            # x.(J x) for all objectives and configurations of the chunk: (K,B,n) * (B,n) -> (B,K)
+            f += np.einsum('kbi,bi->bk', np.matmul(Xc, J), Xc)
+        elif couplings is not None:
+            # objective by objective to keep the O(n) cost of the structured couplings
+            for k, Jk in enumerate(couplings):
+                if _is_structured(Jk):
+                    f[:, k] += Jk.quadratic_form(Xc)
+                elif Jk is not None:
+                    f[:, k] += np.einsum('bi,bi->b', np.dot(Xc, Jk), Xc)
+        out[start:stop] = f
+    if instrumentation is not None:
+        instrumentation.add_time('evaluate', time.perf_counter() - start_time)
+        instrumentation.add_evaluations(instance_key, num_configs, range(num_objs))
+    return out
+
+
+def calculate_cost_functions_batched(X: np.array, cost_coefficients: list, chunk_size=None, out=None, instance_key=None):
+    """
+    calculates all K objectives for N search vectors at once
+    X is an (N,n) array of qudit configurations, cost_coefficients is the list returned by one of the generate_problem_* functions
+    the configurations are processed in chunks of chunk_size rows so that the temporaries stay bounded
+    returns an (N,K) array with the same values as calling calculate_cost_function_linear / calculate_cost_function_quadratic per row and objective
+    instance_key names the instance in the counts of an active instrumentation (see qmoo_instrumentation)
+    """
+    return _evaluate_prepared(X, _prepare_cost_coefficients(cost_coefficients), chunk_size, out, instance_key)
+
+
+def _smallest_unsigned_dtype(max_value: int):
+    for dtype in (np.uint8, np.uint16, np.uint32, np.uint64):
+        if max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    print(f'ERROR: {max_value} does not fit into 64 bit!')
+    sys.exit(8)
+
+
+class MixedRadixCodec:
+    """
+    vectorized conversion between qudit configurations and state vector indices for the (possibly different) qudit dimensions qudits_list
+    order 'msb': the first qudit is the most significant digit (state vector order of this package, as np.unravel_index),
+    order 'lsb': the first qudit is the least significant digit (e.g. Qiskit)
+    indices are packed into index_dtype, the smallest unsigned integer type holding num_states-1 (at most 2^64 states),
+    configurations into digit_dtype, the smallest unsigned integer type holding the largest qudit value
+    """
+    def __init__(self, qudits_list: np.array, order='msb'):
+        if order not in ('msb', 'lsb'):
+            print(f'ERROR: digit order {order} not implemented!')
+            sys.exit(8)
+        self.qudits = np.asarray(qudits_list, dtype=np.int64)
+        if np.any(self.qudits < 1):
+            print(f'ERROR: qudit dimensions {self.qudits} must be positive!')
+            sys.exit(8)
+        self.order = order
+        self.num_states = 1
+        for q in self.qudits:
+            self.num_states *= int(q)
+        self.index_dtype = _smallest_unsigned_dtype(self.num_states - 1)
+        self.digit_dtype = _smallest_unsigned_dtype(int(np.max(self.qudits, initial=1)) - 1)
+        # digit positions from the most to the least significant one
+        self._significance = np.arange(len(self.qudits)) if order == 'msb' else np.arange(len(self.qudits))[::-1]
+        strides = np.ones(len(self.qudits), dtype=self.index_dtype)
+        place = 1
+        for j in self._significance[::-1]:
+            strides[j] = place
+            place *= int(self.qudits[j])
+        self.strides = strides
+
+    def encode(self, configs: np.array, dtype=None):
+        """
+        state vector indices of the (...,n) configurations, in index_dtype if dtype is None
+        computed by Horner's scheme column by column in the index dtype, without (...,n) temporaries
+        """
+        configs = np.asarray(configs)
+        dtype = self.index_dtype if dtype is None else np.dtype(dtype)
+        indices = np.zeros(configs.shape[:-1], dtype=dtype)
+        for j in self._significance:
+            indices *= dtype.type(self.qudits[j])
+            indices += configs[..., j].astype(dtype, copy=False)
+        return indices
+
+    def decode(self, indices: np.array, dtype=None):
+        """
+        (B,n) configurations of the (B,) state vector indices (a single configuration for a scalar index), in digit_dtype if dtype is None
+        the digits are computed row-major over the qudits, so each column of the returned array is contiguous
+        """
+        indices = np.asarray(indices)
+        dtype = self.digit_dtype if dtype is None else np.dtype(dtype)
+        remainder = np.atleast_1d(indices).astype(self.index_dtype)
+        configs = np.empty((len(self.qudits), len(remainder)), dtype=dtype)
+        for j in self._significance[::-1]:
+            radix = self.index_dtype.type(self.qudits[j])
+            configs[j] = remainder % radix
+            remainder //= radix
+        return configs[:, 0] if indices.ndim == 0 else configs.T
+
+
+def _configs_from_indices(indices: np.array, qudits_list: np.array):
+    """
+    converts state vector indices into int64 qudit configurations (first qudit is the most significant digit, as np.unravel_index)
+    """
+    return MixedRadixCodec(qudits_list).decode(indices, np.int64)
+
+
+def iter_all_states(cost_coefficients: list, qudits_list: np.array, chunk_size=2**16, instance_key=None):
+    """
+    full enumeration of all states of the qudit system in blocks of chunk_size states
+    yields (start, configs, energies) for each block, where configs is the (B,n) array of configurations of the states start,...,start+B-1
+    (in the smallest unsigned integer dtype, see MixedRadixCodec) and energies is the (B,K) array of the objectives
+    """
+    codec = MixedRadixCodec(qudits_list)
+    hilbert_space_dimension = codec.num_states
+    for start in range(0, hilbert_space_dimension, chunk_size):
+        stop = min(start + chunk_size, hilbert_space_dimension)
+        configs = codec.decode(np.arange(start, stop))
+        yield start, configs, calculate_cost_functions_batched(configs, cost_coefficients, instance_key=instance_key)
+
+
+def _gray_digits(indices: np.array, qudits_list: np.array, initial_odd=False):
+    """
+    converts positions in the reflected mixed-radix Gray code into qudit configurations
+    digit j runs upwards while the number formed by the more significant digits is even and downwards otherwise,
+    so consecutive positions differ in exactly one qudit by +-1
+    initial_odd is the parity of the more significant digits in front of these (for the low digits of a longer code)
+    returns the configurations and the parity after the last digit
+    """
+    radices = np.asarray(qudits_list, dtype=np.int64)
+    lex = _configs_from_indices(indices, radices)
+    configs = lex.copy()
+    # parity of the number formed by the more significant digits, built up digit by digit
+    odd = np.full(len(lex), initial_odd, dtype=bool)
+    for j in range(len(radices)):
+        if j > 0:
+            if radices[j-1] % 2 == 1:
+                odd ^= (lex[:, j-1] % 2 == 1)
+            else:
+                odd = (lex[:, j-1] % 2 == 1)
+        configs[odd, j] = radices[j] - 1 - lex[odd, j]
+    if len(radices) > 0:
+        odd = odd ^ (lex[:, -1] % 2 == 1) if radices[-1] % 2 == 1 else (lex[:, -1] % 2 == 1)
+    return configs, odd
+
+
+def _gray_configs_from_indices(indices: np.array, qudits_list: np.array):
+    """
+    converts positions in the reflected mixed-radix Gray code into qudit configurations (see _gray_digits)
+    """
+    return _gray_digits(indices, qudits_list)[0]
+
+
+def _cross_couplings(prepared: tuple, num_high: int, num_params: int):
+    """
+    (K, num_high, n - num_high) couplings (J + J^T) between the first num_high qudits and the others, without forming dense structured matrices
+    """
+    J, c, m, couplings = prepared
+    unit = np.zeros((num_params, num_params - num_high), dtype=c.dtype)
+    unit[num_high + np.arange(num_params - num_high), np.arange(num_params - num_high)] = 1.
+    if J is not None:
+        return (np.matmul(J, unit) + np.matmul(J.transpose(0, 2, 1), unit))[:, :num_high]
+    cross = np.zeros((len(m), num_high, num_params - num_high), dtype=c.dtype)
+    for k, Jk in enumerate(couplings or []):
+        if _is_structured(Jk):
+            # ring and diagonal couplings are symmetric
+            cross[k] = 2. * Jk.dot(unit)[:num_high]
+        elif Jk is not None:
+            cross[k] = (np.dot(Jk, unit) + np.dot(Jk.T, unit))[:num_high]
+    return cross
+
+
+def iter_all_states_gray(cost_coefficients: list, qudits_list: np.array, chunk_size=2**16, instance_key=None):
+    """
+    full enumeration of all states in mixed-radix Gray-code order, consecutive states differ in a single qudit
+    the qudits are split into the first (high) ones and the last (low) ones with at most 4096 states; the Gray code sweeps all low states
+    for each high prefix, forwards or in one fixed other order. With x = (h, l) every objective splits as
+        f(h, l) = f_H(h) + f_L(l) + l.F(h),   F(h) = (J + J^T)_{LH} h
+    f_L and both sweep orders are computed once, f_H and the field F once per sweep, so a state costs one table lookup
+    and an O(n_L) product instead of the O(n^2) quadratic form
+    yields (start, configs, energies) for each block, where start is the position in the Gray code
+    """
+    radices = np.asarray(qudits_list, dtype=np.int64)
+    num_params = len(radices)
+    hilbert_space_dimension = int(np.prod(radices))
+    codec = MixedRadixCodec(radices)
+    prepared = _prepare_cost_coefficients(cost_coefficients)
+    m = prepared[2]
+    # low part: the last qudits with at most min(chunk_size, 4096) states, at least one qudit
+    num_low = 1
+    while num_low < num_params and int(np.prod(radices[num_params - num_low - 1:])) <= min(chunk_size, 2**12):
+        num_low += 1
+    num_high = num_params - num_low
+    low_radices = radices[num_high:]
+    num_low_states = int(np.prod(low_radices))
+
+    # the tables shared by all blocks are evaluation time, but no evaluations of complete states
+    instrumentation = _instrumentation
+    if instrumentation is not None:
+        start_time = time.perf_counter()
+    low_energies = np.zeros((num_low_states, num_params), dtype=np.int64)
+    low_energies[:, num_high:] = _configs_from_indices(np.arange(num_low_states), low_radices)
+    low_energies = _evaluate_prepared(low_energies, prepared, instrumented=False)
+    low_codec = MixedRadixCodec(low_radices)
+    sweeps = []
+    for initial_odd in (False, True):
+        low_configs = _gray_digits(np.arange(num_low_states), low_radices, initial_odd)[0]
+        sweeps.append((low_configs.astype(codec.digit_dtype), low_configs.astype(m.dtype), low_energies[low_codec.encode(low_configs)]))
+    cross = _cross_couplings(prepared, num_high, num_params)
+    if instrumentation is not None:
+        instrumentation.add_time('evaluate', time.perf_counter() - start_time)
+
+    for start in range(0, hilbert_space_dimension, chunk_size):
+        stop = min(start + chunk_size, hilbert_space_dimension)
+        instrumentation = _instrumentation
+        if instrumentation is not None:
+            start_time = time.perf_counter()
+        # the sweeps overlapping the block, a sweep has one high prefix
+        first_sweep = start // num_low_states
+        sweep_indices = np.arange(first_sweep, (stop - 1) // num_low_states + 1)
+        high_configs, odd = _gray_digits(sweep_indices, radices[:num_high])
+        high_padded = np.zeros((len(sweep_indices), num_params), dtype=np.int64)
+        high_padded[:, :num_high] = high_configs
+        high_energies = _evaluate_prepared(high_padded, prepared, instrumented=False) - m
+        fields = np.einsum('qh,khl->qlk', high_configs.astype(m.dtype), cross)
+        configs = np.empty((len(sweep_indices), num_low_states, num_params), dtype=codec.digit_dtype)
+        configs[:, :, :num_high] = high_configs[:, np.newaxis, :]
+        energies = np.empty((len(sweep_indices), num_low_states, len(m)), dtype=m.dtype)
+        for sweep, (low_configs, low_values, low_sweep_energies) in zip([~odd, odd], sweeps):
+            configs[sweep, :, num_high:] = low_configs
+            energies[sweep] = high_energies[sweep, np.newaxis, :] + low_sweep_energies + np.matmul(low_values, fields[sweep])
+        rows = slice(start - first_sweep * num_low_states, stop - first_sweep * num_low_states)
+        configs = configs.reshape(-1, num_params)[rows]
+        energies = energies.reshape(-1, len(m))[rows]
+        if instrumentation is not None:
+            instrumentation.add_time('evaluate', time.perf_counter() - start_time)
+            instrumentation.add_evaluations(instance_key, stop - start, range(len(m)))
+        yield start, configs, energies
+
+
+def enumerate_all_states(cost_coefficients: list, qudits_list: np.array, chunk_size=2**16, out=None, include_configs=True, method='block', order='lex',
+                         instance_key=None):
+    """
+    full enumeration for classical solutions
+    returns the table of all states with the configuration in the first n columns and the K objectives in the last K columns (same layout as calc_all_states of the example)
+    if include_configs is False only the K objective columns are returned, the configuration then follows from the row index
+    out can be a preallocated array of the matching shape which is filled block by block
+    method 'block' evaluates every state directly (iter_all_states), method 'gray' walks the states in Gray-code order with O(n_L) work per state (iter_all_states_gray)
+    ('gray' is faster from about 2^14 states on, below that the fixed cost of its tables makes it slower than 'block')
+    order 'lex' stores the rows by state vector index, order 'gray' stores them in the order of the Gray code (only for method 'gray')
+    the table has the dtype of the coefficients, e.g. float32 for coefficients from cast_cost_coefficients(..., np.float32)
+    instance_key names the instance in the counts of an active instrumentation (also for iter_all_states and iter_all_states_gray)
+    """
+    if method not in ('block', 'gray') or order not in ('lex', 'gray') or (method == 'block' and order == 'gray'):
+        print(f'ERROR: enumeration method {method} with order {order} not implemented!')
+        sys.exit(8)
+    hilbert_space_dimension = int(np.prod(qudits_list))
+    numObjs = len(cost_coefficients)
+    numParams = len(qudits_list) if include_configs else 0
+    if out is None:
+        out = np.empty((hilbert_space_dimension, numParams + numObjs), dtype=coefficient_dtype(cost_coefficients))
+    if out.shape != (hilbert_space_dimension, numParams + numObjs):
+        print(f'ERROR: output array has shape {out.shape}, expected {(hilbert_space_dimension, numParams + numObjs)}!')
+        sys.exit(8)
+
+    if method == 'gray':
+        blocks = iter_all_states_gray(cost_coefficients, qudits_list, chunk_size, instance_key)
+    else:
+        blocks = iter_all_states(cost_coefficients, qudits_list, chunk_size, instance_key)
+    codec = MixedRadixCodec(qudits_list)
+
+    for start, configs, energies in blocks:
+        if method == 'gray' and order == 'lex':
+            rows = codec.encode(configs)
+        else:
+            rows = slice(start, start + len(configs))
+        if include_configs:
+            out[rows, 0:numParams] = configs
+        out[rows, numParams:] = energies
+    return out
+
+
+def _with_dtype(cost_coefficients: list, dtype):
+    """
+    coefficients returned by the generators: unchanged for float64, otherwise cast to dtype
+    """
+    if np.dtype(dtype) == np.float64:
+        return cost_coefficients
+    return cast_cost_coefficients(cost_coefficients, dtype)
+
+
+def _random_source(seed, rng=None):
+    """
+    random number source of the generate_problem_* functions:
+    without rng the global legacy RNG is seeded with seed (the original behaviour), otherwise rng is used and the global state is not touched
+    rng=np.random.RandomState(seed) draws exactly the same numbers as the default, so it reproduces the instances bit for bit and is thread-safe
+    """
+    if rng is None:
+        np.random.seed(seed)
+        return np.random
+    return rng
+
+
+def _uniform_reversed_bounds(rand, low, high=1.0):
+    """
+    rand.uniform(low, high) for low > high, which np.random.Generator rejects while RandomState draws from (high, low]
+    """
+    if isinstance(rand, np.random.Generator):
+        low = np.asarray(low, dtype=float)
+        return low + (high - low) * rand.random(low.shape)
+    return rand.uniform(low, high)
+
+
 def get_reference_point_for_qudit_config_and_problem_name(problem_name):
     """
     returns the reference vecotr for each problem (which is always the K-dimensional vectors with all ones, r=(1,1,....,1)^T )
@@ -67,28 +678,32 @@ def get_reference_point_for_qudit_config_and_problem_name(problem_name):
     return ref_norm[problem_name]
 
 
-def generate_problem_linear_corr05(qudits_list: np.array, seed=3):
+def generate_problem_linear_corr05(qudits_list: np.array, seed=3, rng=None, dtype=np.float64):
     """
     two objective linear cost function where the two objectives have anticorrelated objectives
     for a given seed, the problem is always the same
+    rng = optional np.random.RandomState / np.random.Generator used instead of the global RNG (see _random_source)
+    dtype = np.float32 returns the coefficients in single precision for the reduced-precision evaluation (see reduced_precision_error_bound)
     """
     # objectives (minimize)
     dimq = len(qudits_list)
     cnt = seed
-    np.random.seed(cnt)
+    rand = _random_source(cnt, rng)
 
-    cost_1 = np.random.uniform(low=-1., high=1., size=dimq)
-    cost_2 = getCorrelatedRand(cost_1, -0.5, 1.)
+    cost_1 = rand.uniform(low=-1., high=1., size=dimq)
+    cost_2 = getCorrelatedRand(cost_1, -0.5, 1., rng=rand)
     A=np.sum(qudits_list-1.)
     #print(f"A {A}")
 
-    return [[ 0.5*cost_1/A , 0.5 ], [0.5*cost_2/A ,0.5]]
+    return _with_dtype([[ 0.5*cost_1/A , 0.5 ], [0.5*cost_2/A ,0.5]], dtype)
 
 
-def generate_problem_ferromagnetic_antiferromagnetic_two_objectives(qudits_list: np.array, seed=12):
+def generate_problem_ferromagnetic_antiferromagnetic_two_objectives(qudits_list: np.array, seed=12, rng=None, dtype=np.float64):
     """
     two-objective cost function
     for a given seed, the problem is always the same
+    rng = optional np.random.RandomState / np.random.Generator used instead of the global RNG (see _random_source)
+    dtype = np.float32 returns the coefficients in single precision for the reduced-precision evaluation (see reduced_precision_error_bound)
     obj1 = randomized predominantly anti-ferromagentic all-to-all coupling: AFM
     obj2 = randomized predominantly ferromagentic all-to-all coupling: FM
     """
@@ -116,37 +731,38 @@ def generate_problem_ferromagnetic_antiferromagnetic_two_objectives(qudits_list:
 
     
     cnt = seed  # 12
-    np.random.seed(cnt)
+    rand = _random_source(cnt, rng)
     # objectives (minimize)
-    cost_1 = c1max * np.random.uniform(low=-1., high=1., size=dimq)
-    cost_2 = c2max * np.random.uniform(low=-1., high=1., size=dimq)
-    J_1 = np.random.uniform(low=0.2, high=J1max, size=(dimq, dimq))
-    J_2 = np.random.uniform(low=-1.*J2max, high=-0.2, size=(dimq, dimq))
-    for d in range(dimq):
-        J_1[d, d] = 0.
-        J_2[d, d] = 0.
+    cost_1 = c1max * rand.uniform(low=-1., high=1., size=dimq)
+    cost_2 = c2max * rand.uniform(low=-1., high=1., size=dimq)
+    J_1 = rand.uniform(low=0.2, high=J1max, size=(dimq, dimq))
+    J_2 = rand.uniform(low=-1.*J2max, high=-0.2, size=(dimq, dimq))
+    np.fill_diagonal(J_1, 0.)
+    np.fill_diagonal(J_2, 0.)
     # make interaction matrices symmetric
-    J_1 = 0.5 * (J_1 + J_1.T) 
-    J_2 = 0.5 * (J_2 + J_2.T) 
+    _symmetrize_inplace(J_1)
+    _symmetrize_inplace(J_2)
 
     # transform from qudits to spins:
     c_1 = (cost_1 - 2. * np.dot(J_1, m)) / (Aafm-Bafm)
     c_2 = (cost_2 - 2. * np.dot(J_2, m)) / (Afm-Bfm)
 
-    J_1 = J_1 / (Aafm-Bafm)
-    J_2 = J_2 / (Afm-Bfm)
+    J_1 /= (Aafm-Bafm)
+    J_2 /= (Afm-Bfm)
     
     m_1 = - Bafm / (Aafm-Bafm)
     m_2 = - Bfm /(Afm-Bfm)
 
-    return [[J_1, c_1, m_1], [J_2, c_2, m_2]]
+    return _with_dtype([[J_1, c_1, m_1], [J_2, c_2, m_2]], dtype)
 
 
 
-def generate_problem_quadratic_antiferromagnetic_two_objectives(qudits_list: np.array, seed=12):
+def generate_problem_quadratic_antiferromagnetic_two_objectives(qudits_list: np.array, seed=12, rng=None, dtype=np.float64):
     """
     two-objective cost function
     for a given seed, the problem is always the same
+    rng = optional np.random.RandomState / np.random.Generator used instead of the global RNG (see _random_source)
+    dtype = np.float32 returns the coefficients in single precision for the reduced-precision evaluation (see reduced_precision_error_bound)
     obj1 = randomized predominantly anti-ferromagentic all-to-all coupling: AFM
     obj2 = quadratic coupling ~ (x - 1.8)**2
     """
@@ -167,9 +783,9 @@ def generate_problem_quadratic_antiferromagnetic_two_objectives(qudits_list: np.
     Jqmin=0.5
     
     cnt = seed  # 12
-    np.random.seed(cnt)
+    rand = _random_source(cnt, rng)
     # objectives (minimize)
-    cost_1 = c1max * np.random.uniform(low=-1., high=1., size=dimq)
+    cost_1 = c1max * rand.uniform(low=-1., high=1., size=dimq)
     cost_2 = (np.array(qudits_list) - 1.8)
     c2max = cost_2[0]
 
@@ -182,35 +798,37 @@ def generate_problem_quadratic_antiferromagnetic_two_objectives(qudits_list: np.
     Bq = np.minimum(np.minimum(0.,tq1),tq2)
 
 
-    J_1 = np.random.uniform(low=0.1, high=J1max, size=(dimq, dimq))
-    J_2 = np.eye(dimq)
+    J_1 = rand.uniform(low=0.1, high=J1max, size=(dimq, dimq))
+    J_2 = np.zeros((dimq, dimq))
 
-    for d in range(dimq):
-        J_1[d, d] = 0.
-        J_2[d, d] *= np.random.uniform(low=Jqmin,high=Jqmax,size=1)
+    np.fill_diagonal(J_1, 0.)
+    np.fill_diagonal(J_2, rand.uniform(low=Jqmin,high=Jqmax,size=dimq))
     # make interaction matrices symmetric
-    J_1 = 0.5 * (J_1 + J_1.T) 
+    _symmetrize_inplace(J_1)
 
     # transform from qudits to spins:
     c_1 = (cost_1 - 2. * np.dot(J_1, m)) / (Aafm-Bafm) 
     c_2 = - 2. * np.dot(J_2,cost_2) / (Aq-Bq) 
 
-    J_1 = J_1 / (Aafm-Bafm) 
-    J_2 = J_2 / (Aq-Bq) 
+    J_1 /= (Aafm-Bafm) 
+    J_2 /= (Aq-Bq) 
 
     m_1 =  -Bafm / (Aafm-Bafm) 
     m_2 =  -Bq / (Aq-Bq) 
 
-    return [[J_1, c_1, m_1], [J_2, c_2, m_2]]
+    return _with_dtype([[J_1, c_1, m_1], [J_2, c_2, m_2]], dtype)
 
 
-def generate_problem_ferromagnetic_antiferromagnetic_three_objectives(qudits_list: np.array, seed = 32):
+def generate_problem_ferromagnetic_antiferromagnetic_three_objectives(qudits_list: np.array, seed = 32, structured=False, rng=None, dtype=np.float64):
     """
     three-objective cost function
     for a given seed, the problem is always the same
+    rng = optional np.random.RandomState / np.random.Generator used instead of the global RNG (see _random_source)
+    dtype = np.float32 returns the coefficients in single precision for the reduced-precision evaluation (see reduced_precision_error_bound)
     obj1 = randomized predominantly anti-ferromagentic nearest-neightbor coupling: AFM
     obj2 = randomized predominantly ferromagentic nearest-neightbor coupling: FM
     obj3 = quadratic coupling ~ (x - c )**2
+    with structured=True the coupling matrices are returned as RingCouplingMatrix / DiagonalCouplingMatrix (memory and evaluation cost linear in n)
     """
     # objectives (minimize)
     dimq = len(qudits_list)
@@ -225,10 +843,10 @@ def generate_problem_ferromagnetic_antiferromagnetic_three_objectives(qudits_lis
 
     cnt = seed # 32
 
-    np.random.seed(cnt)
-    cost_1 = c1max*np.random.uniform(low=-1., high=1., size=dimq)
-    cost_2 = c2max*np.random.uniform(low=-1., high=1., size=dimq)
-    cost_3 = np.random.uniform(qudits_list-0.5)
+    rand = _random_source(cnt, rng)
+    cost_1 = c1max*rand.uniform(low=-1., high=1., size=dimq)
+    cost_2 = c2max*rand.uniform(low=-1., high=1., size=dimq)
+    cost_3 = _uniform_reversed_bounds(rand, qudits_list-0.5)
 
     c3max = qudits_list[0]-0.5
     c3min=0.
@@ -252,43 +870,49 @@ def generate_problem_ferromagnetic_antiferromagnetic_three_objectives(qudits_lis
     B3 = np.minimum(np.maximum(np.minimum(0.,t31),t32),t31a)
 
 
-    J_1 = np.zeros((dimq, dimq))
-    J_2 = np.zeros((dimq, dimq))
-
-    for d in range(dimq):
-        J_1[d, (d+1) % dimq] = np.random.uniform(low=0.2, high=1., size=1)
-        J_2[d, (d+1) % dimq] = np.random.uniform(low=-1., high=0.2, size=1)
+    # ring weights J[d, (d+1) % dimq] before symmetrization, drawn in the order d=0: w_1, w_2, d=1: w_1, w_2, ...
+    w = rand.uniform(low=[0.2, -1.], high=[1., 0.2], size=(dimq, 2))
+    w_1 = w[:, 0].copy()
+    w_2 = w[:, 1].copy()
 
-    J_1 = 0.5 * (J_1 + J_1.T)
-    J_2 = 0.5 * (J_2 + J_2.T)
-    J_3 = np.eye(dimq)
+    if structured:
+        J_1 = RingCouplingMatrix(w_1)
+        J_2 = RingCouplingMatrix(w_2)
+        J_3 = DiagonalCouplingMatrix(np.ones(dimq))
+    else:
+        J_1 = RingCouplingMatrix(w_1).toarray()
+        J_2 = RingCouplingMatrix(w_2).toarray()
+        J_3 = np.eye(dimq)
 
-    c_1 = (cost_1 - 2. * np.dot(J_1, m)) /(A1-B1)
-    c_2 = (cost_2 - 2. * np.dot(J_2, m)) /(A2-B2)
+    c_1 = (cost_1 - 2. * _coupling_dot(J_1, m)) /(A1-B1)
+    c_2 = (cost_2 - 2. * _coupling_dot(J_2, m)) /(A2-B2)
     c_3 = (- 2. * cost_3 )/ (A3-B3)
 
-    J_1 = J_1 /(A1-B1)
-    J_2 = J_2 /(A2-B2)
-    J_3 = J_3 /(A3-B3)
+    J_1 /= (A1-B1)
+    J_2 /= (A2-B2)
+    J_3 /= (A3-B3)
 
     m_1 = -B1/(A1-B1) 
     m_2 = -B2/(A2-B2) 
     m_3 = -B3/(A3-B3)
 
-    return [ [J_1, c_1, m_1], [J_2, c_2, m_2], [J_3, c_3, m_3] ]
+    return _with_dtype([ [J_1, c_1, m_1], [J_2, c_2, m_2], [J_3, c_3, m_3] ], dtype)
 
 
 
 
-def generate_problem_quadratic_five_objectives(qudits_list: np.array, seed = 32):
+def generate_problem_quadratic_five_objectives(qudits_list: np.array, seed = 32, structured=False, rng=None, dtype=np.float64):
     """"
     five-objective cost function
     for a given seed, the problem is always the same
+    rng = optional np.random.RandomState / np.random.Generator used instead of the global RNG (see _random_source)
+    dtype = np.float32 returns the coefficients in single precision for the reduced-precision evaluation (see reduced_precision_error_bound)
     obj1 = randomized predominantly anti-ferromagentic nearest-neightbor coupling: AFM
     obj2 = randomized predominantly ferromagentic  nearest-neightbor coupling: FM
     obj3 = quadratic coupling ~ (x - c )**2
     obj4 = AFM nearest-neightbor coupling in first half of variables, FM coupling in second half
     obj5 = FM nearest-neightbor coupling in first half of variables, AFM coupling in second half
+    with structured=True the coupling matrices are returned as RingCouplingMatrix / DiagonalCouplingMatrix (memory and evaluation cost linear in n)
     """
     # objectives (minimize)
     dimq = len(qudits_list)
@@ -303,16 +927,16 @@ def generate_problem_quadratic_five_objectives(qudits_list: np.array, seed = 32)
     
     cnt = seed # 32
 
-    np.random.seed(cnt)
-    cost_1 = c1max*np.random.uniform(low=-1., high=1., size=dimq)
-    cost_2 = c2max*np.random.uniform(low=-1., high=1., size=dimq)
-    cost_3 = np.random.uniform(qudits_list-0.5)
+    rand = _random_source(cnt, rng)
+    cost_1 = c1max*rand.uniform(low=-1., high=1., size=dimq)
+    cost_2 = c2max*rand.uniform(low=-1., high=1., size=dimq)
+    cost_3 = _uniform_reversed_bounds(rand, qudits_list-0.5)
     
     c3max = qudits_list[0]-0.5
     c3min=0.
     
-    cost_4 = getCorrelatedRand(cost_2, -0.5, 1.)
-    cost_5 = getCorrelatedRand(cost_1, -0.5, 1.)
+    cost_4 = getCorrelatedRand(cost_2, -0.5, 1., rng=rand)
+    cost_5 = getCorrelatedRand(cost_1, -0.5, 1., rng=rand)
     
     c4max=1
     c5max=1
@@ -349,39 +973,38 @@ def generate_problem_quadratic_five_objectives(qudits_list: np.array, seed = 32)
                 -(dimq*dimq-dimq)*0.2*d_1*d_1*0.25 -2.*c5max*np.sum(m)-0.25*c5max*c5max*dimq/(0.2*(dimq-1.))
                 )
 
-    J_1 = np.zeros((dimq, dimq))
-    J_2 = np.zeros((dimq, dimq))
-
-    J_4 = np.zeros((dimq, dimq))
-    J_5 = np.zeros((dimq, dimq))
-
-    sign=1.
-    for d in range(dimq):
-        J_1[d, (d+1) % dimq] = np.random.uniform(low=0.2, high=1., size=1)
-        J_2[d, (d+1) % dimq] = np.random.uniform(low=-1., high=0.2, size=1)
-        if d > 0.5*(dimq-1.):
-            sign =-1.
-        J_4[d, (d+1) % dimq] = sign * np.random.uniform(low=0.2, high=1., size=1)
-        J_5[d, (d+1) % dimq] = -1.*sign* np.random.uniform(low=0.2, high=1., size=1)
-
-
-    J_1 = 0.5 * (J_1 + J_1.T)
-    J_2 = 0.5 * (J_2 + J_2.T)
-    J_3 = np.eye(dimq)
-    J_4 = 0.5 * (J_4 + J_4.T)
-    J_5 = 0.5 * (J_5 + J_5.T)
-
-    c_1 = (cost_1 - 2. * np.dot(J_1, m)) /(A1-B1)
-    c_2 = (cost_2 - 2. * np.dot(J_2, m)) /(A2-B2)
+    # ring weights J[d, (d+1) % dimq] before symmetrization, drawn in the order d=0: w_1, w_2, w_4, w_5, d=1: ...
+    w = rand.uniform(low=[0.2, -1., 0.2, 0.2], high=[1., 0.2, 1., 1.], size=(dimq, 4))
+    sign = np.where(np.arange(dimq) > 0.5*(dimq-1.), -1., 1.)
+    w_1 = w[:, 0].copy()
+    w_2 = w[:, 1].copy()
+    w_4 = sign * w[:, 2]
+    w_5 = -1.*sign* w[:, 3]
+
+    if structured:
+        J_1 = RingCouplingMatrix(w_1)
+        J_2 = RingCouplingMatrix(w_2)
+        J_3 = DiagonalCouplingMatrix(np.ones(dimq))
+        J_4 = RingCouplingMatrix(w_4)
+        J_5 = RingCouplingMatrix(w_5)
+    else:
+        J_1 = RingCouplingMatrix(w_1).toarray()
+        J_2 = RingCouplingMatrix(w_2).toarray()
+        J_3 = np.eye(dimq)
+        J_4 = RingCouplingMatrix(w_4).toarray()
+        J_5 = RingCouplingMatrix(w_5).toarray()
+
+    c_1 = (cost_1 - 2. * _coupling_dot(J_1, m)) /(A1-B1)
+    c_2 = (cost_2 - 2. * _coupling_dot(J_2, m)) /(A2-B2)
     c_3 = (- 2. * cost_3 )/(A3-B3)
-    c_4 = (cost_4 - 2. * np.dot(J_4, m)) / (A4-B4)
-    c_5 = (cost_5 - 2. * np.dot(J_5, m)) / (A5-B5)
+    c_4 = (cost_4 - 2. * _coupling_dot(J_4, m)) / (A4-B4)
+    c_5 = (cost_5 - 2. * _coupling_dot(J_5, m)) / (A5-B5)
 
-    J_1 = J_1/(A1-B1)
-    J_2 = J_2/(A2-B2)
-    J_3 = J_3/(A3-B3)
-    J_4 = J_4 /(A4-B4)
-    J_5 = J_5 /(A5-B5)
+    J_1 /= (A1-B1)
+    J_2 /= (A2-B2)
+    J_3 /= (A3-B3)
+    J_4 /= (A4-B4)
+    J_5 /= (A5-B5)
 
     m_1 = -B1/(A1-B1)
     m_2 = -B2/(A2-B2)
@@ -390,12 +1013,154 @@ def generate_problem_quadratic_five_objectives(qudits_list: np.array, seed = 32)
     m_5 = -B5/(A5-B5)
     
 
-    return [ [J_1, c_1, m_1] ,
-             [J_2, c_2, m_2] ,
-             [J_3, c_3, m_3] ,
-             [J_4, c_4, m_4] , 
-             [J_5, c_5, m_5] 
-            ]
+    return _with_dtype([ [J_1, c_1, m_1] ,
+                         [J_2, c_2, m_2] ,
+                         [J_3, c_3, m_3] ,
+                         [J_4, c_4, m_4] , 
+                         [J_5, c_5, m_5] 
+                        ], dtype)
+
+
+
+# ################################
+# problem registry: problem name -> generator, objective kind and reference point
 
+PROBLEM_REGISTRY = dict()
+
+
+def register_problem(problem_name: str, generator, kind: str, reference_point=None):
+    """
+    registers a generate_problem_* function under problem_name
+    kind is 'linear' (coefficients [c, m] per objective) or 'quadratic' (coefficients [J, c, m] per objective)
+    the generator is called as generator(qudits_list, seed, rng=rng) and must draw all random numbers from rng
+    the reference point defaults to the one of get_reference_point_for_qudit_config_and_problem_name, it is required for new problem names
+    """
+    if reference_point is None:
+        try:
+            reference_point = get_reference_point_for_qudit_config_and_problem_name(problem_name)
+        except KeyError:
+            print(f'ERROR: problem {problem_name} has no default reference point, register_problem needs reference_point!')
+            sys.exit(8)
+    PROBLEM_REGISTRY[problem_name] = {'generator': generator, 'kind': kind, 'reference_point': list(reference_point)}
+
+
+register_problem('problem_linear_corr-0.5', generate_problem_linear_corr05, 'linear')
+register_problem('problem_FM_AFM_two_objs', generate_problem_ferromagnetic_antiferromagnetic_two_objectives, 'quadratic')
+register_problem('problem_quadratic_AFM_two_objs', generate_problem_quadratic_antiferromagnetic_two_objectives, 'quadratic')
+register_problem('problem_FM_AFM_three_objs', generate_problem_ferromagnetic_antiferromagnetic_three_objectives, 'quadratic')
+register_problem('problem_quadratic_five_objs', generate_problem_quadratic_five_objectives, 'quadratic')
+
+
+def _counted_objective_function(objective, instance_key, k: int):
+    """
+    objective k of an instance which counts its calls in an active instrumentation, like the batched evaluation
+    """
+    def objective_function(x):
+        instrumentation = _instrumentation
+        if instrumentation is not None:
+            instrumentation.add_evaluations(instance_key, 1, k)
+        return objective(x)
+    return objective_function
+
+
+class ProblemInstance:
+    """
+    one generated problem instance (problem name, qudits, seed) with its coefficients and evaluators bound to them
+    the coefficient arrays are read-only since instances are shared through the instance cache
+    cost_coefficients can be given instead of calling the generator, e.g. memory-mapped ones from qmoo_instance_cache
+    """
+    def __init__(self, problem_name: str, qudits_list: np.array, seed: int, cost_coefficients=None):
+        if problem_name not in PROBLEM_REGISTRY:
+            print(f'problem {problem_name}  not defined')
+            sys.exit(8)
+        spec = PROBLEM_REGISTRY[problem_name]
+        self.problem_name = problem_name
+        self.qudits = np.array(qudits_list)
+        self.seed = seed
+        self.kind = spec['kind']
+        self.reference_point = list(spec['reference_point'])
+        self.instrumentation_key = instrumentation_key(problem_name, self.qudits, seed)
+        instrumentation = _instrumentation
+        if cost_coefficients is not None:
+            self.cost_coefficients = cost_coefficients
+        else:
+            if instrumentation is not None:
+                start_time = time.perf_counter()
+            # a private RandomState gives the same instance as the global RNG without touching global state, so instances can be generated from threads
+            self.cost_coefficients = spec['generator'](self.qudits, seed, rng=np.random.RandomState(seed))
+            if instrumentation is not None:
+                instrumentation.add_time('generate', time.perf_counter() - start_time)
+        self.num_objs = len(self.cost_coefficients)
+        self.num_params = len(self.qudits)
+        self._prepared = _prepare_cost_coefficients(self.cost_coefficients)
+        for array in [self.qudits] + [a for a in self._prepared[:3] if a is not None] + \
+                [a for cc in self.cost_coefficients for a in cc if isinstance(a, np.ndarray)]:
+            array.flags.writeable = False
+
+        if self.kind == 'linear':
+            self._objective_functions = [functools.partial(calculate_cost_function_linear, c=cc[0], m=cc[1])
+                                         for cc in self.cost_coefficients]
+        else:
+            self._objective_functions = [functools.partial(calculate_cost_function_quadratic, J=cc[0], c=cc[1], m=cc[2])
+                                         for cc in self.cost_coefficients]
+        self.objective_functions = [_counted_objective_function(objective, self.instrumentation_key, k)
+                                    for k, objective in enumerate(self._objective_functions)]
+
+    def evaluate(self, x: np.array):
+        """
+        vector of all K objectives for one search vector x
+        """
+        return _evaluate_prepared(x, self._prepared, instance_key=self.instrumentation_key)[0]
+
+    def evaluate_batched(self, X: np.array, chunk_size=None, out=None):
+        """
+        (N,K) array of all objectives for the (N,n) array of search vectors X, see calculate_cost_functions_batched
+        """
+        return _evaluate_prepared(X, self._prepared, chunk_size, out, self.instrumentation_key)
+
+    def enumerate_all_states(self, **kwargs):
+        """
+        full enumeration of the instance, the keyword arguments are passed to enumerate_all_states
+        """
+        kwargs.setdefault('instance_key', self.instrumentation_key)
+        return enumerate_all_states(self.cost_coefficients, self.qudits, **kwargs)
+
+
+_instance_cache = collections.OrderedDict()
+_instance_cache_size = 32
+_instance_cache_lock = threading.Lock()
+
+
+def get_problem_instance(problem_name: str, qudits_list: np.array, seed: int):
+    """
+    returns the ProblemInstance for (problem name, qudits, seed)
+    recently used instances are kept in a bounded LRU cache, so reopening an instance does not regenerate it
+    """
+    key = (problem_name, tuple(int(q) for q in qudits_list), int(seed))
+    with _instance_cache_lock:
+        if key in _instance_cache:
+            _instance_cache.move_to_end(key)
+            return _instance_cache[key]
+    instance = ProblemInstance(problem_name, np.asarray(key[1]), key[2])
+    with _instance_cache_lock:
+        _instance_cache[key] = instance
+        _instance_cache.move_to_end(key)
+        while len(_instance_cache) > _instance_cache_size:
+            _instance_cache.popitem(last=False)
+    return instance
+
+
+def set_problem_instance_cache_size(size: int):
+    """
+    sets the maximum number of instances kept by get_problem_instance
+    """
+    global _instance_cache_size
+    with _instance_cache_lock:
+        _instance_cache_size = size
+        while len(_instance_cache) > _instance_cache_size:
+            _instance_cache.popitem(last=False)
 
 
+def clear_problem_instance_cache():
+    with _instance_cache_lock:
+        _instance_cache.clear()
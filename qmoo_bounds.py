@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Exact minimum and maximum of the objectives f(x) = x.(c + J x) + m over all qudit configurations x_i in {0, ..., d_i-1},
+# together with configurations attaining them, without enumerating the state space:
+#   linear objectives and couplings which only connect ring neighbours (or nothing): dynamic programming along the ring, O(n d^3)
+#   all other couplings: depth-first branch-and-bound with bound tightening of the variable domains and eigenvalue bounds,
+#   e.g. the two all-to-all objectives of problem_FM_AFM_two_objs with 40 qubits (2^40 states) take tens of seconds together
+#   (15-50 s per instance on one core, depending on the seed), the cost still grows exponentially in the worst case
+
+
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+def _split_coefficients(coefficients: list):
+    """
+    (J, c, m) of a linear [c, m] or quadratic [J, c, m] objective, J is None for linear objectives
+    """
+    if len(coefficients) == 2:
+        return None, np.asarray(coefficients[0], dtype=float), float(coefficients[1])
+    return coefficients[0], np.asarray(coefficients[1], dtype=float), float(coefficients[2])
+
+
+def _objective_value(J, c: np.array, m: float, x: np.array):
+    if J is None:
+        return float(prob.calculate_cost_function_linear(x, c, m))
+    return float(prob.calculate_cost_function_quadratic(x, J, c, m))
+
+
+def _ring_structure(J, dimq: int):
+    """
+    (diagonal, pair) if J only couples ring neighbours, where pair[i] is the coefficient of x_i*x_{(i+1)%n} in x.J x, None otherwise
+    """
+    if J is None:
+        return np.zeros(dimq), np.zeros(dimq)
+    if isinstance(J, prob.DiagonalCouplingMatrix):
+        return J.diagonal(), np.zeros(dimq)
+    if isinstance(J, prob.RingCouplingMatrix) and dimq >= 3:
+        return np.zeros(dimq), J.weights.copy()
+    J = J.toarray() if prob._is_structured(J) else np.asarray(J, dtype=float)
+    rows = np.arange(dimq)
+    cols = (rows + 1) % dimq
+    pair = np.zeros(dimq)
+    others = np.ones((dimq, dimq), dtype=bool)
+    others[rows, rows] = False
+    if dimq >= 3:
+        pair = J[rows, cols] + J[cols, rows]
+        others[rows, cols] = False
+        others[cols, rows] = False
+    elif dimq == 2:
+        pair[0] = J[0, 1] + J[1, 0]
+        others[0, 1] = others[1, 0] = False
+    if np.any(J[others] != 0.):
+        return None
+    return np.diag(J).copy(), pair
+
+
+def _minimize_ring(diagonal: np.array, c: np.array, pair: np.array, qudits_list: np.array):
+    """
+    configuration minimizing sum_i (c_i x_i + diagonal_i x_i^2 + pair_i x_i x_{(i+1)%n}) by dynamic programming along the chain x_0, ..., x_{n-1}
+    for every value of x_0, the closing pair x_{n-1} x_0 is added at the end
+    """
+    dimq = len(c)
+    values = [np.arange(q, dtype=float) for q in qudits_list]
+    # V[a, b]: minimal cost of x_0 = a, ..., x_i = b
+    V = np.full((len(values[0]), len(values[0])), np.inf)
+    np.fill_diagonal(V, c[0] * values[0] + diagonal[0] * values[0]**2)
+    back = []
+    for i in range(1, dimq):
+        T = V[:, :, None] + pair[i-1] * values[i-1][None, :, None] * values[i][None, None, :]
+        best = np.argmin(T, axis=1)
+        back.append(best)
+        V = np.take_along_axis(T, best[:, None, :], axis=1)[:, 0, :] + c[i] * values[i] + diagonal[i] * values[i]**2
+    V = V + pair[dimq-1] * values[0][:, None] * values[dimq-1][None, :]
+    a, b = np.unravel_index(np.argmin(V), V.shape)
+    x = np.zeros(dimq, dtype=int)
+    x[dimq-1] = b
+    for i in range(dimq - 1, 0, -1):
+        x[i-1] = back[i-1][a, x[i]]
+    x[0] = a
+    return x
+
+
+class _DenseMinimizer:
+    """
+    depth-first branch-and-bound for min x.(c + J x) over the box 0 <= x_i <= d_i-1 of integers
+
+    nodes are boxes [lo, hi]; in every node the box is first tightened: an optimal x_i is a best response to the other variables, whose
+    field c_i + 2 sum_j J_ij x_j lies in an interval over the box, and the best responses of x_i to the ends of that interval bound x_i.
+    Variables entering concavely (J_ii <= 0) are only branched to the ends of their interval, convex ones are split in halves.
+    Lower bounds expand f around the box centre (r = half widths of the box):
+      - exact per-variable terms plus the larger of -sum |J_ij| r_i r_j and the smallest-eigenvalue bound of the remaining quadratic form
+      - if all free variables are concave, each free x_i = centre_i + r_i t_i with t_i = +-1, and for any diagonal D
+        min t.(M t) + b.t >= (k+1) lambda_min(M_h + D) - tr(D), M_h the k+1 dimensional homogenized form;
+        D is improved by a few supergradient steps (Polyak step towards the incumbent) and passed on to the children as warm start
+    """
+    def __init__(self, J: np.array, c: np.array, qudits_list: np.array, dual_iterations=10):
+        J = np.asarray(J, dtype=float)
+        J = 0.5 * (J + J.T)
+        self.c = c
+        self.diagonal = np.diag(J).copy()
+        self.off = J - np.diag(self.diagonal)
+        self.abs_off = np.abs(self.off)
+        self.upper = np.asarray(qudits_list) - 1
+        self.values = np.arange(np.max(qudits_list), dtype=float)
+        self.dual_iterations = dual_iterations
+        self.nodes = 0
+
+    def value(self, x: np.array):
+        return float(x @ (self.c + self.diagonal * x + self.off @ x))
+
+    def _restricted(self, lo: np.array, hi: np.array, g: np.array, center=None):
+        """
+        (n, d) table of c_i v + J_ii v^2 + g_i (v - center_i) for the values v of the domains, inf outside [lo_i, hi_i]
+        """
+        v = self.values[None, :]
+        table = self.c[:, None] * v + self.diagonal[:, None] * v**2 + g[:, None] * (v if center is None else v - center[:, None])
+        table[(v < lo[:, None]) | (v > hi[:, None])] = np.inf
+        return table
+
+    def tighten(self, lo: np.array, hi: np.array):
+        while True:
+            low_products = self.off * lo[None, :]
+            high_products = self.off * hi[None, :]
+            g_min = 2. * np.sum(np.minimum(low_products, high_products), axis=1)
+            g_max = 2. * np.sum(np.maximum(low_products, high_products), axis=1)
+            # smallest best response to the largest field and largest best response to the smallest field
+            new_lo = np.argmin(self._restricted(lo, hi, g_max), axis=1)
+            table = self._restricted(lo, hi, g_min)
+            new_hi = table.shape[1] - 1 - np.argmin(table[:, ::-1], axis=1)
+            new_lo = np.maximum(lo, new_lo)
+            new_hi = np.minimum(hi, new_hi)
+            if np.array_equal(new_lo, lo) and np.array_equal(new_hi, hi):
+                return lo, hi
+            lo, hi = new_lo, new_hi
+
+    def lower_bound(self, lo: np.array, hi: np.array):
+        center = 0.5 * (lo + hi)
+        radius = 0.5 * (hi - lo)
+        g = 2. * (self.off @ center)
+        bound = float(center @ self.off @ center) + np.sum(np.min(self._restricted(lo, hi, g, center), axis=1))
+        pair_bound = -float(radius @ self.abs_off @ radius)
+        free = np.flatnonzero(radius > 0.)
+        eigen_bound = -np.inf
+        if len(free) > 1:
+            R = radius[free]
+            smallest = np.linalg.eigvalsh(R[:, None] * self.off[np.ix_(free, free)] * R[None, :])[0]
+            eigen_bound = min(smallest, 0.) * len(free)
+        return bound + max(pair_bound, eigen_bound)
+
+    def dual_bound(self, lo: np.array, hi: np.array, best: float, D: np.array):
+        """
+        homogenized eigenvalue bound for boxes whose free variables are all concave, returns (bound, improved D)
+        D holds one entry for the homogenizing variable and one per qudit
+        """
+        free = np.flatnonzero(hi > lo)
+        center = 0.5 * (lo + hi)
+        g = 2. * (self.off @ center)
+        f_lo = self.c * lo + self.diagonal * lo**2 + g * (lo - center)
+        f_hi = self.c * hi + self.diagonal * hi**2 + g * (hi - center)
+        const = float(center @ self.off @ center) + np.sum(np.where(hi > lo, 0.5 * (f_lo + f_hi), f_lo))
+        R = 0.5 * (hi - lo)[free]
+        k = len(free)
+        M = np.zeros((k + 1, k + 1))
+        M[1:, 1:] = R[:, None] * self.off[np.ix_(free, free)] * R[None, :]
+        M[0, 1:] = M[1:, 0] = 0.25 * (f_hi - f_lo)[free]
+        sub = np.concatenate(([0], free + 1))
+        d = D[sub]
+        best_phi = -np.inf
+        best_d = d
+        for _ in range(self.dual_iterations):
+            eigenvalues, eigenvectors = np.linalg.eigh(M + np.diag(d))
+            phi = (k + 1) * eigenvalues[0] - np.sum(d)
+            if phi > best_phi:
+                best_phi, best_d = phi, d
+            if const + best_phi >= best:
+                break
+            supergradient = (k + 1) * eigenvectors[:, 0]**2 - 1.
+            norm = supergradient @ supergradient
+            if norm < 1.e-14:
+                break
+            d = d + (best - const - phi) / norm * supergradient
+        D = D.copy()
+        D[sub] = best_d
+        return const + best_phi, D
+
+    def local_search(self, x: np.array):
+        """
+        best-response sweeps until no single variable change improves x
+        """
+        x = x.copy()
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(x)):
+                field = self.c[i] + 2. * (self.off[i] @ x)
+                candidates = self.values[:self.upper[i] + 1]
+                best = int(np.argmin(candidates * field + self.diagonal[i] * candidates**2))
+                if best != x[i] and best * field + self.diagonal[i] * best**2 < x[i] * field + self.diagonal[i] * x[i]**2:
+                    x[i] = best
+                    improved = True
+        return x
+
+    def minimize(self):
+        best_x = None
+        best = np.inf
+        for start in [np.zeros_like(self.upper), self.upper.copy(), self.upper // 2]:
+            x = self.local_search(start)
+            if self.value(x) < best:
+                best, best_x = self.value(x), x
+        stack = [(np.zeros_like(self.upper), self.upper.copy(), np.zeros(len(self.upper) + 1))]
+        while stack:
+            lo, hi, D = stack.pop()
+            self.nodes += 1
+            lo, hi = self.tighten(lo, hi)
+            if np.array_equal(lo, hi):
+                if self.value(lo) < best:
+                    best, best_x = self.value(lo), lo
+                continue
+            prune_level = best - 1.e-12 * (1. + abs(best))
+            if self.lower_bound(lo, hi) >= prune_level:
+                continue
+            free = hi > lo
+            if np.sum(free) > 1 and np.all(self.diagonal[free] <= 0.):
+                bound, D = self.dual_bound(lo, hi, best, D)
+                if bound >= prune_level:
+                    continue
+            width = hi - lo
+            i = int(np.argmax(width * (self.abs_off @ width + np.abs(self.c) + np.abs(self.diagonal) * width)))
+            if self.diagonal[i] <= 0.:
+                splits = [(lo[i], lo[i]), (hi[i], hi[i])]
+            else:
+                split = (lo[i] + hi[i]) // 2
+                splits = [(lo[i], split), (split + 1, hi[i])]
+            # the child containing the better end for the field at the box centre is explored first (pushed last)
+            if self.c[i] + 2. * (self.off[i] @ (0.5 * (lo + hi))) < 0.:
+                splits = splits[::-1]
+            for child_lo, child_hi in splits:
+                lo_child = lo.copy()
+                hi_child = hi.copy()
+                lo_child[i] = child_lo
+                hi_child[i] = child_hi
+                stack.append((lo_child, hi_child, D))
+        return best_x
+
+
+def minimize_objective(coefficients: list, qudits_list: np.array):
+    """
+    exact minimum of one objective given by its linear [c, m] or quadratic [J, c, m] coefficients over all qudit configurations
+    returns (minimum, configuration attaining it)
+    """
+    qudits_list = np.asarray(qudits_list)
+    J, c, m = _split_coefficients(coefficients)
+    ring = _ring_structure(J, len(qudits_list))
+    if ring is not None:
+        x = _minimize_ring(ring[0], c, ring[1], qudits_list)
+    else:
+        x = _DenseMinimizer(J, c, qudits_list).minimize()
+    return _objective_value(J, c, m, x), x
+
+
+def maximize_objective(coefficients: list, qudits_list: np.array):
+    """
+    exact maximum of one objective, returns (maximum, configuration attaining it)
+    """
+    J, c, m = _split_coefficients(coefficients)
+    negated = [-c, -m] if J is None else [-1. * J if not prob._is_structured(J) else J / -1., -c, -m]
+    value, x = minimize_objective(negated, qudits_list)
+    return _objective_value(J, c, m, x), x
+
+
+def objective_bounds(cost_coefficients: list, qudits_list: np.array):
+    """
+    exact minimum and maximum of every objective of a problem instance, e.g. to check the normalization of the generators
+    instant for linear and ring-coupled objectives, tens of seconds per all-to-all objective pair at 40 qubits (see above)
+    returns a list with (minimum, argmin configuration, maximum, argmax configuration) for each objective
+    """
+    bounds = []
+    for coefficients in cost_coefficients:
+        minimum, argmin = minimize_objective(coefficients, qudits_list)
+        maximum, argmax = maximize_objective(coefficients, qudits_list)
+        bounds.append((minimum, argmin, maximum, argmax))
+    return bounds
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Objective statistics from measurement counts: every distinct measured configuration is evaluated once for all objectives
+# and weighted by its number of shots, instead of evaluating every shot.
+
+
+import sys
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+def _config_from_key(key, qudits_list: np.array, little_endian: bool):
+    """
+    configuration of one counts key: a state vector index (int), a string with one digit per qudit ('0121')
+    or with separated values for qudits of dimension > 10 ('0 11 3' or '0,11,3')
+    """
+    if isinstance(key, (int, np.integer)):
+        return prob.MixedRadixCodec(qudits_list, 'lsb' if little_endian else 'msb').decode(key, np.int64)
+    else:
+        key = key.replace(',', ' ')
+        config = np.asarray([int(v) for v in (key.split() if ' ' in key.strip() else key.strip())])
+    if len(config) != len(qudits_list):
+        print(f'ERROR: measured state {key} does not match the {len(qudits_list)} qudits!')
+        sys.exit(8)
+    return config[::-1] if little_endian else config
+
+
+def unique_states(counts, qudits_list: np.array, little_endian=False):
+    """
+    (configs (U,n), counts (U,)) of the distinct measured configurations
+    counts is a mapping from measured state to number of shots or a pair (states, counts) with states given as (B,n) configurations
+    or (B,) state vector indices; repeated states are merged
+    little_endian=True reads the first qudit from the last digit (or as least significant digit of an index), as e.g. in Qiskit bitstrings
+    """
+    qudits_list = np.asarray(qudits_list)
+    if isinstance(counts, dict):
+        configs = np.asarray([_config_from_key(key, qudits_list, little_endian) for key in counts], dtype=np.int64)
+        shots = np.asarray(list(counts.values()), dtype=np.float64)
+    else:
+        states, shots = counts
+        states = np.asarray(states)
+        shots = np.asarray(shots, dtype=np.float64)
+        if states.ndim == 1:
+            configs = prob.MixedRadixCodec(qudits_list, 'lsb' if little_endian else 'msb').decode(states, np.int64)
+        else:
+            configs = states[:, ::-1] if little_endian else states
+    configs, inverse = np.unique(configs.reshape(len(shots), len(qudits_list)), axis=0, return_inverse=True)
+    return configs, np.bincount(inverse.ravel(), weights=shots, minlength=len(configs))
+
+
+def count_statistics(problem, counts, qudits_list=None, alpha=0.1, little_endian=False, chunk_size=None):
+    """
+    shot-weighted mean, variance and CVaR_alpha (mean of the alpha fraction of shots with the lowest values) of each objective
+    problem is a ProblemInstance or a coefficient list (then qudits_list is required), counts as for unique_states
+    returns a dict with 'mean', 'variance' and 'cvar' (each of shape (K,)), 'num_shots' and 'num_unique'
+    """
+    if not 0. < alpha <= 1.:
+        print(f'ERROR: CVaR fraction alpha={alpha} must be in (0, 1]!')
+        sys.exit(8)
+    if isinstance(problem, prob.ProblemInstance):
+        qudits_list = problem.qudits if qudits_list is None else qudits_list
+        configs, shots = unique_states(counts, qudits_list, little_endian)
+        values = problem.evaluate_batched(configs, chunk_size)
+    else:
+        configs, shots = unique_states(counts, qudits_list, little_endian)
+        values = prob.calculate_cost_functions_batched(configs, problem, chunk_size)
+    num_shots = np.sum(shots)
+    mean = shots @ values / num_shots
+    variance = shots @ (values - mean)**2 / num_shots
+    # the alpha*num_shots lowest shots of every objective, the last unique value is taken with the fraction of its shots that is needed
+    tail = alpha * num_shots
+    order = np.argsort(values, axis=0, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=0)
+    sorted_shots = shots[order]
+    before = np.cumsum(sorted_shots, axis=0) - sorted_shots
+    taken = np.clip(tail - before, 0., sorted_shots)
+    cvar = np.sum(taken * sorted_values, axis=0) / tail
+    return {'mean': mean, 'variance': variance, 'cvar': cvar, 'num_shots': num_shots, 'num_unique': len(configs)}
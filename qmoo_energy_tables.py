@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+
+
+import json
+import struct
+import sys
+import time
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+# binary layout of an energy table file:
+#   8 bytes magic, 4 bytes little-endian length of the JSON header, JSON header, zero padding up to DATA_ALIGNMENT bytes,
+#   then the K objective columns one after the other (column-major), each with one entry per state vector index.
+# The configuration of a row follows from its index (first qudit is the most significant digit, as np.unravel_index).
+MAGIC = b'QMOOTBL1'
+DATA_ALIGNMENT = 64
+
+
+def _data_offset(header_bytes: bytes):
+    offset = len(MAGIC) + 4 + len(header_bytes)
+    return offset + (-offset) % DATA_ALIGNMENT
+
+
+def _make_header(problem_name: str, qudits_list: np.array, seed: int, reference_point, num_objs: int, dtype):
+    return {
+        'problem_name': problem_name,
+        'qudits': [int(q) for q in qudits_list],
+        'seed': int(seed),
+        'reference_point': [float(r) for r in reference_point],
+        'num_objs': int(num_objs),
+        'num_states': int(np.prod(qudits_list)),
+        'dtype': np.dtype(dtype).str,
+    }
+
+
+def _create_table_file(filename: str, header: dict):
+    """
+    writes magic and header and returns a writable (K, D) memory map of the objective columns
+    """
+    header_bytes = json.dumps(header).encode('utf-8')
+    offset = _data_offset(header_bytes)
+    with open(filename, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        f.write(b'\0' * (offset - len(MAGIC) - 4 - len(header_bytes)))
+    return np.memmap(filename, dtype=np.dtype(header['dtype']), mode='r+', offset=offset,
+                     shape=(header['num_objs'], header['num_states']))
+
+
+def write_energy_table(filename: str, energies: np.array, problem_name: str, qudits_list: np.array, seed: int, reference_point, dtype=np.float64):
+    """
+    writes the (D,K) array of objectives of all states (rows ordered by state vector index) as binary energy table
+    """
+    energies = np.asarray(energies)
+    header = _make_header(problem_name, qudits_list, seed, reference_point, energies.shape[1], dtype)
+    if energies.shape[0] != header['num_states']:
+        print(f'ERROR: energy table has {energies.shape[0]} rows, the qudit system has {header["num_states"]} states!')
+        sys.exit(8)
+    columns = _create_table_file(filename, header)
+    columns[:] = energies.T
+    columns.flush()
+    del columns
+
+
+def write_energy_table_from_enumeration(filename: str, cost_coefficients: list, problem_name: str, qudits_list: np.array, seed: int, reference_point,
+                                        dtype=np.float64, chunk_size=2**16):
+    """
+    enumerates all states of a problem instance and writes the objectives block by block into a binary energy table,
+    the full table is never held in memory
+    an active instrumentation counts the evaluations under the key of the instance and times the evaluate and write stages
+    """
+    instrumentation = prob.get_instrumentation()
+    header = _make_header(problem_name, qudits_list, seed, reference_point, len(cost_coefficients), dtype)
+    columns = _create_table_file(filename, header)
+    instance_key = prob.instrumentation_key(problem_name, qudits_list, seed)
+    for start, configs, energies in prob.iter_all_states(cost_coefficients, qudits_list, chunk_size, instance_key):
+        if instrumentation is not None:
+            start_time = time.perf_counter()
+        columns[:, start:start + len(configs)] = energies.T
+        if instrumentation is not None:
+            instrumentation.add_time('write', time.perf_counter() - start_time)
+    if instrumentation is not None:
+        start_time = time.perf_counter()
+    columns.flush()
+    del columns
+    if instrumentation is not None:
+        instrumentation.add_time('write', time.perf_counter() - start_time)
+
+
+class EnergyTable:
+    """
+    memory-mapped read access to a binary energy table
+    the header entries are available as attributes, the objectives as (K,D) memory map in columns
+    """
+    def __init__(self, filename: str):
+        with open(filename, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                print(f'ERROR: {filename} is not a qmoo energy table!')
+                sys.exit(8)
+            header_length = struct.unpack('<I', f.read(4))[0]
+            header_bytes = f.read(header_length)
+        self.filename = filename
+        self.header = json.loads(header_bytes.decode('utf-8'))
+        self.problem_name = self.header['problem_name']
+        self.qudits = np.asarray(self.header['qudits'])
+        self.seed = self.header['seed']
+        self.reference_point = self.header['reference_point']
+        self.num_objs = self.header['num_objs']
+        self.num_states = self.header['num_states']
+        self.columns = np.memmap(filename, dtype=np.dtype(self.header['dtype']), mode='r', offset=_data_offset(header_bytes),
+                                 shape=(self.num_objs, self.num_states))
+
+    def __len__(self):
+        return self.num_states
+
+    def objective(self, k: int):
+        """
+        memory-mapped column of objective k for all states, nothing is read before it is accessed
+        """
+        return self.columns[k]
+
+    def energies(self, indices=None):
+        """
+        (B,K) array of the objectives of the given state indices (all states if indices is None)
+        """
+        if indices is None:
+            return np.asarray(self.columns).T
+        return np.asarray(self.columns[:, indices]).T
+
+    def configs(self, indices: np.array):
+        """
+        qudit configurations of the given state indices
+        """
+        return prob.MixedRadixCodec(self.qudits).decode(np.atleast_1d(indices))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Bounded LRU cache in front of the objective evaluation. A configuration is keyed by its state vector index
+# (mixed-radix number of the qudit values, first qudit most significant) and all K objective values are stored together in one row,
+# so samplers and evolutionary algorithms which revisit configurations only pay for the quadratic form once.
+# A batch is looked up at once and only its distinct missing configurations are evaluated, in one batched call.
+
+
+import collections
+import sys
+import threading
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+class EvaluationCache:
+    """
+    LRU cache of the objective vectors of a ProblemInstance or a coefficient list (then qudits_list is required)
+    at most max_size configurations are kept, the least recently used one is evicted first
+    hits counts looked-up configurations which needed no evaluation (also repeats of a missing configuration within one batch),
+    misses the evaluated configurations
+    """
+    def __init__(self, problem, qudits_list=None, max_size=2**16):
+        if isinstance(problem, prob.ProblemInstance):
+            self._evaluate = problem.evaluate_batched
+            cost_coefficients = problem.cost_coefficients
+            qudits_list = problem.qudits if qudits_list is None else qudits_list
+        else:
+            self._evaluate = lambda X: prob.calculate_cost_functions_batched(X, problem)
+            cost_coefficients = problem
+        if qudits_list is None:
+            print('ERROR: the evaluation cache of a coefficient list needs the qudits!')
+            sys.exit(8)
+        if max_size < 1:
+            print(f'ERROR: cache size {max_size} must be positive!')
+            sys.exit(8)
+        self.qudits = np.asarray(qudits_list)
+        self.num_objs = len(cost_coefficients)
+        self.max_size = int(max_size)
+        self.dtype = prob.coefficient_dtype(cost_coefficients)
+        # state vector indices are packed up to 2^64 states, larger systems are keyed by the bytes of the configuration
+        self._packed = float(np.prod(self.qudits.astype(float))) <= 2.**64
+        self.codec = prob.MixedRadixCodec(self.qudits) if self._packed else None
+        # signed strides for the fast single lookup, np.dot of int64 and uint64 would give floats
+        self._strides = self.codec.strides.astype(np.int64) if self._packed and self.codec.num_states <= 2**63 else None
+        # rows of the stored objective vectors, grown by doubling up to max_size
+        self._values = np.empty((min(self.max_size, 1024), self.num_objs), dtype=self.dtype)
+        self._slots = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def keys(self, X: np.array):
+        """
+        cache keys of the (N,n) configurations: state vector indices, or row bytes for more than 2^64 states
+        """
+        if self._packed:
+            return self.codec.encode(X)
+        X = np.ascontiguousarray(X, dtype=np.int64)
+        return X.view(np.dtype((np.void, X.itemsize * X.shape[1]))).ravel()
+
+    def evaluate(self, x: np.array):
+        """
+        vector of all K objectives for one search vector x
+        """
+        x = np.asarray(x)
+        if self._strides is not None:
+            # single lookups skip the np.unique of the batched path
+            key = int(np.dot(x, self._strides))
+            with self._lock:
+                slot = self._slots.get(key)
+                if slot is not None:
+                    self._slots.move_to_end(key)
+                    self.hits += 1
+                    return self._values[slot].copy()
+        return self.evaluate_batched(x[np.newaxis, :])[0]
+
+    def evaluate_batched(self, X: np.array):
+        """
+        (N,K) array of all objectives for the (N,n) array of configurations X, only the distinct configurations not in the cache are evaluated
+        """
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        unique_keys, first, inverse = np.unique(self.keys(X), return_index=True, return_inverse=True)
+        unique_keys = unique_keys.tolist() if self._packed else [key.tobytes() for key in unique_keys]
+        values = np.empty((len(unique_keys), self.num_objs), dtype=self.dtype)
+
+        # hits are copied out under the lock, so a concurrent eviction cannot overwrite their rows while the misses are evaluated
+        missing = []
+        with self._lock:
+            hit_positions = []
+            hit_slots = []
+            for j, key in enumerate(unique_keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    missing.append(j)
+                else:
+                    self._slots.move_to_end(key)
+                    hit_positions.append(j)
+                    hit_slots.append(slot)
+            values[hit_positions] = self._values[hit_slots]
+            self.hits += len(X) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            values[missing] = self._evaluate(X[first[missing]])
+            with self._lock:
+                for j in missing:
+                    self._insert(unique_keys[j], values[j])
+        return values[inverse.ravel()]
+
+    def _insert(self, key, value: np.array):
+        slot = self._slots.get(key)
+        if slot is not None:
+            # inserted by another thread in the meantime
+            self._slots.move_to_end(key)
+        elif len(self._slots) >= self.max_size:
+            _, slot = self._slots.popitem(last=False)
+            self.evictions += 1
+        else:
+            slot = len(self._slots)
+            if slot == len(self._values):
+                grown = np.empty((min(2 * len(self._values), self.max_size), self.num_objs), dtype=self.dtype)
+                grown[:slot] = self._values
+                self._values = grown
+        self._slots[key] = slot
+        self._values[slot] = value
+
+    def statistics(self):
+        """
+        dict with hits, misses, evictions, current size, max_size and hit_rate (hits per looked-up configuration)
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self._slots),
+                    'max_size': self.max_size, 'hit_rate': self.hits / lookups if lookups > 0 else 0.}
+
+    def clear(self):
+        """
+        removes all entries and resets the statistics
+        """
+        with self._lock:
+            self._slots.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
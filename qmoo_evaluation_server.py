@@ -0,0 +1,386 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Local evaluation service for many optimizer workers on the same problem instances. The server loads every instance once,
+# collects the requests which arrive within max_delay seconds per instance into one batched evaluation and returns the (N,K)
+# objectives of each request. It listens on a local TCP port or a Unix socket:
+#
+#   python qmoo_evaluation_server.py --port 8765
+#   python qmoo_evaluation_server.py --unix-socket /tmp/qmoo.sock --cache-dir qmoo_cache
+#
+# and workers evaluate with
+#
+#   with EvaluationClient(('127.0.0.1', 8765)) as client:
+#       objs = client.evaluate('problem_FM_AFM_two_objs', qudits, seed, X)
+#
+# Messages are a 4 byte little-endian length, a JSON header and the raw bytes of the array described in the header.
+# A request holds problem name, qudits, seed and the (N,n) configurations (sent in the smallest unsigned dtype),
+# the response the (N,K) objectives or an error message.
+
+
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import sys
+import threading
+import numpy as np
+import qmoo_benchmark_functions as prob
+import qmoo_instance_cache as instance_cache
+
+
+def _encode_message(header: dict, array=None):
+    if array is not None:
+        header = dict(header, shape=list(array.shape), dtype=array.dtype.str)
+    header_bytes = json.dumps(header).encode('utf-8')
+    payload = b'' if array is None else np.ascontiguousarray(array).tobytes()
+    return struct.pack('<I', len(header_bytes)) + header_bytes + struct.pack('<Q', len(payload)) + payload
+
+
+def _decode_array(header: dict, payload: bytes):
+    if 'shape' not in header:
+        return None
+    return np.frombuffer(payload, dtype=np.dtype(header['dtype'])).reshape(header['shape'])
+
+
+async def _read_message(reader: asyncio.StreamReader):
+    """
+    raw header and payload bytes of one message, they are decoded separately so a malformed message still leaves the stream in sync
+    """
+    header_length = struct.unpack('<I', await reader.readexactly(4))[0]
+    header_bytes = await reader.readexactly(header_length)
+    payload_length = struct.unpack('<Q', await reader.readexactly(8))[0]
+    return header_bytes, await reader.readexactly(payload_length)
+
+
+def _recv_exactly(sock: socket.socket, length: int):
+    chunks = []
+    while length > 0:
+        chunk = sock.recv(min(length, 2**20))
+        if not chunk:
+            raise ConnectionError('connection closed by the evaluation server')
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+
+def _evaluation_request(problem_name: str, qudits_list: np.array, seed: int, X: np.array):
+    codec = prob.MixedRadixCodec(qudits_list)
+    X = np.asarray(X)
+    if X.ndim == 1:
+        X = X[np.newaxis, :]
+    # checked before the cast to the unsigned digit dtype, which would turn -1 into a valid looking 255
+    if X.ndim != 2 or X.shape[1] != len(qudits_list) or (X.size > 0 and (X.min() < 0 or np.any(X >= np.asarray(qudits_list)))):
+        print(f'ERROR: configurations must be an (N,{len(qudits_list)}) array with 0 <= x_i < d_i!')
+        sys.exit(8)
+    header = {'problem_name': problem_name, 'qudits': [int(q) for q in qudits_list], 'seed': int(seed)}
+    return _encode_message(header, X.astype(codec.digit_dtype))
+
+
+def _evaluation_result(header: dict, objectives: np.array):
+    if header['status'] != 'ok':
+        print(f'ERROR: evaluation server: {header["message"]}')
+        sys.exit(8)
+    return objectives.copy()
+
+
+class _RequestError(Exception):
+    pass
+
+
+class _Batcher:
+    """
+    collects the requests of one instance and evaluates them together
+    """
+    def __init__(self, instance, max_batch_size: int, max_delay: float, statistics: dict):
+        self.instance = instance
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.statistics = statistics
+        self.pending = []
+        self.num_rows = 0
+        self.event = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, X: np.array):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((X, future))
+        self.num_rows += len(X)
+        self.event.set()
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.event.wait()
+            # requests of concurrent workers arriving within max_delay join the batch
+            if self.num_rows < self.max_batch_size and self.max_delay > 0.:
+                await asyncio.sleep(self.max_delay)
+            batch, self.pending, self.num_rows = self.pending, [], 0
+            self.event.clear()
+            X = np.concatenate([x for x, _ in batch])
+            try:
+                # numpy releases the GIL in the matrix products, the event loop keeps accepting requests meanwhile
+                objectives = await loop.run_in_executor(None, self.instance.evaluate_batched, X)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(_RequestError(f'evaluation failed: {e}'))
+                continue
+            self.statistics['batches'] += 1
+            self.statistics['rows'] += len(X)
+            start = 0
+            for x, future in batch:
+                if not future.cancelled():
+                    future.set_result(objectives[start:start + len(x)])
+                start += len(x)
+
+
+class EvaluationServer:
+    """
+    asyncio server which evaluates the registered problems for local clients
+    listens on host:port (port 0: any free port) or on the Unix socket path, address holds the actual address after start
+    instances are generated once (or loaded memory-mapped from cache_dir, see qmoo_instance_cache) and kept while the server runs
+    requests for the same instance arriving within max_delay seconds are evaluated in one batched call
+    """
+    def __init__(self, host='127.0.0.1', port=0, path=None, max_batch_size=2**16, max_delay=0.001, cache_dir=None):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.cache_dir = cache_dir
+        self.address = None
+        self._server = None
+        self._batchers = dict()
+        self._connections = set()
+        self._thread = None
+        self._loop = None
+        self.statistics = {'requests': 0, 'batches': 0, 'rows': 0}
+
+    async def start(self):
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+            self.address = self.path
+        else:
+            self._server = await asyncio.start_server(self._handle, host=self.host, port=self.port)
+            self.address = self._server.sockets[0].getsockname()[:2]
+        return self.address
+
+    async def close(self):
+        self._server.close()
+        tasks = list(self._connections) + [batcher.task for batcher in self._batchers.values() if isinstance(batcher, _Batcher)]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self._server.wait_closed()
+        self._batchers.clear()
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        await self._server.serve_forever()
+
+    def start_in_thread(self):
+        """
+        runs the server in its own event loop in a daemon thread (e.g. for tests or a server inside the optimizer process)
+        returns the address once the server listens
+        """
+        started = threading.Event()
+
+        def _run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=_run, daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.address
+
+    def stop_thread(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    async def _batcher(self, problem_name: str, qudits: tuple, seed: int):
+        key = (problem_name, qudits, seed)
+        if key not in self._batchers:
+            if problem_name not in prob.PROBLEM_REGISTRY:
+                raise _RequestError(f'problem {problem_name}  not defined')
+            # a placeholder future keeps concurrent first requests from generating the instance twice
+            loading = asyncio.get_running_loop().create_future()
+            self._batchers[key] = loading
+            try:
+                if self.cache_dir is not None:
+                    instance = await asyncio.get_running_loop().run_in_executor(
+                        None, instance_cache.cached_problem_instance, problem_name, np.asarray(qudits), seed, self.cache_dir)
+                else:
+                    instance = await asyncio.get_running_loop().run_in_executor(
+                        None, prob.get_problem_instance, problem_name, np.asarray(qudits), seed)
+            except (Exception, SystemExit, asyncio.CancelledError) as e:
+                # the generators report invalid instances with sys.exit, which must not stop the server
+                del self._batchers[key]
+                error = _RequestError(f'instance {problem_name} {list(qudits)} seed {seed} could not be loaded')
+                loading.set_exception(error)
+                # retrieved here, so a placeholder nobody waited for is not reported as unhandled
+                loading.exception()
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise error
+            self._batchers[key] = _Batcher(instance, self.max_batch_size, self.max_delay, self.statistics)
+            loading.set_result(self._batchers[key])
+        batcher = self._batchers[key]
+        if isinstance(batcher, asyncio.Future):
+            batcher = await asyncio.shield(batcher)
+        return batcher
+
+    async def _evaluate(self, header: dict, X: np.array):
+        qudits = tuple(int(q) for q in header['qudits'])
+        if X is None or X.ndim != 2 or X.shape[1] != len(qudits):
+            raise _RequestError(f'configurations must be an (N,{len(qudits)}) array')
+        if X.dtype.kind not in 'iu':
+            raise _RequestError(f'configurations must be integers, got dtype {X.dtype}')
+        # invalid requests are rejected here, in a batch they would fail the valid requests of the other clients as well
+        if X.size > 0 and (X.min() < 0 or np.any(X >= np.asarray(qudits))):
+            raise _RequestError(f'configurations out of range, qudit values must be 0 <= x_i < d_i for qudits {list(qudits)}')
+        batcher = await self._batcher(header['problem_name'], qudits, int(header['seed']))
+        self.statistics['requests'] += 1
+        return await batcher.submit(X)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(asyncio.current_task())
+        try:
+            while True:
+                try:
+                    header_bytes, payload = await _read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                try:
+                    header = json.loads(header_bytes.decode('utf-8'))
+                    if not isinstance(header, dict):
+                        raise _RequestError('the message header must be a JSON object')
+                    X = _decode_array(header, payload)
+                    writer.write(_encode_message({'status': 'ok'}, await self._evaluate(header, X)))
+                except (_RequestError, KeyError, ValueError, TypeError) as e:
+                    writer.write(_encode_message({'status': 'error', 'message': f'invalid request: {e!r}' if not isinstance(e, _RequestError) else str(e)}))
+                await writer.drain()
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            self._connections.discard(asyncio.current_task())
+            writer.close()
+
+
+class EvaluationClient:
+    """
+    blocking client of an EvaluationServer, address is (host, port) or the path of a Unix socket
+    """
+    def __init__(self, address):
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.connect(tuple(address) if not isinstance(address, str) else address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._socket.close()
+
+    def evaluate(self, problem_name: str, qudits_list: np.array, seed: int, X: np.array):
+        """
+        (N,K) objectives of the (N,n) configurations X of the instance (problem name, qudits, seed)
+        """
+        return _evaluation_result(*self._exchange(_evaluation_request(problem_name, qudits_list, seed, X)))
+
+    def _exchange(self, message: bytes):
+        """
+        sends one encoded message and returns the header and array of the response
+        """
+        self._socket.sendall(message)
+        header_length = struct.unpack('<I', _recv_exactly(self._socket, 4))[0]
+        header = json.loads(_recv_exactly(self._socket, header_length).decode('utf-8'))
+        payload_length = struct.unpack('<Q', _recv_exactly(self._socket, 8))[0]
+        return header, _decode_array(header, _recv_exactly(self._socket, payload_length))
+
+
+class AsyncEvaluationClient:
+    """
+    asyncio client of an EvaluationServer, one request at a time per client (open several clients for concurrent requests)
+    """
+    def __init__(self, address):
+        self.address = address
+        self._reader = None
+        self._writer = None
+
+    async def connect(self):
+        if isinstance(self.address, str):
+            self._reader, self._writer = await asyncio.open_unix_connection(self.address)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(*self.address)
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    async def evaluate(self, problem_name: str, qudits_list: np.array, seed: int, X: np.array):
+        """
+        (N,K) objectives of the (N,n) configurations X of the instance (problem name, qudits, seed)
+        """
+        self._writer.write(_evaluation_request(problem_name, qudits_list, seed, X))
+        await self._writer.drain()
+        header_bytes, payload = await _read_message(self._reader)
+        header = json.loads(header_bytes.decode('utf-8'))
+        return _evaluation_result(header, _decode_array(header, payload))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='local batching evaluation server for QMOO benchmark problems')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix-socket', default=None, help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=2**16)
+    parser.add_argument('--max-delay', type=float, default=0.001, help='seconds to wait for further requests before a batch is evaluated')
+    parser.add_argument('--cache-dir', default=None, help='load instances memory-mapped from this qmoo_instance_cache directory')
+    args = parser.parse_args(argv)
+
+    server = EvaluationServer(args.host, args.port, args.unix_socket, args.max_batch_size, args.max_delay, args.cache_dir)
+
+    async def _serve():
+        print(f'listening on {await server.start()}')
+        await server.serve_forever()
+
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
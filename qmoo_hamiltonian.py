@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Objectives as diagonal Hamiltonians: the value of an objective for every basis state of the qudit system, in state vector order
+# (first qudit is the most significant digit as np.unravel_index, or the least significant one with little_endian=True).
+# The diagonal is built as a Kronecker sum: writing f(x) = m + sum_i x_i (c_i + J_ii x_i + g_i(x_{i+1}, ..., x_{n-1})) with
+# g_i = sum_{j>i} (J_ij + J_ji) x_j, every term depends on qudit i and the later qudits only. The diagonal is assembled from the last
+# qudit on, so no configuration table is built and the cost is O(d^n) for a fixed qudit dimension.
+
+
+import sys
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+def _kronecker_sum(vectors: list):
+    """
+    sum_k vectors[k] (x_k) over all configurations of the qudits, as a flat array in state vector order
+    """
+    total = np.zeros(1)
+    for v in vectors:
+        total = (total[:, None] + v[None, :]).ravel()
+    return total
+
+
+def _dense_terms(coefficients: list, num_params: int):
+    """
+    (J, c, m) with a dense J (zero for linear objectives)
+    """
+    if len(coefficients) == 2:
+        return np.zeros((num_params, num_params)), np.asarray(coefficients[0], dtype=float), float(coefficients[1])
+    J = coefficients[0].toarray() if prob._is_structured(coefficients[0]) else np.asarray(coefficients[0], dtype=float)
+    return J, np.asarray(coefficients[1], dtype=float), float(coefficients[2])
+
+
+def objective_diagonal(coefficients: list, qudits_list: np.array, out=None, dtype=np.float64, little_endian=False):
+    """
+    values of one objective (linear [c, m] or quadratic [J, c, m] coefficients) for all d^n basis states in state vector order
+    out = optional preallocated array of d^n entries (its dtype is used, e.g. float32), otherwise a new array of dtype is returned
+    """
+    qudits_list = np.asarray(qudits_list)
+    J, c, m = _dense_terms(coefficients, len(qudits_list))
+    if little_endian:
+        qudits_list, J, c = qudits_list[::-1], J[::-1, ::-1], c[::-1]
+    hilbert_space_dimension = int(np.prod(qudits_list))
+    if out is None:
+        out = np.empty(hilbert_space_dimension, dtype=dtype)
+    if out.shape != (hilbert_space_dimension,):
+        print(f'ERROR: output buffer has shape {out.shape}, the qudit system has {hilbert_space_dimension} states!')
+        sys.exit(8)
+    values = [np.arange(q, dtype=float) for q in qudits_list]
+    coupling = J + J.T
+    # the sum R_i of m and the terms of the qudits i, ..., n-1 is built from the last qudit on in the first prod(q_i, ..., q_{n-1}) entries of out:
+    # R_i[a, :] = R_{i+1} + a (c_i + J_ii a + g_i), so every entry is written once per qudit it depends on
+    out[0] = m
+    size = 1
+    for i in reversed(range(len(qudits_list))):
+        field = _kronecker_sum([coupling[i, j] * values[j] for j in range(i + 1, len(qudits_list))])
+        blocks = out[:size * qudits_list[i]].reshape(qudits_list[i], size)
+        blocks[1:] = blocks[0]
+        for a in range(1, qudits_list[i]):
+            blocks[a] += a * (c[i] + J[i, i] * a + field)
+        size *= qudits_list[i]
+    return out
+
+
+def objective_diagonals(cost_coefficients: list, qudits_list: np.array, out=None, dtype=np.float64, little_endian=False):
+    """
+    (K, d^n) array with the diagonal of each objective in its rows, see objective_diagonal
+    out = optional preallocated (K, d^n) array, e.g. float32 to halve the memory
+    """
+    hilbert_space_dimension = int(np.prod(qudits_list))
+    if out is None:
+        out = np.empty((len(cost_coefficients), hilbert_space_dimension), dtype=dtype)
+    for k, coefficients in enumerate(cost_coefficients):
+        objective_diagonal(coefficients, qudits_list, out=out[k], little_endian=little_endian)
+    return out
+
+
+def expectation_values(diagonals: np.array, states: np.array, probabilities=False, chunk_size=16):
+    """
+    (B, K) expectation values of the K diagonal Hamiltonians (K, d^n) for the (B, d^n) batch of state vectors (amplitudes)
+    or, with probabilities=True, of probability vectors (e.g. sampled frequencies)
+    the squared amplitudes are formed for chunk_size states at a time, so no second (B, d^n) array is allocated
+    """
+    diagonals = np.atleast_2d(diagonals)
+    states = np.atleast_2d(states)
+    if probabilities:
+        return states @ diagonals.T
+    result = np.empty((len(states), len(diagonals)), dtype=np.result_type(diagonals.dtype, states.real.dtype))
+    for start in range(0, len(states), chunk_size):
+        chunk = states[start:start + chunk_size]
+        result[start:start + len(chunk)] = (chunk.real**2 + chunk.imag**2) @ diagonals.T
+    return result
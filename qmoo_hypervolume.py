@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Exact hypervolume of sets of objective vectors (all objectives are minimized) w.r.t. a reference point:
+#   2 objectives: sort by the first objective and sum the rectangles of the staircase
+#   3 objectives: sweep along the third objective and update the area of the 2D staircase on insertion
+#   more objectives: WFG, slicing along the last objective and subtracting the hypervolume of the limit sets
+
+
+import bisect
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+def _nondominated_unique(points: np.array):
+    """
+    distinct non-dominated points, only needed for WFG, the 2D and 3D algorithms skip dominated points themselves
+    """
+    if len(points) < 2 or points.shape[1] <= 3:
+        return points
+    # a point can only be weakly dominated by points with a smaller or equal sum, which come first after sorting (duplicates keep the first)
+    points = points[np.argsort(points.sum(axis=1), kind='stable')]
+    i = 0
+    while i < len(points) - 1:
+        keep = ~(points[i] <= points).all(axis=1)
+        keep[:i+1] = True
+        points = points[keep]
+        i += 1
+    return points
+
+
+def _prepare_points(points, reference_point):
+    """
+    float (N,K) array of the points which are better than the reference point in all objectives, the other points do not add to the hypervolume
+    """
+    reference_point = np.asarray(reference_point, dtype=np.float64)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, len(reference_point))
+    points = points[np.all(points < reference_point, axis=1)]
+    return _nondominated_unique(points), reference_point
+
+
+def _hypervolume_2d(points: np.array, reference_point: np.array):
+    order = np.lexsort((points[:, 1], points[:, 0]))
+    y_min = np.minimum.accumulate(points[order, 1])
+    y_before = np.concatenate(([reference_point[1]], y_min[:-1]))
+    return float(np.sum((reference_point[0] - points[order, 0]) * (y_before - y_min)))
+
+
+def _insert_staircase(xs: list, ys: list, x: float, y: float, reference_point: np.array):
+    """
+    inserts (x,y) into the 2D staircase xs (increasing), ys (decreasing), removes the points it dominates
+    and returns the area by which the dominated region grows
+    """
+    pos = bisect.bisect_left(xs, x)
+    if pos > 0 and ys[pos-1] <= y:
+        return 0.
+    if pos < len(xs) and xs[pos] == x and ys[pos] <= y:
+        return 0.
+    x_left = x
+    height = ys[pos-1] if pos > 0 else reference_point[1]
+    added = 0.
+    end = pos
+    while end < len(xs) and ys[end] >= y:
+        added += (xs[end] - x_left) * (height - y)
+        x_left = xs[end]
+        height = ys[end]
+        end += 1
+    x_right = xs[end] if end < len(xs) else reference_point[0]
+    added += (x_right - x_left) * (height - y)
+    xs[pos:end] = [x]
+    ys[pos:end] = [y]
+    return added
+
+
+def _hypervolume_3d(points: np.array, reference_point: np.array):
+    order = np.argsort(points[:, 2], kind='stable')
+    points = points[order].tolist()
+    xs = []
+    ys = []
+    area = 0.
+    volume = 0.
+    for i, (x, y, z) in enumerate(points):
+        area += _insert_staircase(xs, ys, x, y, reference_point)
+        z_next = points[i+1][2] if i + 1 < len(points) else reference_point[2]
+        volume += area * (z_next - z)
+    return volume
+
+
+def _exclusive_hypervolume(point: np.array, others: np.array, reference_point: np.array):
+    """
+    volume dominated by point and by none of the others (all better than the reference point)
+    """
+    volume = float((reference_point - point).prod())
+    if len(others) == 0:
+        return volume
+    if (others <= point).all(axis=1).any():
+        return 0.
+    limit_set = _nondominated_unique(np.maximum(point, others))
+    return volume - _hypervolume(limit_set, reference_point)
+
+
+def _hypervolume_wfg(points: np.array, reference_point: np.array):
+    # sorted by decreasing last objective, the limit set of a point and all later points has the last objective of the point,
+    # so each slice reduces to an exclusive hypervolume in one objective less
+    order = np.argsort(-points[:, -1], kind='stable')
+    points = points[order]
+    volume = 0.
+    for i in range(len(points)):
+        volume += (reference_point[-1] - points[i, -1]) * _exclusive_hypervolume(points[i, :-1], points[i+1:, :-1], reference_point[:-1])
+    return volume
+
+
+def _hypervolume(points: np.array, reference_point: np.array):
+    """
+    hypervolume of points which are all better than the reference point (distinct and non-dominated for more than 3 objectives)
+    """
+    if len(points) == 0:
+        return 0.
+    if len(points) == 1:
+        return float((reference_point - points[0]).prod())
+    num_objs = points.shape[1]
+    if num_objs == 1:
+        return float(reference_point[0] - np.min(points[:, 0]))
+    if num_objs == 2:
+        return _hypervolume_2d(points, reference_point)
+    if num_objs == 3:
+        return _hypervolume_3d(points, reference_point)
+    return _hypervolume_wfg(points, reference_point)
+
+
+def hypervolume(points: np.array, reference_point):
+    """
+    exact hypervolume dominated by the (N,K) objective vectors points and bounded by reference_point (all objectives are minimized)
+    points which are not better than the reference point in all objectives and dominated points do not contribute
+    """
+    points, reference_point = _prepare_points(points, reference_point)
+    return _hypervolume(points, reference_point)
+
+
+def problem_hypervolume(points: np.array, problem_name: str):
+    """
+    hypervolume of the (N,K) objective vectors points w.r.t. the reference point registered for problem_name
+    """
+    return hypervolume(points, prob.get_reference_point_for_qudit_config_and_problem_name(problem_name))
+
+
+class HypervolumeArchive:
+    """
+    archive of non-dominated objective vectors with its hypervolume w.r.t. reference_point and the exclusive contribution of each member
+    (the hypervolume lost if the member were removed), both updated incrementally when points are added
+    2 objectives: the members are kept as staircase sorted by the first objective, an insertion changes the contributions of its two neighbours only
+    more objectives: contributions are computed when they are read, an insertion invalidates only the members whose exclusive region it cuts
+    """
+    def __init__(self, reference_point, points=None):
+        self.reference_point = np.asarray(reference_point, dtype=np.float64)
+        self.hypervolume = 0.
+        # 2 objectives: staircase xs (increasing), ys (decreasing) and contributions as lists
+        self._xs = []
+        self._ys = []
+        self._contributions_2d = []
+        # more objectives: members, cached contributions and their validity
+        self._points = np.empty((0, len(self.reference_point)))
+        self._contributions = np.empty(0)
+        self._valid = np.empty(0, dtype=bool)
+        if points is not None:
+            self.add(points)
+
+    def __len__(self):
+        return len(self._xs) if len(self.reference_point) == 2 else len(self._points)
+
+    def _as_points(self, points):
+        return np.asarray(points, dtype=np.float64).reshape(-1, len(self.reference_point))
+
+    @property
+    def points(self):
+        """
+        (N,K) array of the members
+        """
+        if len(self.reference_point) == 2:
+            return np.column_stack((self._xs, self._ys)) if self._xs else np.empty((0, 2))
+        return self._points
+
+    @property
+    def contributions(self):
+        """
+        (N,) exclusive hypervolume contributions of the members (in the order of points)
+        """
+        if len(self.reference_point) == 2:
+            return np.array(self._contributions_2d)
+        for i in np.flatnonzero(~self._valid):
+            self._contributions[i] = max(_exclusive_hypervolume(self._points[i], np.delete(self._points, i, axis=0), self.reference_point), 0.)
+        self._valid[:] = True
+        return self._contributions
+
+    def improvements(self, candidates: np.array):
+        """
+        (B,) hypervolume improvement of each of the (B,K) candidates if it alone was added, the archive is not changed
+        """
+        candidates = self._as_points(candidates)
+        points = self.points
+        result = np.zeros(len(candidates))
+        for b in np.flatnonzero(np.all(candidates < self.reference_point, axis=1)):
+            result[b] = max(_exclusive_hypervolume(candidates[b], points, self.reference_point), 0.)
+        return result
+
+    def add(self, points: np.array):
+        """
+        adds the (B,K) objective vectors one after the other and returns their (B,) realized hypervolume improvements
+        points which are weakly dominated by the archive or not better than the reference point in all objectives are not added (improvement 0)
+        """
+        points = self._as_points(points)
+        result = np.zeros(len(points))
+        for b, point in enumerate(points):
+            if not np.all(point < self.reference_point):
+                continue
+            if len(self.reference_point) == 2:
+                result[b] = self._add_2d(point[0], point[1])
+            else:
+                result[b] = self._add_nd(point)
+            self.hypervolume += result[b]
+        return result
+
+    def _contribution_2d(self, i: int):
+        x_next = self._xs[i+1] if i + 1 < len(self._xs) else self.reference_point[0]
+        y_prev = self._ys[i-1] if i > 0 else self.reference_point[1]
+        return (x_next - self._xs[i]) * (y_prev - self._ys[i])
+
+    def _add_2d(self, x: float, y: float):
+        num_members = len(self._xs)
+        # the staircase insertion returns the added area, the improvement over the old archive
+        added = _insert_staircase(self._xs, self._ys, x, y, self.reference_point)
+        if added <= 0.:
+            return 0.
+        pos = bisect.bisect_left(self._xs, x)
+        # the members dominated by the new point were a contiguous run of the staircase starting at pos
+        num_removed = num_members + 1 - len(self._xs)
+        self._contributions_2d[pos:pos + num_removed] = [added]
+        # the regions freed by removed members are exclusive to the new point, so its contribution can exceed the improvement
+        for i in (pos - 1, pos, pos + 1):
+            if 0 <= i < len(self._xs):
+                self._contributions_2d[i] = self._contribution_2d(i)
+        return added
+
+    def _add_nd(self, point: np.array, block_size=256):
+        if np.any(np.all(self._points <= point, axis=1)):
+            return 0.
+        added = max(_exclusive_hypervolume(point, self._points, self.reference_point), 0.)
+        # the new point cuts the region of max(member, point) out of the exclusive region of a member,
+        # which changes nothing if another old member weakly dominates max(member, point)
+        survivors = np.flatnonzero(~np.all(point <= self._points, axis=1))
+        affected = np.empty(len(survivors), dtype=bool)
+        for start in range(0, len(survivors), block_size):
+            members = survivors[start:start + block_size]
+            corners = np.maximum(self._points[members], point)
+            covered = np.all(self._points[np.newaxis, :, :] <= corners[:, np.newaxis, :], axis=2)
+            covered[np.arange(len(members)), members] = False
+            affected[start:start + block_size] = ~covered.any(axis=1)
+        # the improvement is the contribution of the new point unless it removed members, whose regions are then exclusive to it
+        removed_members = len(survivors) < len(self._points)
+        self._points = np.concatenate((self._points[survivors], point[np.newaxis, :]))
+        self._contributions = np.concatenate((self._contributions[survivors], [added]))
+        self._valid = np.concatenate((self._valid[survivors] & ~affected, [not removed_members]))
+        return added
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Content-addressed on-disk cache of the generated coefficients of problem instances.
+# An entry is a directory named by the SHA-256 of (problem name, qudits, seed, library version) with the stacked coefficients
+# as .npy files (J of shape (K,n,n) for quadratic problems, c of shape (K,n), m of shape (K,)) and a JSON header.
+# Entries are loaded memory-mapped and read-only, so nothing is read before it is used and all processes share the pages.
+# The library version contains a hash of qmoo_benchmark_functions.py, any change of the generators gives new keys.
+#
+#   python qmoo_instance_cache.py prefetch --cache-dir qmoo_cache --seeds 0-19 --qudits 2x12 3x8 --workers 8
+
+
+import argparse
+import concurrent.futures
+import functools
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import qmoo_benchmark_functions as prob
+import qmoo_pipeline as pipeline
+
+try:
+    import pkgInfo
+    PACKAGE_VERSION = pkgInfo.version
+except ImportError:
+    PACKAGE_VERSION = 'unknown'
+
+DEFAULT_CACHE_DIR = os.environ.get('QMOO_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'qmoo_instances'))
+HEADER_NAME = 'header.json'
+
+
+@functools.lru_cache(maxsize=None)
+def library_version():
+    """
+    package version and hash of the generator source, e.g. 1.0+3f2a9c1b0d4e
+    """
+    with open(prob.__file__, 'rb') as f:
+        return f'{PACKAGE_VERSION}+{hashlib.sha256(f.read()).hexdigest()[:12]}'
+
+
+def instance_key(problem_name: str, qudits_list: np.array, seed: int, version=None):
+    """
+    SHA-256 hex digest of (problem name, qudits, seed, library version) which names the cache entry
+    """
+    description = {'problem_name': problem_name, 'qudits': [int(q) for q in qudits_list], 'seed': int(seed),
+                   'version': library_version() if version is None else version}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def entry_path(cache_dir: str, problem_name: str, qudits_list: np.array, seed: int):
+    return os.path.join(cache_dir, instance_key(problem_name, qudits_list, seed))
+
+
+def store_coefficients(cache_dir: str, problem_name: str, qudits_list: np.array, seed: int, cost_coefficients: list):
+    """
+    writes the coefficients of one instance into the cache and returns the entry directory
+    the entry is written to a fresh temporary directory and renamed when complete, so concurrent writers and killed jobs never leave a partial entry
+    (a killed writer leaves its temporary directory behind, see remove_stale_temporaries)
+    """
+    if any(len(cc) == 3 and prob._is_structured(cc[0]) for cc in cost_coefficients):
+        cost_coefficients = prob.dense_cost_coefficients(cost_coefficients)
+    path = entry_path(cache_dir, problem_name, qudits_list, seed)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=f'{os.path.basename(path)}.tmp', dir=cache_dir)
+    J, c, m = prob.stack_cost_coefficients(cost_coefficients)
+    if J is not None:
+        np.save(os.path.join(tmp_path, 'J.npy'), J)
+    np.save(os.path.join(tmp_path, 'c.npy'), c)
+    np.save(os.path.join(tmp_path, 'm.npy'), m)
+    header = {'problem_name': problem_name, 'qudits': [int(q) for q in qudits_list], 'seed': int(seed), 'version': library_version(),
+              'num_objs': len(cost_coefficients), 'kind': 'quadratic' if J is not None else 'linear', 'dtype': c.dtype.str}
+    with open(os.path.join(tmp_path, HEADER_NAME), 'w') as f:
+        json.dump(header, f)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process stored the same entry first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return path
+
+
+def load_coefficients(cache_dir: str, problem_name: str, qudits_list: np.array, seed: int):
+    """
+    memory-mapped read-only coefficients of one instance in the format of the generate_problem_* functions, None if not cached
+    the coefficients of all objectives are views into the stacked arrays, so ProblemInstance and the batched evaluation use them without a copy
+    """
+    path = entry_path(cache_dir, problem_name, qudits_list, seed)
+    if not os.path.exists(os.path.join(path, HEADER_NAME)):
+        return None
+    with open(os.path.join(path, HEADER_NAME)) as f:
+        header = json.load(f)
+    c = np.load(os.path.join(path, 'c.npy'), mmap_mode='r')
+    m = np.load(os.path.join(path, 'm.npy'))
+    if header['kind'] == 'linear':
+        return [[c[k], m[k]] for k in range(header['num_objs'])]
+    J = np.load(os.path.join(path, 'J.npy'), mmap_mode='r')
+    return [[J[k], c[k], m[k]] for k in range(header['num_objs'])]
+
+
+def cached_coefficients(problem_name: str, qudits_list: np.array, seed: int, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    coefficients of an instance from the cache, generated and stored first if they are not cached yet
+    """
+    cost_coefficients = load_coefficients(cache_dir, problem_name, qudits_list, seed)
+    if cost_coefficients is None:
+        if problem_name not in prob.PROBLEM_REGISTRY:
+            print(f'problem {problem_name}  not defined')
+            sys.exit(8)
+        qudits_arr = np.asarray(qudits_list)
+        generated = prob.PROBLEM_REGISTRY[problem_name]['generator'](qudits_arr, seed, rng=np.random.RandomState(seed))
+        store_coefficients(cache_dir, problem_name, qudits_arr, seed, generated)
+        cost_coefficients = load_coefficients(cache_dir, problem_name, qudits_list, seed)
+    return cost_coefficients
+
+
+def cached_problem_instance(problem_name: str, qudits_list: np.array, seed: int, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    ProblemInstance on the memory-mapped cached coefficients (see cached_coefficients)
+    """
+    return prob.ProblemInstance(problem_name, np.asarray(qudits_list), seed,
+                                cost_coefficients=cached_coefficients(problem_name, qudits_list, seed, cache_dir))
+
+
+def _prefetch_instance(problem_name: str, qudits: list, seed: int, cache_dir: str):
+    if load_coefficients(cache_dir, problem_name, qudits, seed) is not None:
+        return False
+    cached_coefficients(problem_name, qudits, seed, cache_dir)
+    return True
+
+
+def remove_stale_temporaries(cache_dir: str, max_age=3600.):
+    """
+    removes the temporary directories of writers killed before their rename, only those older than max_age seconds,
+    so entries being written by running processes are kept
+    returns the number of removed directories
+    """
+    removed = 0
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if '.tmp' in name and os.path.isdir(path) and now - os.path.getmtime(path) > max_age:
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def prefetch(problem_names=pipeline.PROBLEM_NAMES, qudits_configs=pipeline.QUDITS_CONFIGS, seeds=pipeline.SEEDS, cache_dir=DEFAULT_CACHE_DIR,
+             workers=None, log=print):
+    """
+    stores the coefficients of all instances of the seed x problem x qudits grid which are not cached yet
+    workers is the size of the process pool (None: number of cores, 0: generate in this process)
+    returns the number of generated instances
+    """
+    for problem_name in problem_names:
+        if problem_name not in prob.PROBLEM_REGISTRY:
+            print(f'problem {problem_name}  not defined')
+            sys.exit(8)
+    os.makedirs(cache_dir, exist_ok=True)
+    remove_stale_temporaries(cache_dir)
+    tasks = [(problem_name, list(qudits), seed) for seed, problem_name, qudits in itertools.product(seeds, problem_names, qudits_configs)]
+    if workers == 0:
+        generated = sum(_prefetch_instance(problem_name, qudits, seed, cache_dir) for (problem_name, qudits, seed) in tasks)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_prefetch_instance, problem_name, qudits, seed, cache_dir) for (problem_name, qudits, seed) in tasks]
+            generated = sum(future.result() for future in futures)
+    log(f'{generated} of {len(tasks)} instances generated, {len(tasks) - generated} were cached')
+    return generated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='content-addressed cache of QMOO benchmark problem coefficients')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    prefetch_parser = subparsers.add_parser('prefetch', help='generate and store all instances of a seed x problem x qudits grid')
+    prefetch_parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    prefetch_parser.add_argument('--problems', nargs='+', default=pipeline.PROBLEM_NAMES, help='problem names (default: all)')
+    prefetch_parser.add_argument('--seeds', nargs='+', default=None, help='seeds or inclusive seed ranges, e.g. 0-4 7 (default: 0-19)')
+    prefetch_parser.add_argument('--qudits', nargs='+', default=None, help='qudit configurations, e.g. 2x12 3x8 2,3,3 (default: all of the example)')
+    prefetch_parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: number of cores, 0: no pool)')
+    args = parser.parse_args(argv)
+
+    seeds = pipeline.SEEDS if args.seeds is None else pipeline._parse_seeds(args.seeds)
+    qudits_configs = pipeline.QUDITS_CONFIGS if args.qudits is None else pipeline._parse_qudits(args.qudits)
+    prefetch(args.problems, qudits_configs, seeds, args.cache_dir, workers=args.workers)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
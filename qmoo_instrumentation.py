@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Optional instrumentation of the evaluation, enumeration and generation paths: number of evaluations per instance and objective,
+# wall time per stage (generate, evaluate, reduce, write), throughput and ETA.
+# It is switched on for a block of code with
+#
+#   with instrumentation.instrumented(instrumentation.Instrumentation(callback=print_progress)) as instr:
+#       ...
+#   instr.write_report('report.json')
+#
+# While no instrumentation is active the hooks in the library reduce to one `is None` check per call.
+
+
+import contextlib
+import json
+import threading
+import time
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+STAGES = ('generate', 'evaluate', 'reduce', 'write')
+
+
+class Instrumentation:
+    """
+    accumulates evaluation counts and stage times while it is active (see instrumented)
+    counts are kept per instance key (prob.instrumentation_key for ProblemInstance, None for bare coefficient lists) and objective
+    expected_evaluations is the total number of evaluations of the run, it is needed for the ETA
+    callback(report) is called with the progress report after evaluations, at most every callback_interval seconds
+    """
+    def __init__(self, expected_evaluations=None, callback=None, callback_interval=1.):
+        self.expected_evaluations = expected_evaluations
+        self.callback = callback
+        self.callback_interval = callback_interval
+        self.counts = dict()
+        self.stage_times = {stage: 0. for stage in STAGES}
+        self.stage_calls = {stage: 0 for stage in STAGES}
+        self.num_evaluations = 0
+        self.start_time = time.perf_counter()
+        self._last_callback = self.start_time
+        self._lock = threading.Lock()
+
+    def add_evaluations(self, key, num_configs: int, objectives):
+        """
+        counts num_configs evaluations of the given objectives (an int k or a range/list of objective indices) of instance key
+        """
+        if isinstance(objectives, (int, np.integer)):
+            objectives = range(objectives, objectives + 1)
+        # a range is applied as slice, much cheaper than fancy indexing for the all-objective case of the batched evaluation
+        index = slice(objectives.start, objectives.stop) if isinstance(objectives, range) else list(objectives)
+        num_objs = objectives.stop if isinstance(objectives, range) else max(objectives) + 1
+        with self._lock:
+            counts = self.counts.get(key)
+            if counts is None or len(counts) < num_objs:
+                grown = np.zeros(num_objs, dtype=np.int64)
+                if counts is not None:
+                    grown[:len(counts)] = counts
+                counts = self.counts[key] = grown
+            counts[index] += num_configs
+            self.num_evaluations += num_configs
+        self._progress()
+
+    def _progress(self):
+        if self.callback is None:
+            return
+        with self._lock:
+            now = time.perf_counter()
+            if now - self._last_callback < self.callback_interval:
+                return
+            self._last_callback = now
+        self.callback(self.report())
+
+    def add_time(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_times[stage] = self.stage_times.get(stage, 0.) + seconds
+            self.stage_calls[stage] = self.stage_calls.get(stage, 0) + 1
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """
+        adds the wall time of the with-block to stage
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def counted_objective_functions(self, instance):
+        """
+        objective functions of a ProblemInstance which count every call in this instrumentation, also while it is not active
+        (instance.objective_functions count their calls in the active instrumentation)
+        """
+        key = instance.instrumentation_key
+
+        def _counted(k, objective):
+            def objective_function(x):
+                self.add_evaluations(key, 1, k)
+                return objective(x)
+            return objective_function
+
+        return [_counted(k, objective) for k, objective in enumerate(instance._objective_functions)]
+
+    def merge(self, report: dict):
+        """
+        adds the counts and stage times of a report of another process (e.g. a pool worker)
+        """
+        with self._lock:
+            for entry in report['counts']:
+                per_objective = np.asarray(entry['evaluations_per_objective'], dtype=np.int64)
+                counts = self.counts.get(entry['instance'], np.zeros(0, dtype=np.int64))
+                merged = np.zeros(max(len(counts), len(per_objective)), dtype=np.int64)
+                merged[:len(counts)] += counts
+                merged[:len(per_objective)] += per_objective
+                self.counts[entry['instance']] = merged
+            self.num_evaluations += report['num_evaluations']
+            for stage, seconds in report['stage_times'].items():
+                self.stage_times[stage] = self.stage_times.get(stage, 0.) + seconds
+            for stage, calls in report['stage_calls'].items():
+                self.stage_calls[stage] = self.stage_calls.get(stage, 0) + calls
+        self._progress()
+
+    def report(self):
+        """
+        JSON-serializable summary: counts per instance and objective, stage times, elapsed time, throughput and ETA in seconds
+        num_evaluations counts evaluated configurations (one batched evaluation of all K objectives counts once)
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self.start_time
+            throughput = self.num_evaluations / elapsed if elapsed > 0. else 0.
+            eta = None
+            if self.expected_evaluations is not None and throughput > 0.:
+                eta = max(self.expected_evaluations - self.num_evaluations, 0) / throughput
+            return {
+                'num_evaluations': int(self.num_evaluations),
+                'expected_evaluations': self.expected_evaluations,
+                'elapsed': elapsed,
+                'throughput': throughput,
+                'eta': eta,
+                'counts': [{'instance': key, 'evaluations_per_objective': [int(n) for n in counts]} for key, counts in self.counts.items()],
+                'stage_times': dict(self.stage_times),
+                'stage_calls': dict(self.stage_calls),
+            }
+
+    def write_report(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=1)
+
+
+@contextlib.contextmanager
+def instrumented(instrumentation=None):
+    """
+    activates instrumentation (a new Instrumentation if None) for the with-block, the previously active one is restored afterwards
+    only one instrumentation is active per process, evaluations from all threads are counted in it
+    """
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    previous = prob.set_instrumentation(instrumentation)
+    try:
+        yield instrumentation
+    finally:
+        prob.set_instrumentation(previous)
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+
+
+import bisect
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+def nondominated_mask(points: np.array):
+    """
+    boolean mask of the non-dominated rows of the (N,K) array points (all objectives are minimized)
+    a row is dominated if another row is smaller or equal in all objectives and smaller in at least one, identical rows are all kept
+    """
+    points = np.asarray(points)
+    mask = np.zeros(len(points), dtype=bool)
+    # a point can only be dominated by points with a smaller sum of objectives, so these are used as candidates first
+    remaining_indices = np.argsort(points.sum(axis=1), kind='stable')
+    remaining = points[remaining_indices]
+    next_i = 0
+    while next_i < len(remaining):
+        candidate = remaining[next_i]
+        dominated = np.all(candidate <= remaining, axis=1) & np.any(candidate < remaining, axis=1)
+        keep = ~dominated
+        remaining_indices = remaining_indices[keep]
+        remaining = remaining[keep]
+        next_i = np.sum(keep[:next_i]) + 1
+    mask[remaining_indices] = True
+    return mask
+
+
+class StreamingParetoFront:
+    """
+    running archive of the non-dominated objective vectors and their state indices
+    chunks of objective vectors are filtered to their own front and merged into the archive,
+    so the memory scales with the size of the front and not with the number of states seen
+    """
+    def __init__(self, num_objs: int):
+        self.objectives = np.empty((0, num_objs))
+        self.indices = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def update(self, energies: np.array, indices: np.array):
+        """
+        merges the (B,K) objective vectors energies with state indices indices into the archive
+        """
+        energies = np.asarray(energies)
+        indices = np.asarray(indices, dtype=np.int64)
+        chunk_mask = nondominated_mask(energies)
+        merged_objectives = np.concatenate((self.objectives, energies[chunk_mask]))
+        merged_indices = np.concatenate((self.indices, indices[chunk_mask]))
+        mask = nondominated_mask(merged_objectives)
+        self.objectives = merged_objectives[mask]
+        self.indices = merged_indices[mask]
+
+    def front(self):
+        """
+        returns (objectives, indices) of the archive sorted by state index
+        """
+        order = np.argsort(self.indices, kind='stable')
+        return self.objectives[order], self.indices[order]
+
+
+def enumerate_pareto_front(cost_coefficients: list, qudits_list: np.array, chunk_size=2**16):
+    """
+    exact Pareto front of a problem instance by full enumeration without materializing the table of all states
+    returns (objectives, indices) of all non-dominated states, the configurations follow from the state indices (np.unravel_index)
+    """
+    front = StreamingParetoFront(len(cost_coefficients))
+    for start, configs, energies in prob.iter_all_states(cost_coefficients, qudits_list, chunk_size):
+        front.update(energies, np.arange(start, start + len(configs)))
+    return front.front()
+
+
+def _dominated_within(points: np.array, block_size=256):
+    """
+    boolean mask of the rows of points dominated by another row, by all-pairs comparison in blocks of block_size rows
+    (vectorized O(N^2 K), faster than nondominated_mask for the small, mostly non-dominated batches of ParetoArchive.add)
+    """
+    dominated = np.zeros(len(points), dtype=bool)
+    for start in range(0, len(points), block_size):
+        block = points[start:start + block_size]
+        weak = (points[np.newaxis, :, :] <= block[:, np.newaxis, :]).all(axis=2)
+        b, i = np.nonzero(weak)
+        strict = (points[i] != block[b]).any(axis=1)
+        dominated[start + b[strict]] = True
+    return dominated
+
+
+class _NDTreeNode:
+    """
+    node of the ND-tree of ParetoArchive with the ideal and nadir point of all members below it
+    a leaf holds the (m,K) member vectors and their storage slots, an internal node its children with their ideal and nadir points stacked
+    """
+    __slots__ = ('points', 'slots', 'children', 'ideals', 'nadirs', 'ideal', 'nadir')
+
+    def __init__(self, points: np.array, slots: np.array):
+        self.points = points
+        self.slots = slots
+        self.children = None
+        self.ideals = None
+        self.nadirs = None
+        self.ideal = points.min(axis=0)
+        self.nadir = points.max(axis=0)
+
+    def __len__(self):
+        return len(self.slots) if self.children is None else len(self.children)
+
+    def all_slots(self):
+        if self.children is None:
+            return list(self.slots)
+        return [slot for child in self.children for slot in child.all_slots()]
+
+
+def _strict_pairs(weak: np.array, better: np.array, worse: np.array):
+    """
+    pairs (row, column) of the boolean matrix weak of weak dominance better[row] <= worse[column] which are not identical vectors
+    """
+    rows, columns = np.nonzero(weak)
+    strict = (better[rows] != worse[columns]).any(axis=1)
+    return rows[strict], columns[strict]
+
+
+class ParetoArchive:
+    """
+    incremental archive of the non-dominated objective vectors (all minimized) and their state indices for online optimizers
+    2 objectives: sorted list with insertion by bisection, more objectives: ND-tree (Jaszkiewicz & Lust, 2018),
+    new vectors are only compared with the members of the nodes whose ideal-nadir box they can interact with
+    dominance as in nondominated_mask, identical vectors (e.g. of different states) are all kept
+    the members are kept in compact arrays, the objectives in dtype and the indices in index_dtype
+    (e.g. MixedRadixCodec(qudits).index_dtype for packed state indices)
+    """
+    def __init__(self, num_objs: int, dtype=np.float64, index_dtype=np.int64, max_leaf_size=50, branching=None):
+        self.num_objs = num_objs
+        self.max_leaf_size = max_leaf_size
+        self.branching = num_objs + 1 if branching is None else branching
+        self._objectives = np.empty((64, num_objs), dtype=dtype)
+        self._indices = np.empty(64, dtype=index_dtype)
+        self._live = np.zeros(64, dtype=bool)
+        # insertion number of the member in each slot, tells a reused slot from the original member
+        self._serials = np.zeros(64, dtype=np.int64)
+        self._next_serial = 0
+        self._free = []
+        self._num_slots = 0
+        self._size = 0
+        # 2 objectives: members sorted by (f_1, f_2), so f_2 is non-increasing
+        self._keys = []
+        self._key_slots = []
+        self._root = None
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def objectives(self):
+        return self._objectives[self._live]
+
+    @property
+    def indices(self):
+        return self._indices[self._live]
+
+    def front(self):
+        """
+        returns (objectives, indices) of the archive sorted by state index, as StreamingParetoFront.front
+        """
+        objectives, indices = self.objectives, self.indices
+        order = np.argsort(indices, kind='stable')
+        return objectives[order], indices[order]
+
+    def add(self, objectives: np.array, indices: np.array, block_size=1024):
+        """
+        inserts the (B,K) objective vectors with their (B,) state indices, dominated members are removed
+        for more than 2 objectives the batch is processed in blocks of block_size vectors: a block is reduced to its own
+        non-dominated vectors, these are tested against the tree all at once, node by node, and the survivors are inserted
+        returns the (B,) mask of the vectors which are in the archive afterwards
+        """
+        objectives = np.asarray(objectives, dtype=self._objectives.dtype).reshape(-1, self.num_objs)
+        indices = np.asarray(indices).reshape(-1)
+        slots = np.full(len(objectives), -1, dtype=np.int64)
+        if self.num_objs == 2:
+            for b in range(len(objectives)):
+                slots[b] = self._insert_2d(objectives[b], indices[b])
+        else:
+            for start in range(0, len(objectives), block_size):
+                rows = start + np.flatnonzero(~_dominated_within(objectives[start:start + block_size]))
+                if self._root is not None:
+                    rejected, _ = self._filter(self._root, objectives[rows])
+                    rows = rows[~rejected]
+                    if len(self._root) == 0:
+                        self._root = None
+                for b in rows:
+                    slots[b] = self._insert_nd(objectives[b], indices[b])
+        # a vector can be removed again by a later one of the same batch, its slot is then free or reused by a newer member
+        inserted = np.flatnonzero(slots >= 0)
+        serials = np.full(len(objectives), -1, dtype=np.int64)
+        serials[inserted] = self._next_serial - len(inserted) + np.arange(len(inserted))
+        accepted = np.zeros(len(objectives), dtype=bool)
+        accepted[inserted] = self._live[slots[inserted]] & (self._serials[slots[inserted]] == serials[inserted])
+        return accepted
+
+    def _allocate(self, objective: np.array, index):
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._num_slots == len(self._indices):
+                capacity = 2 * len(self._indices)
+                for name in ('_objectives', '_indices', '_live', '_serials'):
+                    old = getattr(self, name)
+                    grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                    grown[:len(old)] = old
+                    setattr(self, name, grown)
+            slot = self._num_slots
+            self._num_slots += 1
+        self._objectives[slot] = objective
+        self._indices[slot] = index
+        self._live[slot] = True
+        self._serials[slot] = self._next_serial
+        self._next_serial += 1
+        self._size += 1
+        return slot
+
+    def _release(self, slots):
+        self._live[slots] = False
+        self._free.extend(int(slot) for slot in slots)
+        self._size -= len(slots)
+
+    def _insert_2d(self, y: np.array, index):
+        """
+        returns the slot of y or -1 if y is dominated
+        """
+        keys = self._keys
+        key = (float(y[0]), float(y[1]))
+        p = bisect.bisect_left(keys, key)
+        # the member before p has the smallest f_2 of all members with a lexicographically smaller vector
+        if p > 0 and keys[p-1][1] <= key[1]:
+            return -1
+        q = p
+        while q < len(keys) and keys[q] == key:
+            q += 1
+        # the members dominated by y follow the identical ones as long as their f_2 is not smaller
+        r = q
+        while r < len(keys) and keys[r][1] >= key[1]:
+            r += 1
+        if r > q:
+            self._release(self._key_slots[q:r])
+            del keys[q:r]
+            del self._key_slots[q:r]
+        slot = self._allocate(y, index)
+        keys.insert(q, key)
+        self._key_slots.insert(q, slot)
+        return slot
+
+    def _insert_nd(self, y: np.array, index):
+        slot = self._allocate(y, index)
+        if self._root is None:
+            self._root = _NDTreeNode(y[np.newaxis, :].copy(), np.asarray([slot]))
+        else:
+            self._insert_node(self._root, y, slot)
+        return slot
+
+    def _filter(self, node: _NDTreeNode, Y: np.array):
+        """
+        tests the (b,K) mutually non-dominated vectors Y against the members below node
+        returns (rejected, changed): the (b,) mask of the vectors dominated by a member, and whether members dominated by Y were removed
+        (a rejected vector cannot dominate members, they would then dominate each other)
+        """
+        rejected = np.zeros(len(Y), dtype=bool)
+        if node.children is None:
+            P = node.points
+            rows, _ = _strict_pairs((P[np.newaxis, :, :] <= Y[:, np.newaxis, :]).all(axis=2), Y, P)
+            rejected[rows] = True
+            _, columns = _strict_pairs((Y[:, np.newaxis, :] <= P[np.newaxis, :, :]).all(axis=2), Y, P)
+            if len(columns) == 0:
+                return rejected, False
+            dominated = np.zeros(len(P), dtype=bool)
+            dominated[columns] = True
+            self._release(node.slots[dominated])
+            node.points = P[~dominated]
+            node.slots = node.slots[~dominated]
+            if len(node.slots) > 0:
+                node.ideal = node.points.min(axis=0)
+                node.nadir = node.points.max(axis=0)
+            return rejected, True
+
+        ideals, nadirs = node.ideals, node.nadirs
+        # a child whose nadir point dominates a vector contains only members which dominate it
+        rows, _ = _strict_pairs((nadirs[np.newaxis, :, :] <= Y[:, np.newaxis, :]).all(axis=2), Y, nadirs)
+        rejected[rows] = True
+        # a vector which dominates the ideal point of a child dominates all its members
+        covered = np.zeros(len(node.children), dtype=bool)
+        _, columns = _strict_pairs((Y[:, np.newaxis, :] <= ideals[np.newaxis, :, :]).all(axis=2), Y, ideals)
+        covered[columns] = True
+        # the members of the other children can only dominate a vector or be dominated by it if it lies in the dominance cones of their box
+        relevant = (ideals[np.newaxis, :, :] <= Y[:, np.newaxis, :]).all(axis=2) | (Y[:, np.newaxis, :] <= nadirs[np.newaxis, :, :]).all(axis=2)
+        relevant[:, covered] = False
+        changed = covered.copy()
+        for i in np.flatnonzero(relevant.any(axis=0)):
+            rows = np.flatnonzero(relevant[:, i] & ~rejected)
+            if len(rows) > 0:
+                child_rejected, changed[i] = self._filter(node.children[i], Y[rows])
+                rejected[rows[child_rejected]] = True
+        if not changed.any():
+            return rejected, False
+        for i in np.flatnonzero(covered):
+            self._release(node.children[i].all_slots())
+        keep = []
+        for i, child in enumerate(node.children):
+            if covered[i] or len(child) == 0:
+                continue
+            if changed[i]:
+                ideals[i] = child.ideal
+                nadirs[i] = child.nadir
+            keep.append(i)
+        node.children = [node.children[i] for i in keep]
+        node.ideals = ideals[keep]
+        node.nadirs = nadirs[keep]
+        if keep:
+            node.ideal = node.ideals.min(axis=0)
+            node.nadir = node.nadirs.max(axis=0)
+        return rejected, True
+
+    def _insert_node(self, node: _NDTreeNode, y: np.array, slot: int):
+        np.minimum(node.ideal, y, out=node.ideal)
+        np.maximum(node.nadir, y, out=node.nadir)
+        if node.children is not None:
+            # the child whose box center is closest to y
+            i = int(np.argmin(np.sum((0.5 * (node.ideals + node.nadirs) - y)**2, axis=1)))
+            child = node.children[i]
+            self._insert_node(child, y, slot)
+            node.ideals[i] = child.ideal
+            node.nadirs[i] = child.nadir
+            return
+        node.points = np.concatenate((node.points, y[np.newaxis, :]))
+        node.slots = np.append(node.slots, slot)
+        if len(node.slots) > self.max_leaf_size:
+            self._split(node)
+
+    def _split(self, node: _NDTreeNode):
+        """
+        turns a full leaf into an internal node with up to branching leaves, seeded by mutually distant members
+        """
+        P = node.points
+        distances = np.sqrt(np.sum((P[:, np.newaxis, :] - P[np.newaxis, :, :])**2, axis=2))
+        seeds = [int(np.argmax(distances.mean(axis=1)))]
+        while len(seeds) < self.branching:
+            seed = int(np.argmax(distances[:, seeds].min(axis=1)))
+            if distances[seed, seeds].min() == 0.:
+                break
+            seeds.append(seed)
+        if len(seeds) < 2:
+            # identical members cannot be separated, the leaf simply grows
+            return
+        assignment = np.argmin(distances[:, seeds], axis=1)
+        node.children = [_NDTreeNode(P[assignment == j], node.slots[assignment == j]) for j in range(len(seeds))]
+        node.ideals = np.asarray([child.ideal for child in node.children])
+        node.nadirs = np.asarray([child.nadir for child in node.children])
+        node.points = None
+        node.slots = None
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Generates the energy tables and Pareto fronts of all problem instances of a seed x problem x qudits grid in a process pool.
+# Finished instances are recorded with checksums in a manifest, so an interrupted run resumes where it stopped:
+#
+#   python qmoo_pipeline.py --output-dir setup_data --workers 32
+#   python qmoo_pipeline.py --problems problem_FM_AFM_two_objs problem_quadratic_five_objs --seeds 0-4 --qudits 2x12 3x8
+
+
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import sys
+import numpy as np
+import qmoo_benchmark_functions as prob
+import qmoo_energy_tables as energy_tables
+import qmoo_instrumentation as instrumentation_module
+import qmoo_pareto as pareto
+
+
+## default grid, same as in example_generate_problem_instances.py
+PROBLEM_NAMES = [
+    'problem_linear_corr-0.5',
+    'problem_FM_AFM_two_objs',
+    'problem_quadratic_AFM_two_objs',
+    'problem_FM_AFM_three_objs',
+    'problem_quadratic_five_objs',
+]
+
+QUDITS_CONFIGS = [
+    [2]*12,
+    [2]*13,
+    [2]*14,
+    [3]*8,
+    [4]*6,
+    [5]*5,
+    [7]*4,
+]
+
+SEEDS = list(range(20))
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def task_key(problem_name: str, qudits: list, seed: int):
+    qudits_str = "_".join(str(qq) for qq in qudits)
+    return f'{problem_name}_qudits_{qudits_str}_seed{seed}'
+
+
+def task_files(output_dir: str, problem_name: str, qudits: list, seed: int):
+    """
+    output files of one instance, in the directory layout of example_generate_problem_instances.py
+    """
+    qudits_str = "_".join(str(qq) for qq in qudits)
+    odir = os.path.join(output_dir, f'{problem_name}_normalized_{qudits_str}')
+    key = task_key(problem_name, qudits, seed)
+    return {
+        'all_energies': os.path.join(odir, f'{key}_all_energies.bin'),
+        'pareto_front': os.path.join(odir, f'{key}_ParetoFront.dat'),
+        'pareto_front_indices': os.path.join(odir, f'{key}_ParetoFrontIndices.dat'),
+    }
+
+
+def file_checksum(filename: str, block_size=2**20):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def generate_instance(problem_name: str, qudits: list, seed: int, output_dir: str, dtype='float64', chunk_size=2**16, instrument=False):
+    """
+    enumerates one problem instance, writes its energy table and Pareto front and returns the manifest record
+    files are written under a temporary name and renamed when complete, so a killed worker never leaves a valid-looking file
+    with instrument=True the instance is generated under a fresh instrumentation (in a pool worker) and (record, report) is returned
+    """
+    if instrument:
+        with instrumentation_module.instrumented() as instrumentation:
+            record = generate_instance(problem_name, qudits, seed, output_dir, dtype, chunk_size)
+        return record, instrumentation.report()
+    instrumentation = prob.get_instrumentation()
+    stage = instrumentation.stage if instrumentation is not None else lambda name: contextlib.nullcontext()
+    qudits_arr = np.asarray(qudits)
+    instance = prob.get_problem_instance(problem_name, qudits_arr, seed)
+    cost_coefficients = instance.cost_coefficients
+    reference_point = instance.reference_point
+    files = task_files(output_dir, problem_name, qudits, seed)
+    os.makedirs(os.path.dirname(files['all_energies']), exist_ok=True)
+
+    tmp_files = {name: fn + '.tmp' for name, fn in files.items()}
+    energy_tables.write_energy_table_from_enumeration(tmp_files['all_energies'], cost_coefficients, problem_name, qudits_arr, seed,
+                                                      reference_point, dtype=dtype, chunk_size=chunk_size)
+
+    with stage('reduce'):
+        table = energy_tables.EnergyTable(tmp_files['all_energies'])
+        front = pareto.StreamingParetoFront(table.num_objs)
+        for start in range(0, table.num_states, chunk_size):
+            stop = min(start + chunk_size, table.num_states)
+            front.update(table.energies(slice(start, stop)), np.arange(start, stop))
+        del table
+        front_objectives, front_indices = front.front()
+    with stage('write'):
+        np.savetxt(tmp_files['pareto_front'], front_objectives)
+        np.savetxt(tmp_files['pareto_front_indices'], front_indices, fmt='%d')
+        for name in files:
+            os.replace(tmp_files[name], files[name])
+    return {
+        'key': task_key(problem_name, qudits, seed),
+        'problem_name': problem_name,
+        'qudits': [int(q) for q in qudits],
+        'seed': int(seed),
+        'files': {name: {'path': os.path.relpath(fn, output_dir), 'size': os.path.getsize(fn), 'sha256': file_checksum(fn)}
+                  for name, fn in files.items()},
+    }
+
+
+def read_manifest(output_dir: str):
+    """
+    returns the manifest records of all finished instances by key, a truncated last line of an interrupted run is ignored
+    """
+    records = dict()
+    manifest = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest):
+        return records
+    with open(manifest) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record['key']] = record
+    return records
+
+
+def is_finished(record: dict, output_dir: str, verify_checksums=False):
+    for entry in record['files'].values():
+        fn = os.path.join(output_dir, entry['path'])
+        if not os.path.exists(fn) or os.path.getsize(fn) != entry['size']:
+            return False
+        if verify_checksums and file_checksum(fn) != entry['sha256']:
+            return False
+    return True
+
+
+def run_pipeline(output_dir: str, problem_names=PROBLEM_NAMES, qudits_configs=QUDITS_CONFIGS, seeds=SEEDS, workers=None,
+                 dtype='float64', chunk_size=2**16, verify_checksums=False, log=print, instrumentation=None):
+    """
+    generates all instances of the seed x problem x qudits grid which are not yet in the manifest of output_dir
+    workers is the size of the process pool (None: number of cores, 0: generate in this process)
+    instrumentation (a qmoo_instrumentation.Instrumentation) collects the evaluation counts and stage times of all instances,
+    the reports of the pool workers are merged into it as the instances finish; its expected evaluations are set to the states still to enumerate
+    returns the list of manifest records written in this run
+    """
+    for problem_name in problem_names:
+        if problem_name not in prob.PROBLEM_REGISTRY:
+            print(f'problem {problem_name}  not defined')
+            sys.exit(8)
+    os.makedirs(output_dir, exist_ok=True)
+    finished = read_manifest(output_dir)
+
+    tasks = []
+    for seed, problem_name, qudits in itertools.product(seeds, problem_names, qudits_configs):
+        record = finished.get(task_key(problem_name, qudits, seed))
+        if record is not None and is_finished(record, output_dir, verify_checksums):
+            continue
+        tasks.append((problem_name, list(qudits), seed))
+    log(f'{len(tasks)} instances to generate')
+    if instrumentation is not None and instrumentation.expected_evaluations is None:
+        instrumentation.expected_evaluations = sum(int(np.prod(qudits)) for (_, qudits, _) in tasks)
+
+    written = []
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'a') as manifest:
+        def _record(record):
+            # only the parent process appends to the manifest
+            manifest.write(json.dumps(record) + '\n')
+            manifest.flush()
+            written.append(record)
+            log(f'{len(written)}/{len(tasks)} {record["key"]}')
+
+        if workers == 0:
+            with instrumentation_module.instrumented(instrumentation) if instrumentation is not None else contextlib.nullcontext():
+                for (problem_name, qudits, seed) in tasks:
+                    _record(generate_instance(problem_name, qudits, seed, output_dir, dtype, chunk_size))
+        else:
+            instrument = instrumentation is not None
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(generate_instance, problem_name, qudits, seed, output_dir, dtype, chunk_size, instrument)
+                           for (problem_name, qudits, seed) in tasks]
+                for future in concurrent.futures.as_completed(futures):
+                    if instrument:
+                        record, report = future.result()
+                        instrumentation.merge(report)
+                        _record(record)
+                    else:
+                        _record(future.result())
+    return written
+
+
+def _parse_seeds(values: list):
+    """
+    seeds given as single numbers or inclusive ranges, e.g. 0-4 7 9
+    """
+    seeds = []
+    for value in values:
+        if '-' in value:
+            first, last = value.split('-')
+            seeds.extend(range(int(first), int(last) + 1))
+        else:
+            seeds.append(int(value))
+    return seeds
+
+
+def _parse_qudits(values: list):
+    """
+    qudit configurations given as dxn for n qudits of dimension d (e.g. 2x12) or as comma separated dimensions (e.g. 2,3,3)
+    """
+    configs = []
+    for value in values:
+        if 'x' in value:
+            d, n = value.split('x')
+            configs.append([int(d)] * int(n))
+        else:
+            configs.append([int(d) for d in value.split(',')])
+    return configs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='generate energy tables and Pareto fronts of QMOO benchmark problem instances')
+    parser.add_argument('--output-dir', default='setup_data')
+    parser.add_argument('--problems', nargs='+', default=PROBLEM_NAMES, help='problem names (default: all)')
+    parser.add_argument('--seeds', nargs='+', default=None, help='seeds or inclusive seed ranges, e.g. 0-4 7 (default: 0-19)')
+    parser.add_argument('--qudits', nargs='+', default=None, help='qudit configurations, e.g. 2x12 3x8 2,3,3 (default: all of the example)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes (default: number of cores, 0: no pool)')
+    parser.add_argument('--dtype', choices=['float64', 'float32'], default='float64')
+    parser.add_argument('--chunk-size', type=int, default=2**16)
+    parser.add_argument('--verify-checksums', action='store_true', help='recompute the checksums of finished instances before skipping them')
+    parser.add_argument('--report', default=None, help='write evaluation counts, stage times and throughput as JSON to this file')
+    parser.add_argument('--progress-interval', type=float, default=None, help='print throughput and ETA at most every this many seconds')
+    args = parser.parse_args(argv)
+
+    seeds = SEEDS if args.seeds is None else _parse_seeds(args.seeds)
+    qudits_configs = QUDITS_CONFIGS if args.qudits is None else _parse_qudits(args.qudits)
+    instrumentation = None
+    if args.report is not None or args.progress_interval is not None:
+        callback = None
+        if args.progress_interval is not None:
+            def callback(report):
+                eta = 'unknown' if report['eta'] is None else f'{report["eta"]:.0f} s'
+                print(f'{report["num_evaluations"]} states, {report["throughput"]:.3e} states/s, ETA {eta}')
+        instrumentation = instrumentation_module.Instrumentation(callback=callback, callback_interval=args.progress_interval or 0.)
+    run_pipeline(args.output_dir, args.problems, qudits_configs, seeds, workers=args.workers, dtype=args.dtype,
+                 chunk_size=args.chunk_size, verify_checksums=args.verify_checksums, instrumentation=instrumentation)
+    if args.report is not None:
+        instrumentation.write_report(args.report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
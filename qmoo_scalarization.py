@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Weighted-sum and augmented Chebyshev scalarizations of the objectives for many weight vectors at once:
+#   weighted sum:         s_w(x) = sum_k w_k f_k(x)
+#   augmented Chebyshev:  t_w(x) = max_k w_k (f_k(x) - z_k) + rho sum_k w_k (f_k(x) - z_k),  z = ideal point (default 0)
+# The K objectives of a batch are evaluated once and scalarized for all W weights with a (N,K) x (K,W) product, so the
+# quadratic evaluation cost does not grow with W. The weighted sum is itself a quadratic objective; weighted_sum_coefficients
+# folds the weights into one coefficient set per weight, e.g. for the exact optimum beyond enumeration (weighted_sum_optima).
+
+
+import numpy as np
+import qmoo_benchmark_functions as prob
+import qmoo_bounds as bounds
+
+
+def _coefficients_and_qudits(problem):
+    """
+    (cost_coefficients, qudits) of a ProblemInstance, (problem, None) for a coefficient list
+    """
+    if isinstance(problem, prob.ProblemInstance):
+        return problem.cost_coefficients, problem.qudits
+    return problem, None
+
+
+def weighted_sum_coefficients(cost_coefficients: list, weights: np.array):
+    """
+    folds the (W,K) weights into one quadratic coefficient set [J, c, m] per weight (linear [c, m] if all objectives are linear)
+    ring and diagonal couplings are summed in their compact form if all objectives with a nonzero weight share the structure,
+    only couplings of mixed types are summed as dense n x n matrix
+    """
+    weights = np.atleast_2d(weights)
+    J_list = [cc[0] for cc in cost_coefficients if len(cc) == 3]
+    folded = []
+    for w in weights:
+        c = sum(w_k * np.asarray(cc[-2], dtype=float) for w_k, cc in zip(w, cost_coefficients))
+        m = float(sum(w_k * float(cc[-1]) for w_k, cc in zip(w, cost_coefficients)))
+        if not J_list:
+            folded.append([c, m])
+            continue
+        terms = [(w_k, cc[0]) for w_k, cc in zip(w, cost_coefficients) if len(cc) == 3 and w_k != 0.]
+        if not terms:
+            # all quadratic objectives have weight 0, their zero sum keeps the structure of the first coupling
+            terms = [(0., J_list[0])]
+        coupling_types = {type(Jk) if prob._is_structured(Jk) else np.ndarray for _, Jk in terms}
+        if coupling_types == {prob.RingCouplingMatrix}:
+            J = prob.RingCouplingMatrix(sum(w_k * Jk.weights for w_k, Jk in terms))
+        elif coupling_types == {prob.DiagonalCouplingMatrix}:
+            J = prob.DiagonalCouplingMatrix(sum(w_k * Jk.diagonal() for w_k, Jk in terms))
+        else:
+            J = sum(w_k * (Jk.toarray() if prob._is_structured(Jk) else np.asarray(Jk, dtype=float)) for w_k, Jk in terms)
+        folded.append([J, c, m])
+    return folded
+
+
+def scalarize(objectives: np.array, weights: np.array, ideal_point=None, rho=0.01, chunk_size=4096):
+    """
+    weighted-sum and augmented Chebyshev values of the (N,K) objective vectors for the (W,K) weights
+    returns (weighted_sums, chebyshev), both of shape (N,W)
+    """
+    objectives = np.atleast_2d(objectives)
+    weights = np.atleast_2d(weights)
+    ideal_point = np.zeros(objectives.shape[1]) if ideal_point is None else np.asarray(ideal_point, dtype=float)
+    weighted_sums = objectives @ weights.T
+    chebyshev = np.empty(weighted_sums.shape, dtype=np.result_type(objectives.dtype, weights.dtype, np.float32))
+    # the (B,W,K) terms are formed chunk by chunk
+    for start in range(0, len(objectives), chunk_size):
+        terms = (objectives[start:start + chunk_size, None, :] - ideal_point) * weights[None, :, :]
+        chebyshev[start:start + len(terms)] = np.max(terms, axis=2) + rho * np.sum(terms, axis=2)
+    return weighted_sums, chebyshev
+
+
+def scalarized_objectives(X: np.array, problem, weights: np.array, ideal_point=None, rho=0.01, chunk_size=None):
+    """
+    weighted-sum and augmented Chebyshev values of the (N,n) configurations X for all (W,K) weights
+    problem is a ProblemInstance or the coefficient list of a generate_problem_* function
+    returns (weighted_sums, chebyshev), both of shape (N,W)
+    """
+    cost_coefficients, _ = _coefficients_and_qudits(problem)
+    if isinstance(problem, prob.ProblemInstance):
+        objectives = problem.evaluate_batched(X, chunk_size)
+    else:
+        objectives = prob.calculate_cost_functions_batched(X, cost_coefficients, chunk_size)
+    return scalarize(objectives, weights, ideal_point, rho)
+
+
+def optimal_scalarizations(problem, weights: np.array, qudits_list=None, ideal_point=None, rho=0.01, chunk_size=2**16):
+    """
+    exact optimum of every weight by enumerating all states once (only feasible for small state spaces)
+    problem is a ProblemInstance or a coefficient list (then qudits_list is required)
+    returns (weighted_sum_minima, weighted_sum_indices, chebyshev_minima, chebyshev_indices), each of shape (W,);
+    the indices are state vector indices, the configurations follow with np.unravel_index
+    """
+    cost_coefficients, qudits = _coefficients_and_qudits(problem)
+    qudits_list = qudits if qudits_list is None else qudits_list
+    weights = np.atleast_2d(weights)
+    minima = [np.full(len(weights), np.inf), np.full(len(weights), np.inf)]
+    indices = [np.zeros(len(weights), dtype=np.int64), np.zeros(len(weights), dtype=np.int64)]
+    for start, configs, energies in prob.iter_all_states(cost_coefficients, qudits_list, chunk_size):
+        for values, minimum, index in zip(scalarize(energies, weights, ideal_point, rho), minima, indices):
+            best = np.argmin(values, axis=0)
+            block_minimum = values[best, np.arange(len(weights))]
+            better = block_minimum < minimum
+            minimum[better] = block_minimum[better]
+            index[better] = start + best[better]
+    return minima[0], indices[0], minima[1], indices[1]
+
+
+def weighted_sum_optima(problem, weights: np.array, qudits_list=None):
+    """
+    exact weighted-sum optimum of every weight without enumeration, by minimizing the folded coefficients with qmoo_bounds
+    returns (minima (W,), configurations (W,n))
+    """
+    cost_coefficients, qudits = _coefficients_and_qudits(problem)
+    qudits_list = qudits if qudits_list is None else qudits_list
+    results = [bounds.minimize_objective(folded, qudits_list) for folded in weighted_sum_coefficients(cost_coefficients, weights)]
+    return np.asarray([value for value, _ in results]), np.asarray([x for _, x in results])
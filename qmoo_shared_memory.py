@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C)
+# Honda Research Institute Europe GmbH
+# Carl-Legien-Str. 30
+# 63073 Offenbach/Main
+# Germany
+#
+# UNPUBLISHED PROPRIETARY MATERIAL.
+# ALL RIGHTS RESERVED.
+#
+#
+# Coefficients and energy tables in multiprocessing.shared_memory blocks, so the workers of a process pool use one copy
+# instead of a pickled one each. The owning process creates the blocks and passes small picklable handles to the workers,
+# which attach to them without a copy:
+#
+#   with shared_memory.SharedBlocks() as blocks:
+#       coefficients = blocks.share_coefficients(cost_coefficients)
+#       table = blocks.empty((d**n, K))
+#       pool.map(worker, [(coefficients, table, start, stop) for ...])     # worker: coefficients.attach(), table.attach()
+#       result = table.attach().copy()
+#
+# Leaving the with-block (or SharedBlocks.close) unlinks all blocks of the owner; arrays attached to them must not be used afterwards.
+# Workers have to be started by multiprocessing from the owning process (e.g. ProcessPoolExecutor), they share its resource tracker.
+
+
+import concurrent.futures
+import os
+from multiprocessing import shared_memory
+import numpy as np
+import qmoo_benchmark_functions as prob
+
+
+# segments opened in this process by name, created ones as well as attached ones, and the names of the created ones
+_segments = dict()
+_owned = set()
+_ALIGNMENT = 64
+
+
+def _aligned(nbytes: int):
+    return (nbytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _segment(name: str):
+    segment = _segments.get(name)
+    if segment is None:
+        segment = _segments[name] = shared_memory.SharedMemory(name=name)
+    return segment
+
+
+class SharedArray:
+    """
+    picklable handle of an array in a shared memory block
+    """
+    def __init__(self, name: str, shape: tuple, dtype, offset=0):
+        self.name = name
+        self.shape = tuple(int(s) for s in shape)
+        self.dtype = np.dtype(dtype).str
+        self.offset = offset
+
+    def __repr__(self):
+        return f'SharedArray({self.name!r}, {self.shape}, {self.dtype!r})'
+
+    def attach(self, writeable=True):
+        """
+        array view of the block in this process, the block is opened on the first attach
+        """
+        array = np.ndarray(self.shape, dtype=self.dtype, buffer=_segment(self.name).buf, offset=self.offset)
+        array.flags.writeable = writeable
+        return array
+
+
+class SharedCoefficients:
+    """
+    picklable handle of the stacked coefficients of all K objectives in one shared memory block
+    """
+    def __init__(self, J, c: SharedArray, m: SharedArray):
+        self.J = J
+        self.c = c
+        self.m = m
+
+    def attach(self):
+        """
+        read-only coefficients in the format of the generate_problem_* functions,
+        views into the block, so stack_cost_coefficients and ProblemInstance use them without a copy
+        """
+        c = self.c.attach(writeable=False)
+        m = self.m.attach(writeable=False)
+        if self.J is None:
+            return [[c[k], m[k]] for k in range(len(m))]
+        J = self.J.attach(writeable=False)
+        return [[J[k], c[k], m[k]] for k in range(len(m))]
+
+    def problem_instance(self, problem_name: str, qudits_list: np.array, seed: int):
+        """
+        ProblemInstance on the shared coefficients (no regeneration in the worker)
+        """
+        return prob.ProblemInstance(problem_name, np.asarray(qudits_list), seed, cost_coefficients=self.attach())
+
+
+class SharedBlocks:
+    """
+    owner of shared memory blocks: creates them and unlinks all of them in close (or at the end of the with-block)
+    """
+    def __init__(self):
+        self.names = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _create(self, nbytes: int):
+        segment = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+        _segments[segment.name] = segment
+        _owned.add(segment.name)
+        self.names.append(segment.name)
+        return segment.name
+
+    def empty(self, shape: tuple, dtype=np.float64):
+        """
+        handle of a new uninitialized shared array, e.g. an all_energies table filled by the workers
+        """
+        return SharedArray(self._create(int(np.prod(shape)) * np.dtype(dtype).itemsize), shape, dtype)
+
+    def share_array(self, array: np.array):
+        """
+        handle of a shared copy of array
+        """
+        handle = self.empty(array.shape, array.dtype)
+        handle.attach()[...] = array
+        return handle
+
+    def share_coefficients(self, cost_coefficients: list):
+        """
+        handle of a shared copy of the coefficients of all objectives, J (K,n,n), c (K,n) and m (K,) in one block
+        structured couplings are stored dense
+        """
+        if any(len(cc) == 3 and prob._is_structured(cc[0]) for cc in cost_coefficients):
+            cost_coefficients = prob.dense_cost_coefficients(cost_coefficients)
+        arrays = [a for a in prob.stack_cost_coefficients(cost_coefficients) if a is not None]
+        name = self._create(sum(_aligned(a.nbytes) for a in arrays))
+        handles = []
+        offset = 0
+        for a in arrays:
+            handle = SharedArray(name, a.shape, a.dtype, offset)
+            handle.attach()[...] = a
+            handles.append(handle)
+            offset += _aligned(a.nbytes)
+        if len(handles) == 2:
+            return SharedCoefficients(None, *handles)
+        return SharedCoefficients(*handles)
+
+    def close(self):
+        """
+        closes and unlinks all blocks of this owner
+        """
+        for name in self.names:
+            segment = _segments.pop(name)
+            _owned.discard(name)
+            try:
+                segment.close()
+            except BufferError:
+                # arrays still refer to the mapping, it is released with them, the name is removed anyway
+                pass
+            segment.unlink()
+        self.names = []
+
+
+def detach_all():
+    """
+    closes the blocks attached (not created) in this process whose arrays are no longer used, e.g. at the end of a worker task
+    """
+    for name, segment in list(_segments.items()):
+        if name in _owned:
+            continue
+        try:
+            segment.close()
+        except BufferError:
+            continue
+        del _segments[name]
+
+
+def _enumerate_range(coefficients: SharedCoefficients, table: SharedArray, qudits_list: list, start: int, stop: int, chunk_size: int):
+    cost_coefficients = coefficients.attach()
+    out = table.attach()
+    num_params = out.shape[1] - len(cost_coefficients)
+    codec = prob.MixedRadixCodec(qudits_list)
+    for block_start in range(start, stop, chunk_size):
+        block_stop = min(block_start + chunk_size, stop)
+        configs = codec.decode(np.arange(block_start, block_stop))
+        if num_params > 0:
+            out[block_start:block_stop, :num_params] = configs
+        prob.calculate_cost_functions_batched(configs, cost_coefficients, out=out[block_start:block_stop, num_params:])
+    return stop - start
+
+
+def enumerate_all_states_parallel(blocks: SharedBlocks, cost_coefficients, qudits_list: np.array, workers=None, chunk_size=2**16,
+                                  include_configs=True):
+    """
+    full enumeration into a shared table, the state ranges are evaluated by a pool of workers which all write into the same table
+    cost_coefficients is a coefficient list or a SharedCoefficients handle, the table is created in blocks and has the layout of enumerate_all_states
+    workers is the size of the process pool (None: number of cores, 0: evaluate in this process)
+    returns the SharedArray handle of the table
+    """
+    if not isinstance(cost_coefficients, SharedCoefficients):
+        cost_coefficients = blocks.share_coefficients(cost_coefficients)
+    num_objs = cost_coefficients.m.shape[0]
+    codec = prob.MixedRadixCodec(qudits_list)
+    num_params = len(qudits_list) if include_configs else 0
+    table = blocks.empty((codec.num_states, num_params + num_objs), np.dtype(cost_coefficients.c.dtype))
+    qudits = [int(q) for q in qudits_list]
+    if workers == 0:
+        _enumerate_range(cost_coefficients, table, qudits, 0, codec.num_states, chunk_size)
+        return table
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        # several ranges per worker keep the pool busy until the end, ranges are whole chunks
+        num_ranges = 4 * workers
+        range_size = max(chunk_size, -(-codec.num_states // num_ranges) // chunk_size * chunk_size)
+        futures = [pool.submit(_enumerate_range, cost_coefficients, table, qudits, start, min(start + range_size, codec.num_states), chunk_size)
+                   for start in range(0, codec.num_states, range_size)]
+        for future in futures:
+            future.result()
+    return table
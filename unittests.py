@@ -12,11 +12,34 @@
 # Sebastian Schmitt, 2024
 
 
+import asyncio
 import numpy as np
 import sys
 import functools
+import contextlib
+import io
+import json
+import struct
+import time
 import os
 import qmoo_benchmark_functions as prob
+import qmoo_pareto as pareto
+import qmoo_energy_tables as energy_tables
+import qmoo_pipeline as pipeline
+import qmoo_hypervolume as hypervolume
+import qmoo_bounds as bounds
+import qmoo_hamiltonian as hamiltonian
+import qmoo_scalarization as scalarization
+import qmoo_counts as counts
+import qmoo_benchmark as benchmark
+import qmoo_instrumentation as instrumentation
+import qmoo_evaluation_cache as evaluation_cache
+import qmoo_evaluation_server as evaluation_server
+import qmoo_shared_memory as shared_memory
+import qmoo_instance_cache as instance_cache
+import itertools
+import tempfile
+import concurrent.futures
 
 def test_val(value,expected):
     if np.fabs(value-expected)>1.e-9:
@@ -262,6 +285,596 @@ for (qudits, x) in qudits_x_pairs:
     #print('quadratic_five_objs5',qudits,x,obj5, results['problem_quadratic_five_objs'][str(qudits)][4])
 
 
+# ################################
+# batched evaluation must agree with the single-vector cost functions
+generators = [
+    prob.generate_problem_linear_corr05,
+    prob.generate_problem_ferromagnetic_antiferromagnetic_two_objectives,
+    prob.generate_problem_quadratic_antiferromagnetic_two_objectives,
+    prob.generate_problem_ferromagnetic_antiferromagnetic_three_objectives,
+    prob.generate_problem_quadratic_five_objectives,
+]
+
+rng = np.random.RandomState(1)
+for (qudits, x) in qudits_x_pairs:
+    samples = rng.randint(0, qudits, size=(50, len(qudits)))
+    for generator in generators:
+        cost_coefficients = generator(qudits, seed)
+        batched = prob.calculate_cost_functions_batched(samples, cost_coefficients, chunk_size=16)
+        for i1, sample in enumerate(samples):
+            for k, cc in enumerate(cost_coefficients):
+                if len(cc) == 2:
+                    expected = prob.calculate_cost_function_linear(sample, c=cc[0], m=cc[1])
+                else:
+                    expected = prob.calculate_cost_function_quadratic(sample, J=cc[0], c=cc[1], m=cc[2])
+                fail_count += test_val(batched[i1, k], expected)
+
+
+# ################################
+# structured (ring / diagonal) couplings must give the same objectives as the dense matrices
+for (qudits, x) in qudits_x_pairs:
+    samples = rng.randint(0, qudits, size=(50, len(qudits)))
+    for generator in [prob.generate_problem_ferromagnetic_antiferromagnetic_three_objectives, prob.generate_problem_quadratic_five_objectives]:
+        cost_coefficients = generator(qudits, seed)
+        structured_coefficients = generator(qudits, seed, structured=True)
+        for cc, sc in zip(cost_coefficients, structured_coefficients):
+            fail_count += test_val(prob.calculate_cost_function_quadratic(x, sc[0], sc[1], sc[2]),
+                                   prob.calculate_cost_function_quadratic(x, cc[0], cc[1], cc[2]))
+        dense = prob.calculate_cost_functions_batched(samples, cost_coefficients)
+        structured = prob.calculate_cost_functions_batched(samples, structured_coefficients)
+        fail_count += int(np.max(np.abs(dense - structured)) > 1.e-9)
+
+qudits = np.asarray([3]*5000)
+structured_coefficients = prob.generate_problem_quadratic_five_objectives(qudits, seed, structured=True)
+structured = prob.calculate_cost_functions_batched(rng.randint(0, 3, size=(20, 5000)), structured_coefficients)
+fail_count += int(structured.shape != (20, 5))
+
+
+# ################################
+# full enumeration must agree with the state-by-state enumeration
+for qudits in [ np.asarray([2]*6), np.asarray([3]*4), np.asarray([2,3,4]) ]:
+    cost_coefficients = prob.generate_problem_linear_corr05(qudits, seed)
+    if np.all(qudits == qudits[0]):
+        cost_coefficients = prob.generate_problem_quadratic_five_objectives(qudits, seed)
+    all_e = prob.enumerate_all_states(cost_coefficients, qudits, chunk_size=7)
+    numParams = len(qudits)
+    for i1 in range(int(np.prod(qudits))):
+        tconfig = np.array(list(np.unravel_index(i1, tuple(qudits))), dtype=int)
+        fail_count += int(np.any(all_e[i1, 0:numParams] != tconfig))
+        fail_count += test_val(all_e[i1, -1], prob.calculate_cost_functions_batched(tconfig, cost_coefficients)[0, -1])
+
+    # same chunk size as above, so the rows are bit-identical (another chunk size changes the BLAS blocking and may change the last bit)
+    energies_only = np.zeros((int(np.prod(qudits)), len(cost_coefficients)))
+    prob.enumerate_all_states(cost_coefficients, qudits, chunk_size=7, out=energies_only, include_configs=False)
+    fail_count += int(np.any(energies_only != all_e[:, numParams:]))
+
+    # Gray-code enumeration: single qudit steps of +-1, same table in lexicographic order
+    all_e_gray = prob.enumerate_all_states(cost_coefficients, qudits, chunk_size=11, method='gray', order='gray')
+    steps = np.abs(np.diff(all_e_gray[:, 0:numParams], axis=0))
+    fail_count += int(np.any(steps.sum(axis=1) != 1))
+    all_e_lex = prob.enumerate_all_states(cost_coefficients, qudits, chunk_size=11, method='gray', order='lex')
+    fail_count += int(np.any(all_e_lex[:, 0:numParams] != all_e[:, 0:numParams]))
+    fail_count += int(np.max(np.abs(all_e_lex[:, numParams:] - all_e[:, numParams:])) > 1.e-9)
+
+
+# ################################
+# streaming Pareto front must agree with the front of the full table
+points = rng.uniform(size=(500, 3))
+dominated = np.array([ np.any(np.all(points <= p, axis=1) & np.any(points < p, axis=1)) for p in points ])
+fail_count += int(np.any(pareto.nondominated_mask(points) == dominated))
+
+for (qudits, x) in qudits_x_pairs:
+    cost_coefficients = prob.generate_problem_ferromagnetic_antiferromagnetic_three_objectives(qudits, seed)
+    all_e = prob.enumerate_all_states(cost_coefficients, qudits, include_configs=False)
+    front_objectives, front_indices = pareto.enumerate_pareto_front(cost_coefficients, qudits, chunk_size=1000)
+    fail_count += int(np.any(front_indices != np.flatnonzero(pareto.nondominated_mask(all_e))))
+    fail_count += int(np.any(front_objectives != all_e[front_indices]))
+
+# ################################
+# binary energy tables: written tables must read back unchanged
+with tempfile.TemporaryDirectory() as tmpdir:
+    qudits = np.asarray([3]*6)
+    cost_coefficients = prob.generate_problem_quadratic_five_objectives(qudits, seed)
+    all_e = prob.enumerate_all_states(cost_coefficients, qudits, include_configs=False)
+    reference_point = prob.get_reference_point_for_qudit_config_and_problem_name('problem_quadratic_five_objs')
+
+    fn = os.path.join(tmpdir, 'table64.bin')
+    energy_tables.write_energy_table(fn, all_e, 'problem_quadratic_five_objs', qudits, seed, reference_point)
+    table = energy_tables.EnergyTable(fn)
+    fail_count += int(table.problem_name != 'problem_quadratic_five_objs' or table.seed != seed or table.reference_point != reference_point)
+    fail_count += int(np.any(table.energies() != all_e))
+    fail_count += int(np.any(table.objective(3) != all_e[:, 3]))
+    fail_count += int(np.any(table.configs([0, 17, 728]) != prob.enumerate_all_states(cost_coefficients, qudits)[[0, 17, 728], 0:6]))
+    del table
+
+    fn = os.path.join(tmpdir, 'table32.bin')
+    energy_tables.write_energy_table_from_enumeration(fn, cost_coefficients, 'problem_quadratic_five_objs', qudits, seed, reference_point,
+                                                      dtype=np.float32, chunk_size=100)
+    table = energy_tables.EnergyTable(fn)
+    fail_count += int(table.columns.dtype != np.float32)
+    fail_count += int(np.max(np.abs(table.energies([5, 6, 7]) - all_e[[5, 6, 7]])) > 1.e-6)
+    del table
+
+# ################################
+# instance-generation pipeline: a second run resumes and only regenerates missing outputs
+with tempfile.TemporaryDirectory() as tmpdir:
+    grid = dict(problem_names=['problem_linear_corr-0.5', 'problem_FM_AFM_three_objs'], qudits_configs=[[2]*5, [3]*3], seeds=[0, 1])
+    written = pipeline.run_pipeline(tmpdir, workers=0, log=lambda msg: None, **grid)
+    fail_count += int(len(written) != 8)
+    files = pipeline.task_files(tmpdir, 'problem_FM_AFM_three_objs', [3]*3, 1)
+    table = energy_tables.EnergyTable(files['all_energies'])
+    cost_coefficients = prob.generate_problem_ferromagnetic_antiferromagnetic_three_objectives(np.asarray([3]*3), 1)
+    fail_count += int(np.max(np.abs(table.energies() - prob.enumerate_all_states(cost_coefficients, np.asarray([3]*3), include_configs=False))) > 1.e-12)
+    del table
+    os.remove(files['pareto_front'])
+    written = pipeline.run_pipeline(tmpdir, workers=0, log=lambda msg: None, **grid)
+    fail_count += int([record['key'] for record in written] != [pipeline.task_key('problem_FM_AFM_three_objs', [3]*3, 1)])
+    fail_count += int(not os.path.exists(files['pareto_front']))
+    # a real process pool writes the same files as the serial run and also resumes after a partial run
+    with tempfile.TemporaryDirectory() as pool_dir:
+        written = pipeline.run_pipeline(pool_dir, workers=2, log=lambda msg: None, **grid)
+        fail_count += int(len(written) != 8)
+        for problem_name, qudits, seed_ in itertools.product(grid['problem_names'], grid['qudits_configs'], grid['seeds']):
+            for name, serial_file in pipeline.task_files(tmpdir, problem_name, qudits, seed_).items():
+                with open(serial_file, 'rb') as f_serial, open(pipeline.task_files(pool_dir, problem_name, qudits, seed_)[name], 'rb') as f_pool:
+                    fail_count += int(f_serial.read() != f_pool.read())
+        os.remove(pipeline.task_files(pool_dir, 'problem_linear_corr-0.5', [2]*5, 0)['all_energies'])
+        written = pipeline.run_pipeline(pool_dir, workers=2, log=lambda msg: None, **grid)
+        fail_count += int([record['key'] for record in written] != [pipeline.task_key('problem_linear_corr-0.5', [2]*5, 0)])
+        fail_count += int(len(pipeline.read_manifest(pool_dir)) != 8)
+
+# ################################
+# problem registry and cached instances
+for (qudits, x) in qudits_x_pairs:
+    for problem_name, generator in zip(['problem_linear_corr-0.5', 'problem_FM_AFM_two_objs', 'problem_quadratic_AFM_two_objs',
+                                        'problem_FM_AFM_three_objs', 'problem_quadratic_five_objs'], generators):
+        instance = prob.get_problem_instance(problem_name, qudits, seed)
+        fail_count += int(instance is not prob.get_problem_instance(problem_name, list(qudits), seed))
+        fail_count += int(instance.reference_point != prob.get_reference_point_for_qudit_config_and_problem_name(problem_name))
+        expected = prob.calculate_cost_functions_batched(x, generator(qudits, seed))[0]
+        for k in range(instance.num_objs):
+            fail_count += test_val(instance.evaluate(x)[k], expected[k])
+            fail_count += test_val(instance.objective_functions[k](x), expected[k])
+            fail_count += test_val(instance.evaluate_batched(np.asarray([x, x]))[1, k], expected[k])
+
+prob.set_problem_instance_cache_size(2)
+instance = prob.get_problem_instance('problem_FM_AFM_two_objs', np.asarray([2]*4), 1)
+prob.get_problem_instance('problem_FM_AFM_two_objs', np.asarray([2]*4), 2)
+prob.get_problem_instance('problem_FM_AFM_two_objs', np.asarray([2]*4), 3)
+fail_count += int(instance is prob.get_problem_instance('problem_FM_AFM_two_objs', np.asarray([2]*4), 1))
+prob.clear_problem_instance_cache()
+prob.set_problem_instance_cache_size(32)
+# custom problems need their reference point, without one registration stops with exit code 8
+prob.register_problem('problem_custom_linear', prob.generate_problem_linear_corr05, 'linear', reference_point=[1., 1.])
+fail_count += int(prob.get_problem_instance('problem_custom_linear', np.asarray([2]*4), 1).reference_point != [1., 1.])
+try:
+    with contextlib.redirect_stdout(io.StringIO()):
+        prob.register_problem('problem_custom_without_reference', prob.generate_problem_linear_corr05, 'linear')
+    fail_count += 1
+except SystemExit as e:
+    fail_count += int(e.code != 8 or 'problem_custom_without_reference' in prob.PROBLEM_REGISTRY)
+del prob.PROBLEM_REGISTRY['problem_custom_linear']
+prob.clear_problem_instance_cache()
+
+# ################################
+# generators with an explicit RandomState reproduce the default instances bit for bit without touching the global RNG
+def _same_coefficients(a, b):
+    return all(np.array_equal(np.asarray(u), np.asarray(v)) for ca, cb in zip(a, b) for u, v in zip(ca, cb))
+
+for (qudits, x) in qudits_x_pairs:
+    for generator in generators:
+        np.random.seed(123)
+        state_before = np.random.get_state()[1].copy()
+        with_rng = generator(qudits, seed, rng=np.random.RandomState(seed))
+        fail_count += int(not np.array_equal(np.random.get_state()[1], state_before))
+        fail_count += int(not _same_coefficients(with_rng, generator(qudits, seed)))
+        fail_count += int(len(generator(qudits, seed, rng=np.random.default_rng(seed))) != len(with_rng))
+
+qudits = np.asarray([3]*8)
+with concurrent.futures.ThreadPoolExecutor(max_workers=8) as thread_pool:
+    threaded = list(thread_pool.map(lambda sd: prob.generate_problem_quadratic_five_objectives(qudits, sd, rng=np.random.RandomState(sd)), range(40)))
+for sd in range(40):
+    fail_count += int(not _same_coefficients(threaded[sd], prob.generate_problem_quadratic_five_objectives(qudits, sd)))
+
+# ################################
+# in-place coefficient construction for large qudit numbers must equal the explicit expressions
+J = rng.uniform(size=(600, 600))
+fail_count += int(not np.array_equal(prob._symmetrize_inplace(J.copy()), 0.5 * (J + J.T)))
+for n in [1, 2, 3, 600]:
+    w = rng.uniform(size=n)
+    R = np.zeros((n, n))
+    for d in range(n):
+        R[d, (d+1) % n] += w[d]
+    fail_count += int(not np.array_equal(prob.RingCouplingMatrix(w).toarray(), 0.5 * (R + R.T)))
+cost_coefficients = prob.generate_problem_quadratic_antiferromagnetic_two_objectives(np.asarray([2]*600), seed)
+fail_count += int(not np.array_equal(cost_coefficients[0][0], cost_coefficients[0][0].T))
+fail_count += int(np.count_nonzero(cost_coefficients[1][0] - np.diag(np.diag(cost_coefficients[1][0]))) != 0)
+
+
+# ################################
+# exact hypervolume must agree with counting the dominated cells of the grid spanned by all coordinates
+def _grid_hypervolume(points, reference_point):
+    axes = [np.unique(np.append(points[:, k], reference_point[k])) for k in range(len(reference_point))]
+    volume = 0.
+    for cell in itertools.product(*[range(len(axis) - 1) for axis in axes]):
+        lower = np.asarray([axis[c] for axis, c in zip(axes, cell)])
+        if np.any(np.all(points <= lower, axis=1)):
+            volume += np.prod([axis[c+1] - axis[c] for axis, c in zip(axes, cell)])
+    return volume
+
+for num_objs in [1, 2, 3, 4, 5]:
+    for _ in range(3):
+        points = rng.randint(0, 6, size=(9, num_objs)) / 5. - 0.1
+        fail_count += test_val(hypervolume.hypervolume(points, np.ones(num_objs)), _grid_hypervolume(points, np.ones(num_objs)))
+
+qudits = np.asarray([3]*5)
+for problem_name in ['problem_FM_AFM_two_objs', 'problem_FM_AFM_three_objs', 'problem_quadratic_five_objs']:
+    instance = prob.get_problem_instance(problem_name, qudits, seed)
+    front, _ = pareto.enumerate_pareto_front(instance.cost_coefficients, qudits)
+    all_energies = instance.enumerate_all_states(include_configs=False)
+    fail_count += test_val(hypervolume.problem_hypervolume(all_energies, problem_name), hypervolume.hypervolume(front, instance.reference_point))
+    fail_count += int(hypervolume.problem_hypervolume(front, problem_name) <= 0.)
+fail_count += int(hypervolume.hypervolume(np.empty((0, 3)), np.ones(3)) != 0.)
+
+# ################################
+# incremental archive: hypervolume, exclusive contributions and improvements must agree with recomputing the hypervolume
+for num_objs in [2, 3, 5]:
+    reference_point = np.ones(num_objs)
+    points = rng.uniform(-0.1, 1.1, size=(30, num_objs))
+    points[:, 0] = 1. - np.sum(points[:, 1:], axis=1) / (num_objs - 1)
+    archive = hypervolume.HypervolumeArchive(reference_point)
+    improvements = archive.add(points)
+    fail_count += test_val(archive.hypervolume, hypervolume.hypervolume(points, reference_point))
+    fail_count += test_val(np.sum(improvements), archive.hypervolume)
+    for i in range(len(archive)):
+        fail_count += test_val(archive.contributions[i], archive.hypervolume - hypervolume.hypervolume(np.delete(archive.points, i, axis=0), reference_point))
+    candidates = rng.uniform(-0.1, 1.1, size=(10, num_objs))
+    for b, improvement in enumerate(archive.improvements(candidates)):
+        fail_count += test_val(improvement, hypervolume.hypervolume(np.vstack((archive.points, candidates[b])), reference_point) - archive.hypervolume)
+    fail_count += int(archive.add(archive.points[:1])[0] != 0.)
+# points which dominate members: the freed regions are exclusive to the new point
+for num_objs in [2, 3, 4]:
+    reference_point = np.ones(num_objs)
+    archive = hypervolume.HypervolumeArchive(reference_point, [0.5 * np.ones(num_objs)])
+    dominating = 0.5 * np.ones(num_objs)
+    dominating[0] = 0.25
+    archive.add(dominating)
+    fail_count += test_val(archive.contributions[0], 0.5**num_objs * 1.5)
+    for _ in range(40):
+        archive.add(rng.uniform(0., 1., size=(1, num_objs))**rng.randint(1, 4))
+        brute_force = [archive.hypervolume - hypervolume.hypervolume(np.delete(archive.points, i, axis=0), reference_point) for i in range(len(archive))]
+        fail_count += int(np.max(np.abs(archive.contributions - brute_force)) > 1.e-9)
+        fail_count += test_val(archive.hypervolume, hypervolume.hypervolume(archive.points, reference_point))
+# a few hundred insertions must stay far below recomputing all contributions after every insertion
+for num_objs, num_points, max_seconds in [(2, 500, 1.), (3, 200, 5.)]:
+    reference_point = np.ones(num_objs)
+    points = rng.uniform(0., 1., size=(num_points, num_objs))
+    points[:, 0] = 1. - 0.999 * np.sum(points[:, 1:], axis=1) / (num_objs - 1)
+    start_time = time.perf_counter()
+    archive = hypervolume.HypervolumeArchive(reference_point, points)
+    contributions = archive.contributions
+    fail_count += int(time.perf_counter() - start_time > max_seconds or len(archive) != num_points)
+    fail_count += test_val(archive.hypervolume, hypervolume.hypervolume(points, reference_point))
+    for i in range(0, num_points, 50):
+        fail_count += test_val(contributions[i], archive.hypervolume - hypervolume.hypervolume(np.delete(archive.points, i, axis=0), reference_point))
+
+# ################################
+# exact objective bounds must agree with the extremes of the full enumeration
+for qudits in [np.asarray([2]*10), np.asarray([3]*6), np.asarray([5]*4)]:
+    for generator in generators:
+        cost_coefficients = generator(qudits, seed)
+        all_energies = prob.enumerate_all_states(cost_coefficients, qudits, include_configs=False)
+        for k, (minimum, argmin, maximum, argmax) in enumerate(bounds.objective_bounds(cost_coefficients, qudits)):
+            fail_count += test_val(minimum, np.min(all_energies[:, k]))
+            fail_count += test_val(maximum, np.max(all_energies[:, k]))
+            fail_count += test_val(prob.calculate_cost_functions_batched(argmin, cost_coefficients)[0, k], minimum)
+            fail_count += test_val(prob.calculate_cost_functions_batched(argmax, cost_coefficients)[0, k], maximum)
+structured = bounds.objective_bounds(prob.generate_problem_quadratic_five_objectives(np.asarray([3]*6), seed, structured=True), np.asarray([3]*6))
+dense = bounds.objective_bounds(prob.generate_problem_quadratic_five_objectives(np.asarray([3]*6), seed), np.asarray([3]*6))
+for k in range(5):
+    fail_count += test_val(structured[k][0], dense[k][0]) + test_val(structured[k][2], dense[k][2])
+
+# ################################
+# diagonal Hamiltonians must agree with the enumeration in state vector order
+for (qudits, x) in qudits_x_pairs:
+    for generator in generators:
+        cost_coefficients = generator(qudits, seed)
+        all_energies = prob.enumerate_all_states(cost_coefficients, qudits, include_configs=False)
+        diagonals = hamiltonian.objective_diagonals(cost_coefficients, qudits)
+        fail_count += int(np.max(np.abs(diagonals.T - all_energies)) > 1.e-12)
+        out = np.empty(diagonals.shape, dtype=np.float32)
+        fail_count += int(hamiltonian.objective_diagonals(cost_coefficients, qudits, out=out) is not out)
+        fail_count += int(np.max(np.abs(out.T - all_energies)) > 1.e-5)
+        # little endian: the first qudit is the least significant digit of the state index
+        little_endian_index = np.ravel_multi_index(tuple(x[::-1]), tuple(qudits[::-1]))
+        expected = prob.calculate_cost_functions_batched(x, cost_coefficients)[0]
+        for k in range(len(cost_coefficients)):
+            fail_count += test_val(hamiltonian.objective_diagonals(cost_coefficients, qudits, little_endian=True)[k, little_endian_index], expected[k])
+
+        probabilities = rng.uniform(size=(3, len(all_energies)))
+        probabilities /= np.sum(probabilities, axis=1, keepdims=True)
+        amplitudes = np.sqrt(probabilities) * np.exp(1.j * rng.uniform(0., 2. * np.pi, size=probabilities.shape))
+        fail_count += int(np.max(np.abs(hamiltonian.expectation_values(diagonals, amplitudes, chunk_size=2) - probabilities @ all_energies)) > 1.e-12)
+        fail_count += int(np.max(np.abs(hamiltonian.expectation_values(diagonals, probabilities, probabilities=True) - probabilities @ all_energies)) > 1.e-12)
+
+# ################################
+# float32 mode: single-precision coefficients and results within the a priori error bound of the float64 path
+for (qudits, x) in qudits_x_pairs:
+    for generator in generators:
+        cost_coefficients = generator(qudits, seed)
+        single = generator(qudits, seed, dtype=np.float32)
+        fail_count += int(prob.coefficient_dtype(single) != np.float32 or prob.coefficient_dtype(cost_coefficients) != np.float64)
+        error_bound = prob.reduced_precision_error_bound(cost_coefficients, qudits)
+        all_energies = prob.enumerate_all_states(cost_coefficients, qudits, include_configs=False)
+        for method in ['block', 'gray']:
+            single_energies = prob.enumerate_all_states(single, qudits, include_configs=False, method=method)
+            fail_count += int(single_energies.dtype != np.float32)
+            fail_count += int(np.any(np.max(np.abs(single_energies - all_energies), axis=0) > error_bound))
+            # measured worst case of the normalized benchmark problems is below 1e-6 (see README)
+            fail_count += int(np.max(np.abs(single_energies - all_energies)) > 1.e-6)
+single = prob.generate_problem_quadratic_five_objectives(np.asarray([3]*8), seed, structured=True, dtype=np.float32)
+fail_count += int(prob.calculate_cost_functions_batched(np.asarray([[2]*8]), single).dtype != np.float32)
+
+# ################################
+# scalarizations for many weights must agree with scalarizing the objectives weight by weight
+qudits = np.asarray([3]*6)
+for problem_name in ['problem_linear_corr-0.5', 'problem_FM_AFM_two_objs', 'problem_FM_AFM_three_objs', 'problem_quadratic_five_objs']:
+    instance = prob.get_problem_instance(problem_name, qudits, seed)
+    weights = rng.dirichlet(np.ones(instance.num_objs), size=20)
+    ideal_point = -0.1 * np.ones(instance.num_objs)
+    all_energies = instance.enumerate_all_states(include_configs=False)
+    X = prob._configs_from_indices(np.arange(0, len(all_energies), 37), qudits)
+    weighted_sums, chebyshev = scalarization.scalarized_objectives(X, instance, weights, ideal_point=ideal_point, rho=0.05)
+    folded = scalarization.weighted_sum_coefficients(instance.cost_coefficients, weights)
+    for i in range(0, len(X), 5):
+        objectives = instance.evaluate(X[i])
+        for w in range(len(weights)):
+            fail_count += test_val(weighted_sums[i, w], np.dot(weights[w], objectives))
+            fail_count += test_val(chebyshev[i, w], np.max(weights[w] * (objectives - ideal_point)) + 0.05 * np.sum(weights[w] * (objectives - ideal_point)))
+            fail_count += test_val(prob.calculate_cost_functions_batched(X[i], [folded[w]])[0, 0], weighted_sums[i, w])
+    all_weighted_sums, all_chebyshev = scalarization.scalarize(all_energies, weights, ideal_point=ideal_point, rho=0.05)
+    ws_minima, ws_indices, cheb_minima, cheb_indices = scalarization.optimal_scalarizations(instance, weights, ideal_point=ideal_point, rho=0.05, chunk_size=100)
+    fail_count += int(not np.array_equal(ws_minima, np.min(all_weighted_sums, axis=0)) or not np.array_equal(cheb_minima, np.min(all_chebyshev, axis=0)))
+    fail_count += int(not np.array_equal(all_weighted_sums[ws_indices, np.arange(len(weights))], ws_minima))
+    fail_count += int(not np.array_equal(all_chebyshev[cheb_indices, np.arange(len(weights))], cheb_minima))
+    minima, configs = scalarization.weighted_sum_optima(instance, weights)
+    fail_count += int(np.max(np.abs(minima - ws_minima)) > 1.e-12)
+# structured couplings stay compact in the weighted sum unless objectives with different structures have a nonzero weight
+qudits = np.asarray([3]*6)
+structured = prob.generate_problem_quadratic_five_objectives(qudits, seed, structured=True)
+X = rng.randint(0, 3, size=(20, len(qudits)))
+for weights, coupling_type in [([0.2, 0.3, 0., 0.1, 0.4], prob.RingCouplingMatrix), ([0., 0., 1., 0., 0.], prob.DiagonalCouplingMatrix),
+                               ([0.2, 0.2, 0.2, 0.2, 0.2], np.ndarray)]:
+    folded = scalarization.weighted_sum_coefficients(structured, weights)
+    fail_count += int(type(folded[0][0]) is not coupling_type)
+    fail_count += int(np.max(np.abs(prob.calculate_cost_functions_batched(X, folded)[:, 0] - prob.calculate_cost_functions_batched(X, structured) @ np.asarray(weights))) > 1.e-12)
+
+# ################################
+# statistics from measurement counts must agree with evaluating every shot
+instance = prob.get_problem_instance('problem_quadratic_five_objs', np.asarray([3]*6), seed)
+shot_indices = rng.zipf(1.5, size=5000) % 3**6
+shot_energies = instance.evaluate_batched(prob._configs_from_indices(shot_indices, instance.qudits))
+measured, shots = np.unique(shot_indices, return_counts=True)
+counts_dict = {''.join(str(v) for v in config): int(n) for config, n in zip(prob._configs_from_indices(measured, instance.qudits), shots)}
+counts_dict_little_endian = {''.join(str(v) for v in config[::-1]): int(n) for config, n in zip(prob._configs_from_indices(measured, instance.qudits), shots)}
+for statistics in [counts.count_statistics(instance, counts_dict, alpha=0.2),
+                   counts.count_statistics(instance, counts_dict_little_endian, alpha=0.2, little_endian=True),
+                   counts.count_statistics(instance.cost_coefficients, (shot_indices, np.ones(len(shot_indices))), instance.qudits, alpha=0.2)]:
+    fail_count += int(statistics['num_unique'] != len(measured) or statistics['num_shots'] != len(shot_indices))
+    fail_count += int(np.max(np.abs(statistics['mean'] - np.mean(shot_energies, axis=0))) > 1.e-12)
+    fail_count += int(np.max(np.abs(statistics['variance'] - np.var(shot_energies, axis=0))) > 1.e-12)
+    fail_count += int(np.max(np.abs(statistics['cvar'] - np.mean(np.sort(shot_energies, axis=0)[:1000], axis=0))) > 1.e-12)
+fail_count += int(np.max(np.abs(counts.count_statistics(instance, counts_dict, alpha=1.)['cvar'] - np.mean(shot_energies, axis=0))) > 1.e-12)
+for alpha in [0., -0.5, 1.5]:
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            counts.count_statistics(instance, counts_dict, alpha=alpha)
+        fail_count += 1
+    except SystemExit as e:
+        fail_count += int(e.code != 8)
+
+# ################################
+# benchmark suite: JSON round trip and slowdown detection
+benchmark_results = benchmark.run_benchmarks([[2]*4], [], [[2]*50], ['problem_FM_AFM_two_objs'], repeats=1, num_samples=10, log=lambda msg: None)
+fail_count += int(sorted(r['group'] for r in benchmark_results) != ['enumerate', 'evaluate_batched', 'evaluate_single', 'generate', 'generate'])
+with tempfile.TemporaryDirectory() as tmpdir:
+    benchmark.write_results(os.path.join(tmpdir, 'old.json'), benchmark_results)
+    old = benchmark.read_results(os.path.join(tmpdir, 'old.json'))
+fail_count += int('numpy' not in old['metadata'] or old['results'] != benchmark_results)
+new = {'metadata': old['metadata'], 'results': [dict(r, median=r['median'] * (1.5 if r['group'] == 'enumerate' else 1.)) for r in old['results']]}
+fail_count += int([name for name, _, _, _, slower in benchmark.compare_results(old, new, tolerance=0.2) if slower] != ['enumerate/problem_FM_AFM_two_objs/2x4'])
+
+# ################################
+# instrumentation: evaluation counts per instance and objective, stage times and merged worker reports
+instance = prob.get_problem_instance('problem_FM_AFM_three_objs', np.asarray([2]*6), seed)
+with instrumentation.instrumented() as instr:
+    instance.evaluate(np.zeros(6, dtype=int))
+    instance.evaluate_batched(np.zeros((5, 6), dtype=int))
+    instance.enumerate_all_states(method='gray')
+    instr.counted_objective_functions(instance)[1](np.zeros(6, dtype=int))
+    instance.objective_functions[2](np.zeros(6, dtype=int))
+    prob.calculate_cost_functions_batched(np.zeros((4, 6), dtype=int), instance.cost_coefficients)
+fail_count += int(prob.get_instrumentation() is not None)
+instance.objective_functions[2](np.zeros(6, dtype=int))
+report = instr.report()
+fail_count += int(report['counts'] != [{'instance': instance.instrumentation_key, 'evaluations_per_objective': [70, 71, 71]},
+                                       {'instance': None, 'evaluations_per_objective': [4, 4, 4]}])
+fail_count += int(report['num_evaluations'] != 76 or report['stage_calls']['evaluate'] != 5)
+with tempfile.TemporaryDirectory() as tmpdir:
+    instr = instrumentation.Instrumentation()
+    pipeline.run_pipeline(tmpdir, ['problem_FM_AFM_two_objs'], [[2]*5, [3]*3], [0], workers=0, log=lambda msg: None, instrumentation=instr)
+    merged = instrumentation.Instrumentation()
+    merged.merge(instr.report())
+    merged.merge(instr.report())
+report = merged.report()
+fail_count += int(instr.report()['expected_evaluations'] != 59 or report['num_evaluations'] != 2*59)
+fail_count += int(sorted(sum(entry['evaluations_per_objective']) for entry in report['counts']) != [2*2*27, 2*2*32])
+fail_count += int(any(report['stage_calls'][stage] == 0 for stage in instrumentation.STAGES))
+
+# ################################
+# evaluation cache: same values as the direct evaluation, only distinct misses are evaluated, least recently used entries are evicted
+instance = prob.get_problem_instance('problem_quadratic_five_objs', np.asarray([3]*7), seed)
+cache = evaluation_cache.EvaluationCache(instance, max_size=50)
+sample_pool = rng.randint(0, 3, size=(80, 7))
+for _ in range(10):
+    X = sample_pool[rng.randint(0, 80, size=200)]
+    fail_count += int(np.max(np.abs(cache.evaluate_batched(X) - instance.evaluate_batched(X))) > 1.e-12)
+    fail_count += int(np.max(np.abs(cache.evaluate(X[0]) - instance.evaluate(X[0]))) > 1.e-12)
+statistics = cache.statistics()
+fail_count += int(statistics['hits'] + statistics['misses'] != 10*201 or statistics['size'] != 50 or statistics['evictions'] != statistics['misses'] - 50)
+cache = evaluation_cache.EvaluationCache(instance.cost_coefficients, instance.qudits, max_size=2)
+with instrumentation.instrumented() as instr:
+    cache.evaluate_batched(sample_pool[[0, 1, 0, 1]])
+    cache.evaluate(sample_pool[0])
+    cache.evaluate_batched(sample_pool[[2, 1]])
+fail_count += int(instr.report()['num_evaluations'] != 3 or cache.statistics()['hits'] != 4)
+fail_count += int(sorted(cache._slots) != sorted(cache.keys(sample_pool[[1, 2]]).tolist()))
+cache = evaluation_cache.EvaluationCache(prob.get_problem_instance('problem_FM_AFM_two_objs', np.asarray([2]*70), seed), max_size=8)
+X = rng.randint(0, 2, size=(6, 70))
+fail_count += int(np.max(np.abs(cache.evaluate_batched(np.r_[X, X]) - cache.evaluate_batched(X[[0, 1, 2, 3, 4, 5]*2]))) > 0. or cache.misses != 6)
+
+# ################################
+# mixed-radix codec: same digits as np.unravel_index (msb) or of the reversed qudits (lsb), smallest dtypes
+for qudits in [np.asarray([2]*9), np.asarray([3, 5, 2, 7]), np.asarray([17]*3)]:
+    indices = np.arange(int(np.prod(qudits)))
+    for order, reference in [('msb', np.array(np.unravel_index(indices, tuple(qudits))).T),
+                             ('lsb', np.array(np.unravel_index(indices, tuple(qudits[::-1]))).T[:, ::-1])]:
+        codec = prob.MixedRadixCodec(qudits, order)
+        configs = codec.decode(indices)
+        fail_count += int(not np.array_equal(configs, reference) or configs.dtype != np.uint8)
+        fail_count += int(not np.array_equal(codec.encode(reference), indices) or codec.encode(reference).dtype != codec.index_dtype)
+        fail_count += int(not np.array_equal(codec.decode(indices[-1]), reference[-1]))
+fail_count += int([prob.MixedRadixCodec(qudits).index_dtype for qudits in [[2]*8, [2]*9, [3]*20, [2]*64]] != [np.uint8, np.uint16, np.uint32, np.uint64])
+codec = prob.MixedRadixCodec([2]*64, 'lsb')
+fail_count += int(codec.encode(codec.decode(np.uint64(2**64 - 2))) != np.uint64(2**64 - 2) or codec.decode(np.uint64(1))[0] != 1)
+
+# ################################
+# incremental Pareto archive: same members as filtering everything seen so far, also with identical vectors
+for num_objs in [2, 3, 5]:
+    archive = pareto.ParetoArchive(num_objs, max_leaf_size=8)
+    seen_objectives = np.empty((0, num_objs))
+    for batch in range(25):
+        batch_objectives = rng.randint(0, 6, size=(rng.randint(1, 40), num_objs)).astype(float) if batch % 2 == 0 else rng.rand(30, num_objs)
+        batch_indices = np.arange(len(seen_objectives), len(seen_objectives) + len(batch_objectives))
+        accepted = archive.add(batch_objectives, batch_indices)
+        seen_objectives = np.concatenate((seen_objectives, batch_objectives))
+        front_objectives, front_indices = archive.front()
+        fail_count += int(not np.array_equal(front_indices, np.flatnonzero(pareto.nondominated_mask(seen_objectives))))
+        fail_count += int(not np.array_equal(front_objectives, seen_objectives[front_indices]) or len(archive) != len(front_indices))
+        fail_count += int(not np.array_equal(accepted, np.isin(batch_indices, front_indices)))
+qudits = np.asarray([3]*10)
+instance = prob.get_problem_instance('problem_quadratic_five_objs', qudits, seed)
+codec = prob.MixedRadixCodec(qudits)
+archive = pareto.ParetoArchive(instance.num_objs, index_dtype=codec.index_dtype)
+X = rng.randint(0, 3, size=(3000, len(qudits)))
+for start in range(0, len(X), 500):
+    archive.add(instance.evaluate_batched(X[start:start+500]), codec.encode(X[start:start+500]))
+unique_indices = np.unique(codec.encode(X))
+fail_count += int(archive.indices.dtype != np.uint16)
+fail_count += int(not np.array_equal(np.unique(archive.indices), unique_indices[pareto.nondominated_mask(instance.evaluate_batched(codec.decode(unique_indices)))]))
+
+# ################################
+# on-disk coefficient cache: memory-mapped entries give the same objectives as generated instances and are used without a copy
+with tempfile.TemporaryDirectory() as tmpdir:
+    grid = {'problem_names': ['problem_linear_corr-0.5', 'problem_FM_AFM_three_objs'], 'qudits_configs': [[2]*6, [3]*4], 'seeds': [0, seed]}
+    fail_count += int(instance_cache.prefetch(cache_dir=tmpdir, workers=0, log=lambda msg: None, **grid) != 8)
+    fail_count += int(instance_cache.prefetch(cache_dir=tmpdir, workers=0, log=lambda msg: None, **grid) != 0)
+    for problem_name in ['problem_linear_corr-0.5', 'problem_FM_AFM_three_objs', 'problem_quadratic_five_objs']:
+        qudits = np.asarray([3]*4)
+        cached = instance_cache.cached_problem_instance(problem_name, qudits, seed, tmpdir)
+        generated = prob.ProblemInstance(problem_name, qudits, seed)
+        X = rng.randint(0, 3, size=(30, len(qudits)))
+        fail_count += int(not np.array_equal(cached.evaluate_batched(X), generated.evaluate_batched(X)))
+        fail_count += int(any(f(X[0]) != g(X[0]) for f, g in zip(cached.objective_functions, generated.objective_functions)))
+        fail_count += int(not all(isinstance(a, np.memmap) for a in cached._prepared[:2] if a is not None))
+    fail_count += int(len(os.listdir(tmpdir)) != 9 or instance_cache.load_coefficients(tmpdir, 'problem_FM_AFM_three_objs', [3]*4, 99) is not None)
+    fail_count += int(instance_cache.instance_key('problem_FM_AFM_three_objs', [3]*4, seed) == instance_cache.instance_key('problem_FM_AFM_three_objs', [3]*4, seed, version='0'))
+    # temporary directories of killed writers are removed by the next prefetch once they are old, fresh ones are kept
+    stale = instance_cache.entry_path(tmpdir, 'problem_FM_AFM_three_objs', [3]*4, 99) + '.tmp12345'
+    fresh = tempfile.mkdtemp(prefix='0123abcd.tmp', dir=tmpdir)
+    os.makedirs(stale)
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+    instance_cache.prefetch(cache_dir=tmpdir, workers=0, log=lambda msg: None, **grid)
+    fail_count += int(os.path.exists(stale) or not os.path.exists(fresh) or any('.tmp' in name for name in os.listdir(tmpdir) if name != os.path.basename(fresh)))
+
+# ################################
+# evaluation server in this process: concurrent requests are evaluated in one batch and give the objectives of the instance
+qudits = np.asarray([3]*8)
+instance = prob.get_problem_instance('problem_FM_AFM_two_objs', qudits, seed)
+request_configs = [rng.randint(0, 3, size=(rng.randint(1, 50), len(qudits))) for _ in range(16)]
+
+
+async def _concurrent_requests(max_delay):
+    server = evaluation_server.EvaluationServer(max_delay=max_delay)
+    address = await server.start()
+    clients = [await evaluation_server.AsyncEvaluationClient(address).connect() for _ in request_configs]
+    results = await asyncio.gather(*[client.evaluate('problem_FM_AFM_two_objs', qudits, seed, X) for client, X in zip(clients, request_configs)])
+    for client in clients:
+        await client.close()
+    await server.close()
+    return results, server.statistics
+
+results, statistics = asyncio.run(_concurrent_requests(0.01))
+fail_count += int(not all(np.allclose(result, instance.evaluate_batched(X)) for result, X in zip(results, request_configs)))
+fail_count += int(statistics['requests'] != len(request_configs) or statistics['batches'] >= len(request_configs))
+fail_count += int(statistics['rows'] != sum(len(X) for X in request_configs))
+server = evaluation_server.EvaluationServer()
+with evaluation_server.EvaluationClient(server.start_in_thread()) as client:
+    fail_count += int(not np.allclose(client.evaluate('problem_FM_AFM_two_objs', qudits, seed, request_configs[0]), instance.evaluate_batched(request_configs[0])))
+    fail_count += int(client.evaluate('problem_FM_AFM_two_objs', qudits, seed, request_configs[0][0]).shape != (1, 2))
+    # invalid configurations are rejected per request instead of being evaluated
+    request = {'problem_name': 'problem_FM_AFM_two_objs', 'qudits': [int(q) for q in qudits], 'seed': seed}
+    for X in [np.full((2, len(qudits)), 200, dtype=np.uint8), np.zeros((2, len(qudits))), np.zeros((2, 3), dtype=np.uint8)]:
+        fail_count += int(client._exchange(evaluation_server._encode_message(request, X))[0]['status'] != 'error')
+    fail_count += int(client._exchange(evaluation_server._encode_message(request, request_configs[0]))[0]['status'] != 'ok')
+server.stop_thread()
+
+
+async def _bad_requests():
+    # malformed messages and instances which cannot be generated get an error response, the connection and the server stay usable
+    server = evaluation_server.EvaluationServer()
+    address = await server.start()
+
+    async def _request(message):
+        reader, writer = await asyncio.open_connection(*address)
+        writer.write(message)
+        await writer.drain()
+        header_bytes, _ = await evaluation_server._read_message(reader)
+        writer.close()
+        return json.loads(header_bytes)['status']
+
+    def _raw(header_bytes):
+        return struct.pack('<I', len(header_bytes)) + header_bytes + struct.pack('<Q', 0)
+
+    heterogeneous = {'problem_name': 'problem_FM_AFM_two_objs', 'qudits': [2, 3, 3], 'seed': 0}
+    with contextlib.redirect_stdout(io.StringIO()):
+        statuses = await asyncio.gather(*[_request(evaluation_server._encode_message(heterogeneous, np.zeros((1, 3), dtype=np.uint8))) for _ in range(4)])
+    statuses += [await _request(_raw(header_bytes)) for header_bytes in [b'[1, 2]', b'{"qudits": 5}', b'not json']]
+    statuses += [await _request(evaluation_server._encode_message({'qudits': [2]}, np.zeros((1, 1), dtype=np.uint8)))]
+    valid = {'problem_name': 'problem_FM_AFM_two_objs', 'qudits': [int(q) for q in qudits], 'seed': seed}
+    statuses += [await _request(evaluation_server._encode_message(valid, request_configs[0]))]
+    await server.close()
+    return statuses
+
+fail_count += int(asyncio.run(_bad_requests()) != ['error'] * 8 + ['ok'])
+
+# ################################
+# shared memory: workers fill one shared table from the shared coefficients, the blocks are unlinked when the owner is closed
+for problem_name, qudits in [('problem_quadratic_five_objs', np.asarray([3]*6)), ('problem_linear_corr-0.5', np.asarray([2]*9))]:
+    instance = prob.get_problem_instance(problem_name, qudits, seed)
+    with shared_memory.SharedBlocks() as blocks:
+        coefficients = blocks.share_coefficients(instance.cost_coefficients)
+        shared_instance = coefficients.problem_instance(problem_name, qudits, seed)
+        X = rng.randint(0, 2, size=(40, len(qudits)))
+        fail_count += int(not np.array_equal(shared_instance.evaluate_batched(X), instance.evaluate_batched(X)))
+        fail_count += int(not np.shares_memory(shared_instance._prepared[1], coefficients.c.attach()))
+        for workers in [0, 2]:
+            table = shared_memory.enumerate_all_states_parallel(blocks, coefficients, qudits, workers=workers, chunk_size=100)
+            fail_count += int(not np.allclose(table.attach(), instance.enumerate_all_states()))
+        del shared_instance
+        names = list(blocks.names)
+    fail_count += int(any(name in shared_memory._segments for name in names) or any(os.path.exists(f'/dev/shm/{name}') for name in names))
+
 if fail_count != 0:
     print (f'ERROR: {fail_count} tests failed!')
     sys.exit(fail_count)